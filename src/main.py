@@ -6,6 +6,13 @@ import time
 
 
 def main(arguments):
+    # "--seed <number>" can go anywhere on the command line and makes a sim replayable
+    seed = None
+    if "--seed" in arguments:
+        i = arguments.index("--seed")
+        seed = int(arguments[i + 1])
+        arguments = arguments[:i] + arguments[i + 2 :]
+
     if len(arguments) < 3 or len(arguments) > 7:
         print("Incorrect usage. Please see `README.md` for proper usage.")
         exit()
@@ -53,7 +60,7 @@ def main(arguments):
         # if 'match' in arguments:
         #    match_lineup_input_to_field_size = True
         sim = nfl_showdown_simulator.NFL_Showdown_Simulator(
-            site, field_size, num_iterations, use_contest_data, use_file_upload
+            site, field_size, num_iterations, use_contest_data, use_file_upload, seed
         )
         sim.generate_field_lineups()
         sim.run_tournament_simulation()
@@ -81,7 +88,7 @@ def main(arguments):
         # if 'match' in arguments:
         #    match_lineup_input_to_field_size = True
         sim = nfl_gpp_simulator.NFL_GPP_Simulator(
-            site, field_size, num_iterations, use_contest_data, use_file_upload
+            site, field_size, num_iterations, use_contest_data, use_file_upload, seed
         )
         sim.generate_field_lineups()
         sim.run_tournament_simulation()
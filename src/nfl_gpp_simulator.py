@@ -13,6 +13,7 @@ import statistics
 # import fuzzywuzzy
 import itertools
 import collections
+import contextlib
 import re
 from scipy.stats import norm, kendalltau, multivariate_normal, gamma
 import matplotlib.pyplot as plt
@@ -20,6 +21,23 @@ import seaborn as sns
 from collections import Counter
 from numba import jit
 import datetime
+from nfl_sim_utils import (
+    POSITION_CORRELATIONS,
+    SAME_POSITION_CORRELATIONS,
+    score_lineups,
+    tournament_results,
+    load_payout_table,
+    iteration_block_size,
+    build_correlation_matrix,
+    covariance_cache_key,
+    covariance_factor,
+    load_covariance_factor,
+    prune_covariance_cache,
+    sample_from_factor,
+    player_totals,
+    slot_totals,
+    write_results,
+)
 
 @jit(nopython=True)
 def salary_boost(salary, max_salary):
@@ -37,7 +55,9 @@ def salary_boost(salary, max_salary):
 class NFL_GPP_Simulator:
     config = None
     player_dict = {}
-    field_lineups = {}
+    field_lineups = None
+    field_counts = None
+    field_types = None
     stacks_dict = {}
     gen_lineup_list = []
     roster_construction = []
@@ -49,7 +69,7 @@ class NFL_GPP_Simulator:
     team_list = []
     num_iterations = None
     site = None
-    payout_structure = {}
+    payout_cumsum = None
     use_contest_data = False
     entry_fee = None
     use_lineup_input = None
@@ -60,8 +80,7 @@ class NFL_GPP_Simulator:
     max_pct_off_optimal = 0.4
     teams_dict = collections.defaultdict(list)  # Initialize teams_dict
     correlation_rules = {}
-    seen_lineups = {}
-    seen_lineups_ix = {}
+    field_data = None
     position_map = {
         0: ["DST"],
         1: ["QB"],
@@ -81,11 +100,17 @@ class NFL_GPP_Simulator:
         num_iterations,
         use_contest_data,
         use_lineup_input,
+        seed=None,
     ):
         self.site = site
         self.use_lineup_input = use_lineup_input
         self.load_config()
         self.load_rules()
+        # field generation and game sampling draw from their own children of one seed
+        # sequence, so a run replays with the same seed however the work is split up
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.field_seed, self.sim_seed = self.seed_sequence.spawn(2)
+        print("Random seed: " + str(self.seed_sequence.entropy))
 
         projection_path = os.path.join(
             os.path.dirname(__file__),
@@ -146,6 +171,11 @@ class NFL_GPP_Simulator:
             ]
             self.salary = 60000
 
+        # cleaned covariance matrices and their factors, one file per game
+        self.covariance_cache_dir = os.path.join(
+            os.path.dirname(__file__), "../{}_data/covariance_cache".format(site)
+        )
+
         self.use_contest_data = use_contest_data
         if use_contest_data:
             contest_path = os.path.join(
@@ -156,11 +186,22 @@ class NFL_GPP_Simulator:
             print("Contest payout structure loaded.")
         else:
             self.field_size = int(field_size)
-            self.payout_structure = {0: 0.0}
+            # first place is the only place and pays nothing
+            self.payout_cumsum = np.zeros(2)
             self.entry_fee = 0
 
         # self.adjust_default_stdev()
         self.assertPlayerDict()
+        # past this point players are referred to by their position in player_dict
+        self.player_list = list(self.player_dict.values())
+        self.player_ids = np.array([p["ID"] for p in self.player_list])
+        # ID -> position in player_list, every lookup by ID goes through it
+        self.player_index = {p["ID"]: i for i, p in enumerate(self.player_list)}
+        # the field is one row of player indices per unique lineup (slot order
+        # DST,QB,RB,RB,WR,WR,WR,TE,FLEX) with how many entries use it
+        self.field_lineups = np.empty((0, 9), dtype=np.int32)
+        self.field_counts = np.empty(0, dtype=np.int64)
+        self.field_types = np.empty(0, dtype=str)
         self.num_iterations = int(num_iterations)
         self.get_optimal()
         if self.use_lineup_input:
@@ -185,6 +226,36 @@ class NFL_GPP_Simulator:
         self.overlap_limit = float(self.config["num_players_vs_def"])
         self.pct_field_double_stacks = float(self.config["pct_field_double_stacks"])
         self.correlation_rules = self.config["custom_correlations"]
+        self.ranking_mode = (
+            self.config["ranking_mode"] if "ranking_mode" in self.config else "partial"
+        )
+        self.field_chunk_size = (
+            int(self.config["field_chunk_size"])
+            if "field_chunk_size" in self.config
+            else 0
+        )
+        self.sim_memory_budget_mb = (
+            int(self.config["sim_memory_budget_mb"])
+            if "sim_memory_budget_mb" in self.config
+            else 0
+        )
+        self.output_format = (
+            self.config["sim_output_format"]
+            if "sim_output_format" in self.config
+            else "csv"
+        )
+        self.parallel_sampling_threshold = (
+            int(self.config["parallel_sampling_threshold"])
+            if "parallel_sampling_threshold" in self.config
+            else 50000000
+        )
+        # float16 halves the memory of the score arrays but above 128 points it can only
+        # tell scores 0.125 apart, so near ties at the top of the field become exact ties
+        self.score_precision = np.dtype(
+            self.config["score_precision"]
+            if "score_precision" in self.config
+            else "float32"
+        )
 
     def assertPlayerDict(self):
         for p, s in list(self.player_dict.items()):
@@ -535,34 +606,15 @@ class NFL_GPP_Simulator:
                 self.id_name_dict[str(row["id"])] = row[name_key]
 
     def load_contest_data(self, path):
-        with open(path, encoding="utf-8-sig") as file:
-            reader = csv.DictReader(self.lower_first(file))
-            for row in reader:
-                if self.field_size is None:
-                    self.field_size = int(row["field size"])
-                if self.entry_fee is None:
-                    self.entry_fee = float(row["entry fee"])
-                # multi-position payouts
-                if "-" in row["place"]:
-                    indices = row["place"].split("-")
-                    # print(indices)
-                    # have to add 1 to range to get it to generate value for everything
-                    for i in range(int(indices[0]), int(indices[1]) + 1):
-                        # print(i)
-                        # Where I'm from, we 0 index things. Thus, -1 since Payout starts at 1st place
-                        if i >= self.field_size:
-                            break
-                        self.payout_structure[i - 1] = float(
-                            row["payout"].split(".")[0].replace(",", "")
-                        )
-                # single-position payouts
-                else:
-                    if int(row["place"]) >= self.field_size:
-                        break
-                    self.payout_structure[int(row["place"]) - 1] = float(
-                        row["payout"].split(".")[0].replace(",", "")
-                    )
-        # print(self.payout_structure)
+        # compiled to a cumulative payout table once per contest file, later runs read
+        # the cached table from the payout_cache folder next to it
+        self.payout_cumsum, self.payout_brackets, contest = load_payout_table(
+            path, os.path.join(os.path.dirname(path), "payout_cache")
+        )
+        if self.field_size is None:
+            self.field_size = contest["field_size"]
+        if self.entry_fee is None:
+            self.entry_fee = contest["entry_fee"]
 
     def load_correlation_rules(self):
         if len(self.correlation_rules.keys()) > 0:
@@ -676,71 +728,8 @@ class NFL_GPP_Simulator:
                     ceil = fpts + stddev
                 if row["salary"]:
                     sal = int(row["salary"].replace(",", ""))
-                if pos == "QB":
-                    corr = {
-                        "QB": 1,
-                        "RB": 0.08,
-                        "WR": 0.62,
-                        "TE": 0.32,
-                        "DST": -0.09,
-                        "Opp QB": 0.24,
-                        "Opp RB": 0.04,
-                        "Opp WR": 0.19,
-                        "Opp TE": 0.1,
-                        "Opp DST": -0.41,
-                    }
-                elif pos == "RB":
-                    corr = {
-                        "QB": 0.08,
-                        "RB": 1,
-                        "WR": -0.09,
-                        "TE": -0.02,
-                        "DST": 0.07,
-                        "Opp QB": 0.04,
-                        "Opp RB": -0.08,
-                        "Opp WR": 0.01,
-                        "Opp TE": 0.03,
-                        "Opp DST": -0.33,
-                    }
-                elif pos == "WR":
-                    corr = {
-                        "QB": 0.62,
-                        "RB": -0.09,
-                        "WR": 1,
-                        "TE": -0.07,
-                        "DST": -0.08,
-                        "Opp QB": 0.19,
-                        "Opp RB": 0.01,
-                        "Opp WR": 0.16,
-                        "Opp TE": 0.08,
-                        "Opp DST": -0.22,
-                    }
-                elif pos == "TE":
-                    corr = {
-                        "QB": 0.32,
-                        "RB": -0.02,
-                        "WR": -0.07,
-                        "TE": 1,
-                        "DST": -0.08,
-                        "Opp QB": 0.1,
-                        "Opp RB": 0.03,
-                        "Opp WR": 0.08,
-                        "Opp TE": 0,
-                        "Opp DST": -0.14,
-                    }
-                elif pos == "DST":
-                    corr = {
-                        "QB": -0.09,
-                        "RB": 0.07,
-                        "WR": -0.08,
-                        "TE": -0.08,
-                        "DST": 1,
-                        "Opp QB": -0.41,
-                        "Opp RB": -0.33,
-                        "Opp WR": -0.22,
-                        "Opp TE": -0.14,
-                        "Opp DST": -0.27,
-                    }
+                if pos in POSITION_CORRELATIONS:
+                    corr = dict(POSITION_CORRELATIONS[pos])
                 team = row["team"]
                 if team == "LA":
                     team = "LAR"
@@ -823,7 +812,7 @@ class NFL_GPP_Simulator:
         with open(path) as file:
             reader = pd.read_csv(file)
             lineup = []
-            j = 0
+            rows = []
             for i, row in reader.iterrows():
                 # print(row)
                 if i == self.field_size:
@@ -832,20 +821,7 @@ class NFL_GPP_Simulator:
                 # storing if this lineup was made by an optimizer or with the generation process in this script
                 error = False
                 for l in lineup:
-                    ids = [self.player_dict[k]["ID"] for k in self.player_dict]
-                    if l not in ids:
-                        print("lineup {} is missing players {}".format(i, l))
-                        if l in self.id_name_dict:
-                            print(self.id_name_dict[l])
-                        error = True
-                if len(lineup) < 9:
-                    print("lineup {} is missing players".format(i))
-                    continue
-                # storing if this lineup was made by an optimizer or with the generation process in this script
-                error = False
-                for l in lineup:
-                    ids = [self.player_dict[k]["ID"] for k in self.player_dict]
-                    if l not in ids:
+                    if l not in self.player_index:
                         print("lineup {} is missing players {}".format(i, l))
                         if l in self.id_name_dict:
                             print(self.id_name_dict[l])
@@ -868,9 +844,6 @@ class NFL_GPP_Simulator:
                     ]
                     shuffled_lu = []
 
-                    id_to_player_dict = {
-                        v["ID"]: v for k, v in self.player_dict.items()
-                    }
                     lineup_copy = lineup.copy()
                     position_counts = {
                         "DST": 0,
@@ -886,8 +859,8 @@ class NFL_GPP_Simulator:
                         for t in temp_roster_construction:
                             if position_counts[t] < temp_roster_construction.count(t):
                                 for l in lineup_copy:
-                                    player_info = id_to_player_dict.get(l)
-                                    if player_info and t in player_info["Position"]:
+                                    player_info = self.player_list[self.player_index[l]]
+                                    if t in player_info["Position"]:
                                         shuffled_lu.append(l)
                                         lineup_copy.remove(l)
                                         position_counts[t] += 1
@@ -896,716 +869,226 @@ class NFL_GPP_Simulator:
                                             break
                             if z == 9:
                                 break
-                    lineup_list = sorted(shuffled_lu)           
-                    lineup_set = frozenset(lineup_list)
+                    rows.append([self.player_index[l] for l in shuffled_lu])
+        if len(rows) > 0:
+            self.update_field_lineups(np.array(rows, dtype=np.int32), "opto")
+        print("loaded {} lineups".format(len(self.field_lineups)))
 
-                    # Keeping track of lineup duplication counts
-                    if lineup_set in self.seen_lineups:
-                        self.seen_lineups[lineup_set] += 1
-                    else:
-                        # Add to seen_lineups and seen_lineups_ix
-                        self.seen_lineups[lineup_set] = 1
-                        self.seen_lineups_ix[lineup_set] = j
-                        self.field_lineups[j] = {
-                            "Lineup": shuffled_lu,
-                            "Wins": 0,
-                            "Top1Percent": 0,
-                            "ROI": 0,
-                            "Cashes": 0,
-                            "Type": "opto",
-                            "Count" : 1
-                        }
-                        j += 1
-        print("loaded {} lineups".format(j))
-        #print(len(self.field_lineups))
+    @staticmethod
+    def sample_rows(rng, weights):
+        # one weighted draw per row via inverse cdf, -1 for rows with nothing to pick
+        cumulative = np.cumsum(weights, axis=1)
+        totals = cumulative[:, -1]
+        draws = rng.random(len(weights)) * totals
+        choices = (cumulative <= draws[:, None]).sum(axis=1)
+        choices[totals <= 0] = -1
+        return choices
 
     @staticmethod
-    def generate_lineups(
-        lu_num,
-        ids,
-        in_lineup,
+    def draw_lineup_batch(
+        rng,
+        team_stacks,
+        stack_lens,
         pos_matrix,
         ownership,
-        salary_floor,
-        salary_ceiling,
-        optimal_score,
         salaries,
         projections,
-        max_pct_off_optimal,
         teams,
         opponents,
-        team_stack,
-        stack_len,
-        overlap_limit,
-        max_stack_len,
         matchups,
-        num_players_in_roster,
-        site,
+        salary_floor,
+        salary_ceiling,
+        reasonable_projection,
+        reasonable_stack_projection,
+        overlap_limit,
+        max_players_per_team,
     ):
-        # new random seed for each lineup (without this there is a ton of dupes)
-        rng = np.random.Generator(np.random.PCG64())
-        lus = {}
-        # make sure nobody is already showing up in a lineup
-        if sum(in_lineup) != 0:
-            in_lineup.fill(0)
-        reject = True
-        iteration_count = 0
-        total_players = num_players_in_roster
-        issue = ""
-        complete = ""
+        # every row is a candidate lineup, every column a roster slot (DST first to avoid overlap)
+        num_rows = len(team_stacks)
+        num_players, num_slots = pos_matrix.shape
+        eligible = pos_matrix > 0
+        boost = salary_boost(salaries, salary_ceiling)
+        lineups = np.full((num_rows, num_slots), -1, dtype=np.int64)
+        in_lineup = np.zeros((num_rows, num_players), dtype=bool)
+        salary = np.zeros(num_rows)
+        proj = np.zeros(num_rows)
+        valid = np.ones(num_rows, dtype=bool)
+        stacked = team_stacks >= 0
+
+        def place(rows, choices, slots):
+            lineups[rows, slots] = choices
+            in_lineup[rows, choices] = True
+            salary[rows] += salaries[choices]
+            proj[rows] += projections[choices]
+
+        if stacked.any():
+            # qb is the first qb listed for the stack team
+            team_qb = np.full(max(teams.max(), opponents.max()) + 1, -1)
+            for p in np.nonzero(eligible[:, 1])[0][::-1]:
+                team_qb[teams[p]] = p
+            stack_qbs = np.where(stacked, team_qb[team_stacks], -1)
+            valid &= ~stacked | (stack_qbs >= 0)
+            rows = np.nonzero(stacked & valid)[0]
+            place(rows, stack_qbs[rows], 1)
+            # pass catchers from the stack team, drawn by ownership without replacement
+            pass_catchers = eligible[:, 4:8].any(axis=1)
+            for s in range(stack_lens[stacked].max()):
+                rows = np.nonzero(stacked & valid & (stack_lens > s))[0]
+                mask = (
+                    pass_catchers[None, :]
+                    & (teams[None, :] == team_stacks[rows, None])
+                    & ~in_lineup[rows]
+                )
+                choices = NFL_GPP_Simulator.sample_rows(
+                    rng, np.where(mask, ownership, 0)
+                )
+                rows, choices = rows[choices >= 0], choices[choices >= 0]
+                open_slots = eligible[choices] & (lineups[rows] < 0)
+                has_slot = open_slots.any(axis=1)
+                rows, choices = rows[has_slot], choices[has_slot]
+                place(rows, choices, open_slots[has_slot].argmax(axis=1))
+
+        def_opp = np.full(num_rows, -1)
+        players_opposing_def = np.zeros(num_rows, dtype=np.int64)
+        for slot in range(num_slots):
+            rows = np.nonzero(valid & (lineups[:, slot] < 0))[0]
+            if len(rows) == 0:
+                continue
+            mask = eligible[None, :, slot] & ~in_lineup[rows]
+            if slot == 0:
+                # no defense facing the stack team
+                mask &= opponents[None, :] != team_stacks[rows, None]
+                weights = np.where(mask, ownership, 0)
+            else:
+                remaining_salary = salary_ceiling - salary[rows]
+                mask &= salaries[None, :] <= remaining_salary[:, None]
+                if slot == num_slots - 1:
+                    mask &= salaries[None, :] + salary[rows, None] >= salary_floor
+                avoid_def = players_opposing_def[rows] >= overlap_limit
+                mask &= ~avoid_def[:, None] | (
+                    teams[None, :] != def_opp[rows, None]
+                )
+                boosted = avoid_def | (slot == num_slots - 1)
+                weights = np.where(mask, ownership, 0) * np.where(
+                    boosted[:, None], boost, 1
+                )
+            choices = NFL_GPP_Simulator.sample_rows(rng, weights)
+            valid[rows[choices < 0]] = False
+            rows, choices = rows[choices >= 0], choices[choices >= 0]
+            place(rows, choices, slot)
+            if slot == 0:
+                def_opp[rows] = opponents[choices]
+            else:
+                players_opposing_def[rows] += teams[choices] == def_opp[rows]
+
+        lineups[~valid] = 0
+        lineup_teams = teams[lineups]
+        lineup_matchups = matchups[lineups]
+        stack_count = (lineup_teams[:, 1:] == team_stacks[:, None]).sum(axis=1)
+        accepted = (
+            valid
+            & (salary >= salary_floor)
+            & (salary <= salary_ceiling)
+            & (lineup_matchups != lineup_matchups[:, :1]).any(axis=1)
+            & np.where(
+                stacked,
+                (proj >= reasonable_stack_projection) & (stack_count >= stack_lens),
+                proj >= reasonable_projection,
+            )
+        )
+        if max_players_per_team is not None:
+            team_counts = (lineup_teams[:, :, None] == lineup_teams[:, None, :]).sum(
+                axis=1
+            )
+            accepted &= team_counts.max(axis=1) <= max_players_per_team
+        return lineups, accepted
+
+    @staticmethod
+    def init_field_worker(field_data):
+        # player arrays are sent to each worker once instead of with every task
+        NFL_GPP_Simulator.field_data = field_data
+
+    @staticmethod
+    def generate_lineups(team_stacks, stack_lens, seed, batch_size=4096, max_rounds=100):
+        pos_matrix = NFL_GPP_Simulator.field_data["pos_matrix"]
+        ownership = NFL_GPP_Simulator.field_data["ownership"]
+        salary_floor = NFL_GPP_Simulator.field_data["salary_floor"]
+        salary_ceiling = NFL_GPP_Simulator.field_data["salary_ceiling"]
+        optimal_score = NFL_GPP_Simulator.field_data["optimal_score"]
+        salaries = NFL_GPP_Simulator.field_data["salaries"]
+        projections = NFL_GPP_Simulator.field_data["projections"]
+        max_pct_off_optimal = NFL_GPP_Simulator.field_data["max_pct_off_optimal"]
+        teams = NFL_GPP_Simulator.field_data["teams"]
+        opponents = NFL_GPP_Simulator.field_data["opponents"]
+        overlap_limit = NFL_GPP_Simulator.field_data["overlap_limit"]
+        matchups = NFL_GPP_Simulator.field_data["matchups"]
+        site = NFL_GPP_Simulator.field_data["site"]
+        team_names = NFL_GPP_Simulator.field_data["team_names"]
+        # each block gets its own child seed (without this there is a ton of dupes)
+        rng = np.random.default_rng(seed)
         reasonable_projection = optimal_score - (max_pct_off_optimal * optimal_score)
         reasonable_stack_projection = optimal_score - (
             (max_pct_off_optimal * 1.25) * optimal_score
         )
         max_players_per_team = 4 if site == "fd" else None
-        # reject_counters = {
-        #     "salary_too_low": 0,
-        #     "salary_too_high": 0,
-        #     "projection_too_low": 0,
-        #     "invalid_matchups": 0,
-        #     "stack_length_insufficient": 0,
-        # }
-        # print(lu_num, ' started',  team_stack, max_stack_len)
-        while reject:
-            iteration_count += 1
-            if team_stack == "":
-                salary = 0
-                proj = 0
-                if sum(in_lineup) != 0:
-                    in_lineup.fill(0)
-                lineup = []
-                player_teams = []
-                def_opps = []
-                players_opposing_def = 0
-                lineup_matchups = []
-                k = 0
-                for pos in pos_matrix.T:
-                    if k < 1:
-                        # check for players eligible for the position and make sure they arent in a lineup, returns a list of indices of available player
-                        valid_players = np.nonzero((pos > 0) & (in_lineup == 0))[0]
-                        # grab names of players eligible
-                        plyr_list = ids[valid_players]
-                        # create np array of probability of being seelcted based on ownership and who is eligible at the position
-                        prob_list = ownership[valid_players]
-                        prob_list = prob_list / prob_list.sum()
-                        try:
-                            choice = rng.choice(plyr_list, p=prob_list)
-                        except:
-                            print(plyr_list, prob_list)
-                            print("find failed on nonstack and first player selection")
-                        choice_idx = np.nonzero(ids == choice)[0]
-                        lineup.append(str(choice))
-                        in_lineup[choice_idx] = 1
-                        salary += salaries[choice_idx]
-                        proj += projections[choice_idx]
-                        def_opp = opponents[choice_idx][0]
-                        lineup_matchups.append(matchups[choice_idx[0]])
-                        player_teams.append(teams[choice_idx][0])
-                    if k >= 1:
-                        remaining_salary = salary_ceiling - salary
-                        if players_opposing_def < overlap_limit:
-                            if k == total_players - 1:
-                                valid_players = np.nonzero(
-                                    (pos > 0)
-                                    & (in_lineup == 0)
-                                    & (salaries <= remaining_salary)
-                                    & (salary + salaries >= salary_floor)
-                                )[0]
-                            else:
-                                valid_players = np.nonzero(
-                                    (pos > 0)
-                                    & (in_lineup == 0)
-                                    & (salaries <= remaining_salary)
-                                )[0]
-                            # grab names of players eligible
-                            plyr_list = ids[valid_players]
-                            # create np array of probability of being seelcted based on ownership and who is eligible at the position
-                            prob_list = ownership[valid_players]
-                            prob_list = prob_list / prob_list.sum()
-                            if k == total_players - 1:
-                                boosted_salaries = np.array(
-                                    [
-                                        salary_boost(s, salary_ceiling)
-                                        for s in salaries[valid_players]
-                                    ]
-                                )
-                                boosted_probabilities = prob_list * boosted_salaries
-                                boosted_probabilities /= (
-                                    boosted_probabilities.sum()
-                                )  # normalize to ensure it sums to 1
-                            try:
-                                if k == total_players - 1:
-                                    choice = rng.choice(
-                                        plyr_list, p=boosted_probabilities
-                                    )
-                                else:
-                                    choice = rng.choice(plyr_list, p=prob_list)
-                            except:
-                                # if remaining_salary <= np.min(salaries):
-                                #     reject_counters["salary_too_high"] += 1
-                                # else:
-                                #     reject_counters["salary_too_low"]
-                                salary = 0
-                                proj = 0
-                                if team_stack == "":
-                                    lineup = []
-                                else:
-                                    lineup = np.zeros(shape=pos_matrix.shape[1]).astype(
-                                        str
-                                    )
-                                player_teams = []
-                                def_opps = []
-                                players_opposing_def = 0
-                                lineup_matchups = []
-                                in_lineup.fill(0)  # Reset the in_lineup array
-                                k = 0  # Reset the player index
-                                continue  # Skip to the next iteration of the while loop
-                            choice_idx = np.nonzero(ids == choice)[0]
-                            lineup.append(str(choice))
-                            in_lineup[choice_idx] = 1
-                            salary += salaries[choice_idx]
-                            proj += projections[choice_idx]
-                            player_teams.append(teams[choice_idx][0])
-                            lineup_matchups.append(matchups[choice_idx[0]])
-                            if teams[choice_idx][0] == def_opp:
-                                players_opposing_def += 1
-                            if max_players_per_team is not None:
-                                team_count = Counter(player_teams)
-                                if any(
-                                    count > max_players_per_team
-                                    for count in team_count.values()
-                                ):
-                                    salary = 0
-                                    proj = 0
-                                    if team_stack == "":
-                                        lineup = []
-                                    else:
-                                        lineup = np.zeros(
-                                            shape=pos_matrix.shape[1]
-                                        ).astype(str)
-                                    player_teams = []
-                                    def_opps = []
-                                    players_opposing_def = 0
-                                    lineup_matchups = []
-                                    in_lineup.fill(0)  # Reset the in_lineup array
-                                    k = 0  # Reset the player index
-                                    continue  # Skip to the next iteration of the while loop
-                        else:
-                            if k == total_players - 1:
-                                valid_players = np.nonzero(
-                                    (pos > 0)
-                                    & (in_lineup == 0)
-                                    & (salaries <= remaining_salary)
-                                    & (salary + salaries >= salary_floor)
-                                    & (teams != def_opp)
-                                )[0]
-                            else:
-                                valid_players = np.nonzero(
-                                    (pos > 0)
-                                    & (in_lineup == 0)
-                                    & (salaries <= remaining_salary)
-                                    & (teams != def_opp)
-                                )[0]
-                            # grab names of players eligible
-                            plyr_list = ids[valid_players]
-                            # create np array of probability of being seelcted based on ownership and who is eligible at the position
-                            prob_list = ownership[valid_players]
-                            prob_list = prob_list / prob_list.sum()
-                            boosted_salaries = np.array(
-                                [
-                                    salary_boost(s, salary_ceiling)
-                                    for s in salaries[valid_players]
-                                ]
-                            )
-                            boosted_probabilities = prob_list * boosted_salaries
-                            boosted_probabilities /= (
-                                boosted_probabilities.sum()
-                            )  # normalize to ensure it sums to 1
-                            try:
-                                choice = rng.choice(plyr_list, p=boosted_probabilities)
-                            except:
-                                salary = 0
-                                proj = 0
-                                if team_stack == "":
-                                    lineup = []
-                                else:
-                                    lineup = np.zeros(shape=pos_matrix.shape[1]).astype(
-                                        str
-                                    )
-                                player_teams = []
-                                def_opps = []
-                                players_opposing_def = 0
-                                lineup_matchups = []
-                                in_lineup.fill(0)  # Reset the in_lineup array
-                                k = 0  # Reset the player index
-                                continue  # Skip to the next iteration of the while loop
-                                # if remaining_salary <= np.min(salaries):
-                                #     reject_counters["salary_too_high"] += 1
-                                # else:
-                                #     reject_counters["salary_too_low"]
-                            choice_idx = np.nonzero(ids == choice)[0]
-                            lineup.append(str(choice))
-                            in_lineup[choice_idx] = 1
-                            salary += salaries[choice_idx]
-                            proj += projections[choice_idx]
-                            player_teams.append(teams[choice_idx][0])
-                            lineup_matchups.append(matchups[choice_idx[0]])
-                            if teams[choice_idx][0] == def_opp:
-                                players_opposing_def += 1
-                            if max_players_per_team is not None:
-                                team_count = Counter(player_teams)
-                                if any(
-                                    count > max_players_per_team
-                                    for count in team_count.values()
-                                ):
-                                    salary = 0
-                                    proj = 0
-                                    if team_stack == "":
-                                        lineup = []
-                                    else:
-                                        lineup = np.zeros(
-                                            shape=pos_matrix.shape[1]
-                                        ).astype(str)
-                                    player_teams = []
-                                    def_opps = []
-                                    players_opposing_def = 0
-                                    lineup_matchups = []
-                                    in_lineup.fill(0)  # Reset the in_lineup array
-                                    k = 0  # Reset the player index
-                                    continue  # Skip to the next iteration of the while loop
-                    k += 1
-                # Must have a reasonable salary
-                # if salary > salary_ceiling:
-                #     reject_counters["salary_too_high"] += 1
-                # elif salary < salary_floor:
-                #     reject_counters["salary_too_low"] += 1
-                if salary >= salary_floor and salary <= salary_ceiling:
-                    # Must have a reasonable projection (within 60% of optimal) **people make a lot of bad lineups
-                    if proj >= reasonable_projection:
-                        if len(set(lineup_matchups)) > 1:
-                            if max_players_per_team is not None:
-                                team_count = Counter(player_teams)
-                                if all(
-                                    count <= max_players_per_team
-                                    for count in team_count.values()
-                                ):
-                                    reject = False
-                                    lus[lu_num] = {
-                                        "Lineup": lineup,
-                                        "Wins": 0,
-                                        "Top1Percent": 0,
-                                        "ROI": 0,
-                                        "Cashes": 0,
-                                        "Type": "generated",
-                                        "Count": 0
-                                    }
-                                    if len(set(lineup)) != 9:
-                                        print(
-                                            "non stack lineup dupes",
-                                            lu_num,
-                                            plyr_stack_indices,
-                                            str(lu_num),
-                                            salaries[plyr_stack_indices],
-                                            lineup,
-                                            stack_len,
-                                            team_stack,
-                                            x,
-                                        )
-                            else:
-                                reject = False
-                                lus[lu_num] = {
-                                    "Lineup": lineup,
-                                    "Wins": 0,
-                                    "Top1Percent": 0,
-                                    "ROI": 0,
-                                    "Cashes": 0,
-                                    "Type": "generated",
-                                    "Count": 0
-                                }
-                                if len(set(lineup)) != 9:
-                                    print(
-                                        "stack lineup dupes",
-                                        lu_num,
-                                        plyr_stack_indices,
-                                        str(lu_num),
-                                        salaries[plyr_stack_indices],
-                                        lineup,
-                                        stack_len,
-                                        team_stack,
-                                        x,
-                                    )
-                            # complete = 'completed'
-                            # print(str(lu_num) + ' ' + complete)
-                    #     else:
-                    #         reject_counters["invalid_matchups"] += 1
-                    # else:
-                    #     reject_counters["projection_too_low"] += 1
-            else:
-                salary = 0
-                proj = 0
-                if sum(in_lineup) != 0:
-                    in_lineup.fill(0)
-                player_teams = []
-                def_opps = []
-                lineup_matchups = []
-                filled_pos = np.zeros(shape=pos_matrix.shape[1])
-                team_stack_len = 0
-                k = 0
-                stack = True
-                lineup = np.zeros(shape=pos_matrix.shape[1]).astype(str)
-                valid_team = np.nonzero(teams == team_stack)[0]
-                # select qb
-                qb = np.unique(
-                    valid_team[np.nonzero(pos_matrix[valid_team, 1] > 0)[0]]
-                )[0]
-                salary += salaries[qb]
-                proj += projections[qb]
-                # print(salary)
-                team_stack_len += 1
-                lineup[1] = ids[qb]
-                in_lineup[qb] = 1
-                lineup_matchups.append(matchups[qb])
-                valid_players = np.unique(
-                    valid_team[np.nonzero(pos_matrix[valid_team, 4:8] > 0)[0]]
+        lineups = np.full((len(team_stacks), pos_matrix.shape[1]), -1, dtype=np.int32)
+        pending = np.arange(len(team_stacks))
+        num_drawn = 0
+        num_accepted = 0
+        # draw candidates for every unfinished lineup at once until each has one that passes
+        for _ in range(max_rounds):
+            if len(pending) == 0:
+                break
+            # enough copies of each lineup to expect two that pass at the rate seen so
+            # far (one in two to start), never more than batch_size candidates a round
+            rate = (num_accepted + 1) / (num_drawn + 2)
+            copies = min(math.ceil(2 / rate), max(1, batch_size // len(pending)))
+            rows = np.repeat(pending, copies)
+            candidates, accepted = NFL_GPP_Simulator.draw_lineup_batch(
+                rng,
+                team_stacks[rows],
+                stack_lens[rows],
+                pos_matrix,
+                ownership,
+                salaries,
+                projections,
+                teams,
+                opponents,
+                matchups,
+                salary_floor,
+                salary_ceiling,
+                reasonable_projection,
+                reasonable_stack_projection,
+                overlap_limit,
+                max_players_per_team,
+            )
+            num_drawn += len(rows)
+            num_accepted += accepted.sum()
+            done, first = np.unique(rows[accepted], return_index=True)
+            lineups[done] = candidates[accepted][first]
+            pending = pending[~np.isin(pending, done)]
+        if len(pending) > 0:
+            stacks = sorted(
+                {team_names[t] if t >= 0 else "no stack" for t in team_stacks[pending]}
+            )
+            raise RuntimeError(
+                "unable to generate {} field lineups ({}) in {} rounds of candidates, "
+                "check min_lineup_salary and max_pct_off_optimal".format(
+                    len(pending), ", ".join(stacks), max_rounds
                 )
-                player_teams.append(teams[qb])
-                players_opposing_def = 0
-                plyr_list = ids[valid_players]
-                prob_list = ownership[valid_players]
-                prob_list = prob_list / prob_list.sum()
-                while stack:
-                    try:
-                        choices = rng.choice(
-                            a=plyr_list, p=prob_list, size=stack_len, replace=False
-                        )
-                        if len(set(choices)) != len(choices):
-                            print(
-                                "choice dupe",
-                                plyr_stack_indices,
-                                str(lu_num),
-                                salaries[plyr_stack_indices],
-                                lineup,
-                                stack_len,
-                                team_stack,
-                                x,
-                            )
-                    except:
-                        stack = False
-                        continue
-                    plyr_stack_indices = np.nonzero(np.in1d(ids, choices))[0]
-                    x = 0
-                    for p in plyr_stack_indices:
-                        player_placed = False
-                        for l in np.nonzero(pos_matrix[p] > 0)[0]:
-                            if lineup[l] == "0.0":
-                                lineup[l] = ids[p]
-                                lineup_matchups.append(matchups[p])
-                                player_teams.append(teams[p])
-                                x += 1
-                                player_placed = True
-                                break
-                            if player_placed:
-                                break
-                    # print(plyr_stack_indices, str(lu_num), salaries[plyr_stack_indices], lineup, stack_len, x)
-                    if x == stack_len:
-                        in_lineup[plyr_stack_indices] = 1
-                        salary += sum(salaries[plyr_stack_indices])
-                        # rint(salary)
-                        proj += sum(projections[plyr_stack_indices])
-                        # print(proj)
-                        team_stack_len += stack_len
-                        x = 0
-                        stack = False
-                    else:
-                        stack = False
-                # print(sum(in_lineup), stack_len)
-                for ix, (l, pos) in enumerate(zip(lineup, pos_matrix.T)):
-                    if l == "0.0":
-                        if k < 1:
-                            valid_players = np.nonzero(
-                                (pos > 0) & (in_lineup == 0) & (opponents != team_stack)
-                            )[0]
-                            # grab names of players eligible
-                            plyr_list = ids[valid_players]
-                            # create np array of probability of being selected based on ownership and who is eligible at the position
-                            prob_list = ownership[valid_players]
-                            prob_list = prob_list / prob_list.sum()
-                            try:
-                                choice = rng.choice(plyr_list, p=prob_list)
-                            except:
-                                print("find failed on stack and first player selection")
-
-                            #    print(k, pos)
-                            choice_idx = np.nonzero(ids == choice)[0]
-                            in_lineup[choice_idx] = 1
-                            try:
-                                lineup[ix] = str(choice)
-                            except IndexError:
-                                print(lineup, choice, ix)
-                            salary += salaries[choice_idx]
-                            proj += projections[choice_idx]
-                            def_opp = opponents[choice_idx][0]
-                            lineup_matchups.append(matchups[choice_idx[0]])
-                            player_teams.append(teams[choice_idx][0])
-                            k += 1
-                        elif k >= 1:
-                            remaining_salary = salary_ceiling - salary
-                            if players_opposing_def < overlap_limit:
-                                if k == total_players - 1:
-                                    valid_players = np.nonzero(
-                                        (pos > 0)
-                                        & (in_lineup == 0)
-                                        & (salaries <= remaining_salary)
-                                        & (salary + salaries >= salary_floor)
-                                    )[0]
-                                else:
-                                    valid_players = np.nonzero(
-                                        (pos > 0)
-                                        & (in_lineup == 0)
-                                        & (salaries <= remaining_salary)
-                                    )[0]
-                                # grab names of players eligible
-                                plyr_list = ids[valid_players]
-                                # create np array of probability of being seelcted based on ownership and who is eligible at the position
-                                prob_list = ownership[valid_players]
-                                prob_list = prob_list / prob_list.sum()
-                                if k == total_players - 1:
-                                    boosted_salaries = np.array(
-                                        [
-                                            salary_boost(s, salary_ceiling)
-                                            for s in salaries[valid_players]
-                                        ]
-                                    )
-                                    boosted_probabilities = prob_list * boosted_salaries
-                                    boosted_probabilities /= (
-                                        boosted_probabilities.sum()
-                                    )  # normalize to ensure it sums to 1
-                                try:
-                                    if k == total_players - 1:
-                                        choice = rng.choice(
-                                            plyr_list, p=boosted_probabilities
-                                        )
-                                    else:
-                                        choice = rng.choice(plyr_list, p=prob_list)
-                                except:
-                                    salary = 0
-                                    proj = 0
-                                    if team_stack == "":
-                                        lineup = []
-                                    else:
-                                        lineup = np.zeros(
-                                            shape=pos_matrix.shape[1]
-                                        ).astype(str)
-                                    player_teams = []
-                                    def_opps = []
-                                    players_opposing_def = 0
-                                    lineup_matchups = []
-                                    in_lineup.fill(0)  # Reset the in_lineup array
-                                    k = 0  # Reset the player index
-                                    continue  # Skip to the next iteration of the while loop
-                                    # if remaining_salary <= np.min(salaries):
-                                    #     reject_counters["salary_too_high"] += 1
-                                    # else:
-                                    #     reject_counters["salary_too_low"]
-                                choice_idx = np.nonzero(ids == choice)[0]
-                                try:
-                                    lineup[ix] = str(choice)
-                                except IndexError:
-                                    print(lineup, choice, ix)
-                                in_lineup[choice_idx] = 1
-                                salary += salaries[choice_idx]
-                                proj += projections[choice_idx]
-                                player_teams.append(teams[choice_idx][0])
-                                lineup_matchups.append(matchups[choice_idx[0]])
-                                if max_players_per_team is not None:
-                                    team_count = Counter(player_teams)
-                                    if any(
-                                        count > max_players_per_team
-                                        for count in team_count.values()
-                                    ):
-                                        salary = 0
-                                        proj = 0
-                                        if team_stack == "":
-                                            lineup = []
-                                        else:
-                                            lineup = np.zeros(
-                                                shape=pos_matrix.shape[1]
-                                            ).astype(str)
-                                        player_teams = []
-                                        def_opps = []
-                                        players_opposing_def = 0
-                                        lineup_matchups = []
-                                        in_lineup.fill(0)  # Reset the in_lineup array
-                                        k = 0  # Reset the player index
-                                        continue  # Skip to the next iteration of the while loop
-                                if teams[choice_idx][0] == def_opp:
-                                    players_opposing_def += 1
-                                if teams[choice_idx][0] == team_stack:
-                                    team_stack_len += 1
-                            else:
-                                if k == total_players - 1:
-                                    valid_players = np.nonzero(
-                                        (pos > 0)
-                                        & (in_lineup == 0)
-                                        & (salaries <= remaining_salary)
-                                        & (salary + salaries >= salary_floor)
-                                        & (teams != def_opp)
-                                    )[0]
-                                else:
-                                    valid_players = np.nonzero(
-                                        (pos > 0)
-                                        & (in_lineup == 0)
-                                        & (salaries <= remaining_salary)
-                                        & (teams != def_opp)
-                                    )[0]
-                                # grab names of players eligible
-                                plyr_list = ids[valid_players]
-                                # create np array of probability of being seelcted based on ownership and who is eligible at the position
-                                prob_list = ownership[valid_players]
-                                prob_list = prob_list / prob_list.sum()
-                                boosted_salaries = np.array(
-                                    [
-                                        salary_boost(s, salary_ceiling)
-                                        for s in salaries[valid_players]
-                                    ]
-                                )
-                                boosted_probabilities = prob_list * boosted_salaries
-                                boosted_probabilities /= (
-                                    boosted_probabilities.sum()
-                                )  # normalize to ensure it sums to 1
-                                try:
-                                    choice = rng.choice(
-                                        plyr_list, p=boosted_probabilities
-                                    )
-                                except:
-                                    salary = 0
-                                    proj = 0
-                                    if team_stack == "":
-                                        lineup = []
-                                    else:
-                                        lineup = np.zeros(
-                                            shape=pos_matrix.shape[1]
-                                        ).astype(str)
-                                    player_teams = []
-                                    def_opps = []
-                                    players_opposing_def = 0
-                                    lineup_matchups = []
-                                    in_lineup.fill(0)  # Reset the in_lineup array
-                                    k = 0  # Reset the player index
-                                    continue  # Skip to the next iteration of the while loop
-                                    # if remaining_salary <= np.min(salaries):
-                                    #     reject_counters["salary_too_high"] += 1
-                                    # else:
-                                    #     reject_counters["salary_too_low"]
-                                choice_idx = np.nonzero(ids == choice)[0]
-                                lineup[ix] = str(choice)
-                                in_lineup[choice_idx] = 1
-                                salary += salaries[choice_idx]
-                                proj += projections[choice_idx]
-                                player_teams.append(teams[choice_idx][0])
-                                lineup_matchups.append(matchups[choice_idx[0]])
-                                if teams[choice_idx][0] == def_opp:
-                                    players_opposing_def += 1
-                                if teams[choice_idx][0] == team_stack:
-                                    team_stack_len += 1
-                                if max_players_per_team is not None:
-                                    team_count = Counter(player_teams)
-                                    if any(
-                                        count > max_players_per_team
-                                        for count in team_count.values()
-                                    ):
-                                        salary = 0
-                                        proj = 0
-                                        if team_stack == "":
-                                            lineup = []
-                                        else:
-                                            lineup = np.zeros(
-                                                shape=pos_matrix.shape[1]
-                                            ).astype(str)
-                                        player_teams = []
-                                        def_opps = []
-                                        players_opposing_def = 0
-                                        lineup_matchups = []
-                                        in_lineup.fill(0)  # Reset the in_lineup array
-                                        k = 0  # Reset the player index
-                                        continue  # Skip to the next iteration of the while loop
-                            k += 1
-                    else:
-                        k += 1
-                # Must have a reasonable salary
-                if team_stack_len >= stack_len:
-                    if salary >= salary_floor and salary <= salary_ceiling:
-                        # loosening reasonable projection constraint for team stacks
-                        if proj >= reasonable_stack_projection:
-                            if len(set(lineup_matchups)) > 1:
-                                if max_players_per_team is not None:
-                                    team_count = Counter(player_teams)
-                                    if all(
-                                        count <= max_players_per_team
-                                        for count in team_count.values()
-                                    ):
-                                        reject = False
-                                        lus[lu_num] = {
-                                            "Lineup": lineup,
-                                            "Wins": 0,
-                                            "Top1Percent": 0,
-                                            "ROI": 0,
-                                            "Cashes": 0,
-                                            "Type": "generated",
-                                            "Count": 0,
-                                        }
-                                        if len(set(lineup)) != 9:
-                                            print(
-                                                "stack lineup dupes",
-                                                lu_num,
-                                                plyr_stack_indices,
-                                                str(lu_num),
-                                                salaries[plyr_stack_indices],
-                                                lineup,
-                                                stack_len,
-                                                team_stack,
-                                                x,
-                                            )
-
-                                else:
-                                    reject = False
-                                    lus[lu_num] = {
-                                        "Lineup": lineup,
-                                        "Wins": 0,
-                                        "Top1Percent": 0,
-                                        "ROI": 0,
-                                        "Cashes": 0,
-                                        "Type": "generated",
-                                        "Count": 0,
-                                    }
-                                    if len(set(lineup)) != 9:
-                                        print(
-                                            "stack lineup dupes",
-                                            lu_num,
-                                            plyr_stack_indices,
-                                            str(lu_num),
-                                            salaries[plyr_stack_indices],
-                                            lineup,
-                                            stack_len,
-                                            team_stack,
-                                            x,
-                                        )
-                #             else:
-                #                 reject_counters["invalid_matchups"] += 1
-                #         else:
-                #             reject_counters["projection_too_low"] += 1
-                #     else:
-                #         if salary > salary_ceiling:
-                #             reject_counters["salary_too_high"] += 1
-                #         elif salary < salary_floor:
-                #             reject_counters["salary_too_low"] += 1
-                # else:
-                #     reject_counters["stack_length_insufficient"] += 1
-        # return lus, reject_counters
-        return lus
+            )
+        # player indices in slot order, one row per lineup
+        return lineups
+
+    def get_field_chunk_size(self, num_lineups):
+        if self.field_chunk_size > 0:
+            return self.field_chunk_size
+        # enough chunks to keep the workers busy without many round trips. the count
+        # doesn't depend on the machine so seeded runs split the field the same way
+        return max(1, math.ceil(num_lineups / 64))
 
     def generate_field_lineups(self):
-        diff = self.field_size - len(self.field_lineups)
+        diff = self.field_size - self.field_counts.sum()
         if diff <= 0:
             print(
                 "supplied lineups >= contest field size. only retrieving the first "
@@ -1657,7 +1140,6 @@ class NFL_GPP_Simulator:
                     else:
                         pos_list.append(0)
                 positions.append(np.array(pos_list))
-            in_lineup = np.zeros(shape=len(ids))
             ownership = np.array(ownership)
             salaries = np.array(salaries)
             projections = np.array(projections)
@@ -1667,56 +1149,59 @@ class NFL_GPP_Simulator:
             salary_floor = self.min_lineup_salary
             salary_ceiling = self.salary
             max_pct_off_optimal = self.max_pct_off_optimal
-            stack_usage = self.pct_field_using_stacks
-            teams = np.array(teams)
-            opponents = np.array(opponents)
+            # teams and matchups as integer codes so the batches can compare them as arrays
+            team_names = sorted(set(teams) | set(opponents))
+            team_codes = {t: i for i, t in enumerate(team_names)}
+            teams = np.array([team_codes[t] for t in teams])
+            opponents = np.array([team_codes[t] for t in opponents])
+            matchup_codes = {m: i for i, m in enumerate(sorted(set(matchups)))}
+            matchups = np.array([matchup_codes[m] for m in matchups])
             overlap_limit = self.overlap_limit
+            field_data = {
+                "ids": ids,
+                "pos_matrix": pos_matrix,
+                "ownership": ownership,
+                "salary_floor": salary_floor,
+                "salary_ceiling": salary_ceiling,
+                "optimal_score": optimal_score,
+                "salaries": salaries,
+                "projections": projections,
+                "max_pct_off_optimal": max_pct_off_optimal,
+                "teams": teams,
+                "opponents": opponents,
+                "overlap_limit": overlap_limit,
+                "matchups": matchups,
+                "site": self.site,
+                "team_names": team_names,
+            }
             problems = []
-            stacks = np.random.binomial(n=1, p=self.pct_field_using_stacks, size=diff)
-            stack_len = np.random.choice(
+            stack_seed, chunk_seed = self.field_seed.spawn(2)
+            rng = np.random.default_rng(stack_seed)
+            stacks = rng.binomial(n=1, p=self.pct_field_using_stacks, size=diff)
+            stack_len = rng.choice(
                 a=[1, 2],
                 p=[1 - self.pct_field_double_stacks, self.pct_field_double_stacks],
                 size=diff,
             )
-            max_stack_len = 2
-            num_players_in_roster = len(self.roster_construction)
             a = list(self.stacks_dict.keys())
             p = np.array(list(self.stacks_dict.values()))
             probs = p / sum(p)
-            stacks = stacks.astype(str)
-            for i in range(len(stacks)):
-                if stacks[i] == "1":
-                    choice = random.choices(a, weights=probs, k=1)
-                    stacks[i] = choice[0]
-                else:
-                    stacks[i] = ""
-            # creating tuples of the above np arrays plus which lineup number we are going to create
-            for i in range(diff):
-                lu_tuple = (
-                    i,
-                    ids,
-                    in_lineup,
-                    pos_matrix,
-                    ownership,
-                    salary_floor,
-                    salary_ceiling,
-                    optimal_score,
-                    salaries,
-                    projections,
-                    max_pct_off_optimal,
-                    teams,
-                    opponents,
-                    stacks[i],
-                    stack_len[i],
-                    overlap_limit,
-                    max_stack_len,
-                    matchups,
-                    num_players_in_roster,
-                    self.site,
-                )
+            stack_teams = np.array([team_codes.get(t, -1) for t in a])
+            team_stacks = np.where(
+                stacks == 1, stack_teams[rng.choice(len(a), p=probs, size=diff)], -1
+            )
+            # each task builds a chunk of lineups, each chunk is generated in batches
+            chunk_size = self.get_field_chunk_size(diff)
+            chunk_starts = range(0, diff, chunk_size)
+            seeds = chunk_seed.spawn(len(chunk_starts))
+            for start, seed in zip(chunk_starts, seeds):
+                lu_nums = np.arange(start, min(start + chunk_size, diff))
+                lu_tuple = (team_stacks[lu_nums], stack_len[lu_nums], seed)
                 problems.append(lu_tuple)
             start_time = time.time()
-            with mp.Pool() as pool:
+            with mp.Pool(
+                initializer=self.init_field_worker, initargs=(field_data,)
+            ) as pool:
                 output = pool.starmap(self.generate_lineups, problems)
                 print(
                     "number of running processes =",
@@ -1727,26 +1212,23 @@ class NFL_GPP_Simulator:
                 pool.close()
                 pool.join()
             print("pool closed")
-            self.update_field_lineups(output,diff)
+            self.update_field_lineups(np.concatenate(output))
             end_time = time.time()
             print("lineups took " + str(end_time - start_time) + " seconds")
             print(str(diff) + " field lineups successfully generated")
-            # print("Reject counters:", dict(overall_reject_counters))
 
             # print(self.field_lineups)
 
     def get_start_time(self, player_id):
-        for _, player in self.player_dict.items():
-            if player["ID"] == player_id:
-                matchup = player["Matchup"]
-                return self.game_info[matchup]
-        return None
+        if player_id not in self.player_index:
+            return None
+        matchup = self.player_list[self.player_index[player_id]]["Matchup"]
+        return self.game_info[matchup]
 
     def get_player_attribute(self, player_id, attribute):
-        for _, player in self.player_dict.items():
-            if player["ID"] == player_id:
-                return player.get(attribute, None)
-        return None
+        if player_id not in self.player_index:
+            return None
+        return self.player_list[self.player_index[player_id]].get(attribute, None)
 
     def is_valid_for_position(self, player, position_idx):
         return any(
@@ -1784,55 +1266,61 @@ class NFL_GPP_Simulator:
 
         return lineup
 
-    def update_field_lineups(self, output, diff):
-        if len(self.field_lineups) == 0:
-            new_keys = list(range(0, self.field_size))
-        else:
-            new_keys = list(
-                range(
-                    max(self.field_lineups.keys()) + 1,
-                    max(self.field_lineups.keys()) + 1 + diff,
-                )
-            )
-
-        nk = new_keys[0]
-        for i, o in enumerate(output):
-            lineup_list = sorted(next(iter(o.values()))["Lineup"])
-            lineup_set = frozenset(lineup_list)
-
-            # Keeping track of lineup duplication counts
-            if lineup_set in self.seen_lineups:
-                self.seen_lineups[lineup_set] += 1
-
-                # Increase the count in field_lineups using the index stored in seen_lineups_ix
-                self.field_lineups[self.seen_lineups_ix[lineup_set]]["Count"] += 1
-            else:
-                self.seen_lineups[lineup_set] = 1
-
-                # Updating the field lineups dictionary
-                if nk in self.field_lineups.keys():
-                    print("bad lineups dict, please check dk_data files")
-                else:
-                    if self.site == "dk":
-                        sorted_lineup = self.sort_lineup_by_start_time(
-                            next(iter(o.values()))["Lineup"]
-                        )
-                    else:
-                        sorted_lineup = next(iter(o.values()))["Lineup"]
+    def update_field_lineups(self, output, lineup_type="generated"):
+        num_existing = len(self.field_lineups)
+        lineups = np.concatenate((self.field_lineups, output.astype(np.int32)))
+        counts = np.concatenate((self.field_counts, np.ones(len(output), dtype=np.int64)))
+        types = np.concatenate((self.field_types, np.full(len(output), lineup_type)))
 
+        # the same players in any slot order are one lineup, kept where it first showed up
+        _, first, inverse = np.unique(
+            np.sort(lineups, axis=1), axis=0, return_index=True, return_inverse=True
+        )
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        self.field_lineups = lineups[first[order]]
+        self.field_types = types[first[order]]
+        self.field_counts = np.bincount(rank[inverse.ravel()], weights=counts).astype(
+            np.int64
+        )
 
-                    self.field_lineups[nk] = next(iter(o.values()))
-                    self.field_lineups[nk]["Lineup"] = sorted_lineup
-                    self.field_lineups[nk]["Count"] += self.seen_lineups[lineup_set]
-                    # Store the new nk in seen_lineups_ix for quick access in the future
-                    self.seen_lineups_ix[lineup_set] = nk
-                    nk += 1
+        if self.site == "dk" and lineup_type == "generated":
+            for i in range(num_existing, len(self.field_lineups)):
+                lineup = self.sort_lineup_by_start_time(
+                    self.player_ids[self.field_lineups[i]].tolist()
+                )
+                self.field_lineups[i] = [self.player_index[p] for p in lineup]
 
     def calc_gamma(self, mean, sd):
         alpha = (mean / sd) ** 2
         beta = sd**2 / mean
         return alpha, beta
 
+    @staticmethod
+    def build_game_factor(game, cache_dir):
+        # teammates at the same position get SAME_POSITION_CORRELATIONS, other pairs
+        # use the first player's "Correlations". "Player Correlations" override both
+        position_correlations = SAME_POSITION_CORRELATIONS
+
+        def build_covariance_matrix(players):
+            corr_matrix = build_correlation_matrix(players, position_correlations)
+            std_devs = np.array([player["StdDev"] for player in players])
+            # Variance on the diagonal
+            return corr_matrix * np.outer(std_devs, std_devs)
+
+        def build_factor():
+            # cholesky, or set negative eigenvalues to zero when it isn't positive definite
+            return covariance_factor(build_covariance_matrix(game))
+
+        # the matrix is only rebuilt when the projections or correlations changed
+        covariance_matrix, factor = load_covariance_factor(
+            cache_dir,
+            covariance_cache_key("gpp", game, position_correlations),
+            build_factor,
+        )
+        return factor
+
     @staticmethod
     def run_simulation_for_game(
         team1_id,
@@ -1841,85 +1329,14 @@ class NFL_GPP_Simulator:
         team2,
         num_iterations,
         roster_construction,
+        rng,
+        cache_dir,
     ):
-        # Define correlations between positions
-
-        def get_corr_value(player1, player2):
-            # First, check for specific player-to-player correlations
-            if player2["Name"] in player1.get("Player Correlations", {}):
-                return player1["Player Correlations"][player2["Name"]]
-
-            # If no specific correlation is found, proceed with the general logic
-            position_correlations = {
-                "QB": -0.5,
-                "RB": -0.2,
-                "WR": 0.1,
-                "TE": -0.2,
-                "K": -0.5,
-                "DST": -0.5,
-            }
-
-            if player1["Team"] == player2["Team"] and player1["Position"][0] == player2["Position"][0]:
-                primary_position = player1["Position"][0]
-                return position_correlations[primary_position]
-
-            if player1["Team"] != player2["Team"]:
-                player_2_pos = "Opp " + str(player2["Position"][0])
-            else:
-                player_2_pos = player2["Position"][0]
-
-            return player1["Correlations"].get(
-                player_2_pos, 0
-            )  # Default to 0 if no correlation is found
-
-        def build_covariance_matrix(players):
-            N = len(players)
-            matrix = [[0 for _ in range(N)] for _ in range(N)]
-            corr_matrix = [[0 for _ in range(N)] for _ in range(N)]
-
-            for i in range(N):
-                for j in range(N):
-                    if i == j:
-                        matrix[i][j] = (
-                            players[i]["StdDev"] ** 2
-                        )  # Variance on the diagonal
-                        corr_matrix[i][j] = 1
-                    else:
-                        matrix[i][j] = (
-                            get_corr_value(players[i], players[j])
-                            * players[i]["StdDev"]
-                            * players[j]["StdDev"]
-                        )
-                        corr_matrix[i][j] = get_corr_value(players[i], players[j])
-            return matrix, corr_matrix
-
-        def ensure_positive_semidefinite(matrix):
-            eigs = np.linalg.eigvals(matrix)
-            if np.any(eigs < 0):
-                jitter = abs(min(eigs)) + 1e-6  # a small value
-                matrix += np.eye(len(matrix)) * jitter
-            return matrix
-
         game = team1 + team2
-        covariance_matrix, corr_matrix = build_covariance_matrix(game)
-        # print(team1_id, team2_id)
-        # print(corr_matrix)
-        corr_matrix = np.array(corr_matrix)
-
-        # Given eigenvalues and eigenvectors from previous code
-        eigenvalues, eigenvectors = np.linalg.eigh(covariance_matrix)
-
-        # Set negative eigenvalues to zero
-        eigenvalues[eigenvalues < 0] = 0
-
-        # Reconstruct the matrix
-        covariance_matrix = eigenvectors.dot(np.diag(eigenvalues)).dot(eigenvectors.T)
-
         try:
-            samples = multivariate_normal.rvs(
-                mean=[player["Fpts"] for player in game],
-                cov=covariance_matrix,
-                size=num_iterations,
+            factor = NFL_GPP_Simulator.build_game_factor(game, cache_dir)
+            samples = sample_from_factor(
+                rng, [player["Fpts"] for player in game], factor, num_iterations
             )
         except:
             print(team1_id, team2_id, "bad matrix")
@@ -1927,9 +1344,9 @@ class NFL_GPP_Simulator:
         player_samples = []
         for i, player in enumerate(game):
             if "QB" in player["Position"]:
-                sample = samples[:, i]
+                sample = samples[i]
             else:
-                sample = samples[:, i]
+                sample = samples[i]
             # if player['Team'] in ['LAR','SEA']:
             #     print(player['Name'], player['Fpts'], player['StdDev'], sample, np.mean(sample), np.std(sample))
             player_samples.append(sample)
@@ -1981,160 +1398,156 @@ class NFL_GPP_Simulator:
         # plt.savefig(f'output/Team_{team1_id}{team2_id}_Distributions_Correlation.png', bbox_inches='tight')
         # plt.close()
 
-        return temp_fpts_dict
-    
-    @staticmethod
-    @jit(nopython=True)
-    def calculate_payouts(args):
-        (
-            ranks,
-            payout_array,
-            entry_fee,
-            field_lineup_keys,
-            use_contest_data,
-            field_lineups_count,
-        ) = args
-        num_lineups = len(field_lineup_keys)
-        combined_result_array = np.zeros(num_lineups)
+        # the generator comes back so the next block of iterations continues its stream
+        return temp_fpts_dict, rng
 
-        payout_cumsum = np.cumsum(payout_array)
-
-        for r in range(ranks.shape[1]):
-            ranks_in_sim = ranks[:, r]
-            payout_index = 0
-            for lineup_index in ranks_in_sim:
-                lineup_count = field_lineups_count[lineup_index]
-                prize_for_lineup = (
-                    (
-                        payout_cumsum[payout_index + lineup_count - 1]
-                        - payout_cumsum[payout_index - 1]
-                    )
-                    / lineup_count
-                    if payout_index != 0
-                    else payout_cumsum[payout_index + lineup_count - 1] / lineup_count
-                )
-                combined_result_array[lineup_index] += prize_for_lineup
-                payout_index += lineup_count
-        return combined_result_array    
+    def simulate_player_outcomes(self, pool, game_rngs, num_iterations, report_missing):
+        if len(self.player_list) * num_iterations <= self.parallel_sampling_threshold:
+            return self.sample_slate(game_rngs, num_iterations, report_missing)
 
-    def run_tournament_simulation(self):
-        print("Running " + str(self.num_iterations) + " simulations")
-        for f in self.field_lineups:
-            if len(self.field_lineups[f]["Lineup"]) != 9:
-                print("bad lineup", f, self.field_lineups[f])
-        print(f"Number of unique field lineups: {len(self.field_lineups.keys())}")
-
-        start_time = time.time()
-        temp_fpts_dict = {}
-        size = self.num_iterations
         game_simulation_params = []
-        for m in self.matchups:
+        for m, rng in zip(sorted(self.matchups), game_rngs):
             game_simulation_params.append(
                 (
                     m[0],
                     self.teams_dict[m[0]],
                     m[1],
                     self.teams_dict[m[1]],
-                    self.num_iterations,
+                    num_iterations,
                     self.roster_construction,
+                    rng,
+                    self.covariance_cache_dir,
                 )
             )
-        with mp.Pool() as pool:
-            results = pool.starmap(self.run_simulation_for_game, game_simulation_params)
+        results = pool.starmap(self.run_simulation_for_game, game_simulation_params)
 
-        for res in results:
+        temp_fpts_dict = {}
+        for g, (res, rng) in enumerate(results):
             temp_fpts_dict.update(res)
+            game_rngs[g] = rng
 
-        # generate arrays for every sim result for each player in the lineup and sum
-        fpts_array = np.zeros(shape=(len(self.field_lineups), self.num_iterations))
-        # converting payout structure into an np friendly format, could probably just do this in the load contest function
-        # print(self.field_lineups)
-        # print(temp_fpts_dict)
-        # print(payout_array)
-        # print(self.player_dict[('patrick mahomes', 'FLEX', 'KC')])
-        field_lineups_count = np.array(
-            [self.field_lineups[idx]["Count"] for idx in self.field_lineups.keys()]
-        )
-
-        for index, values in self.field_lineups.items():
-            try:
-                fpts_sim = sum([temp_fpts_dict[player] for player in values["Lineup"]])
-            except KeyError:
-                for player in values["Lineup"]:
-                    if player not in temp_fpts_dict.keys():
-                        print(player)
-                        # for k,v in self.player_dict.items():
-                        # if v['ID'] == player:
-                        #        print(k,v)
-                # print('cant find player in sim dict', values["Lineup"], temp_fpts_dict.keys())
-            # store lineup fpts sum in 2d np array where index (row) corresponds to index of field_lineups and columns are the fpts from each sim
-            fpts_array[index] = fpts_sim
-
-        fpts_array = fpts_array.astype(np.float16)
-        # ranks = np.argsort(fpts_array, axis=0)[::-1].astype(np.uint16)
-        ranks = np.argsort(-fpts_array, axis=0).astype(np.uint32)
-
-        # count wins, top 10s vectorized
-        wins, win_counts = np.unique(ranks[0, :], return_counts=True)
-        cashes, cash_counts = np.unique(ranks[0:len(list(self.payout_structure.values()))], return_counts=True)
-
-        top1pct, top1pct_counts = np.unique(
-            ranks[0 : math.ceil(0.01 * len(self.field_lineups)), :], return_counts=True
+        # sim results in the rows of the sample layout
+        player_samples = np.zeros(
+            shape=(self.num_sample_rows, num_iterations), dtype=np.float32
         )
-
-        payout_array = np.array(list(self.payout_structure.values()))
-        # subtract entry fee
-        payout_array = payout_array - self.entry_fee
-        l_array = np.full(
-            shape=self.field_size - len(payout_array), fill_value=-self.entry_fee
+        for i, player in enumerate(self.player_list):
+            if player["ID"] in temp_fpts_dict:
+                player_samples[self.player_rows[i]] = temp_fpts_dict[player["ID"]]
+            elif report_missing:
+                print("cant find player in sim dict", player["Name"], player["ID"])
+        return player_samples
+
+    def sample_layout(self):
+        # every game gets a block of rows in the player samples, its players in the
+        # order the game is sampled in, so games are drawn straight into their rows.
+        # returns the first row of each game, the row of every player index and the
+        # number of rows. players that aren't in any game share a zero row at the end
+        game_starts = []
+        player_rows = np.full(len(self.player_list), -1, dtype=np.int64)
+        num_rows = 0
+        for m in sorted(self.matchups):
+            game = self.teams_dict[m[0]] + self.teams_dict[m[1]]
+            game_starts.append(num_rows)
+            for k, player in enumerate(game):
+                i = self.player_index.get(player["ID"], -1)
+                if i >= 0:
+                    player_rows[i] = num_rows + k
+            num_rows += len(game)
+        player_rows[player_rows < 0] = num_rows
+        return game_starts, player_rows, num_rows + 1
+
+    def sample_slate(self, game_rngs, num_iterations, report_missing):
+        # every game is sampled in this process straight into its block of one
+        # (rows, iterations) matrix. each game draws from its own generator like the
+        # worker processes do, so both paths give the same samples
+        player_samples = np.zeros(
+            shape=(self.num_sample_rows, num_iterations), dtype=np.float32
         )
-        payout_array = np.concatenate((payout_array, l_array))
-        field_lineups_keys_array = np.array(list(self.field_lineups.keys()))
-
-        # Adjusted ROI calculation
-        # print(field_lineups_count.shape, payout_array.shape, ranks.shape, fpts_array.shape)
+        sampled = np.zeros(self.num_sample_rows, dtype=bool)
+        for m, rng, start in zip(sorted(self.matchups), game_rngs, self.game_starts):
+            game = self.teams_dict[m[0]] + self.teams_dict[m[1]]
+            try:
+                factor = self.build_game_factor(game, self.covariance_cache_dir)
+            except:
+                print(m[0], m[1], "bad matrix")
+                continue
+            sample_from_factor(
+                rng,
+                [player["Fpts"] for player in game],
+                factor,
+                num_iterations,
+                out=player_samples[start : start + len(game)],
+            )
+            sampled[start : start + len(game)] = True
+        if report_missing:
+            for i in np.nonzero(~sampled[self.player_rows])[0]:
+                player = self.player_list[i]
+                print("cant find player in sim dict", player["Name"], player["ID"])
+        return player_samples
 
-        # Split the simulation indices into chunks
-        field_lineups_keys_array = np.array(list(self.field_lineups.keys()))
+    def run_tournament_simulation(self):
+        print("Running " + str(self.num_iterations) + " simulations")
+        print(f"Number of unique field lineups: {len(self.field_lineups)}")
 
-        chunk_size = self.num_iterations // 16  # Adjust chunk size as needed
-        simulation_chunks = [
-            (
-                ranks[:, i : min(i + chunk_size, self.num_iterations)].copy(),
-                payout_array,
-                self.entry_fee,
-                field_lineups_keys_array,
-                self.use_contest_data,
-                field_lineups_count,
-            )  # Adding field_lineups_count here
-            for i in range(0, self.num_iterations, chunk_size)
+        start_time = time.time()
+        num_lineups = len(self.field_lineups)
+        field_lineups_count = self.field_counts
+        # a lineup finishes in the top 1% when its place is within 1% of the entries
+        num_top1pct = math.ceil(0.01 * self.field_size)
+        prune_covariance_cache(self.covariance_cache_dir)
+        self.game_starts, self.player_rows, self.num_sample_rows = self.sample_layout()
+        # field lineups as rows of the player samples
+        sample_lineups = self.player_rows[self.field_lineups]
+
+        # iterations are simulated, scored, ranked and paid out a block at a time so the
+        # (lineups, iterations) arrays never exceed the memory budget. each game keeps its
+        # own generator across blocks, so the results don't depend on the block size.
+        # games are taken in sorted order so a seed gives every game the same generator
+        block_size = iteration_block_size(
+            num_lineups,
+            self.num_sample_rows,
+            self.num_iterations,
+            self.sim_memory_budget_mb,
+            self.score_precision,
+        )
+        game_rngs = [
+            np.random.default_rng(s) for s in self.sim_seed.spawn(len(self.matchups))
         ]
+        combined_result_array = np.zeros(num_lineups)
+        self.field_wins = np.zeros(num_lineups, dtype=np.int64)
+        self.field_top1pct = np.zeros(num_lineups, dtype=np.int64)
+        self.field_cashes = np.zeros(num_lineups, dtype=np.int64)
+        # worker processes are only started when the games are too big to sample here
+        use_pool = len(self.player_list) * block_size > self.parallel_sampling_threshold
+        with mp.Pool() if use_pool else contextlib.nullcontext() as pool:
+            for block_start in range(0, self.num_iterations, block_size):
+                block_iterations = min(block_size, self.num_iterations - block_start)
+                player_samples = self.simulate_player_outcomes(
+                    pool, game_rngs, block_iterations, block_start == 0
+                )
 
-        # Use the pool to process the chunks in parallel
-        with mp.Pool() as pool:
-            results = pool.map(self.calculate_payouts, simulation_chunks)
-
-        combined_result_array = np.sum(results, axis=0)
-
-        total_sum = 0
-        index_to_key = list(self.field_lineups.keys())
-        for idx, roi in enumerate(combined_result_array):
-            lineup_key = index_to_key[idx]
-            lineup_count = self.field_lineups[lineup_key][
-                "Count"
-            ]  # Assuming "Count" holds the count of the lineups
-            total_sum += roi * lineup_count
-            self.field_lineups[lineup_key]["ROI"] += roi
-
-        for idx in self.field_lineups.keys():
-            if idx in wins:
-                self.field_lineups[idx]["Wins"] += win_counts[np.where(wins == idx)][0]
-            if idx in top1pct:
-                self.field_lineups[idx]["Top1Percent"] += top1pct_counts[
-                    np.where(top1pct == idx)
-                ][0]
-            if idx in cashes:
-                self.field_lineups[idx]["Cashes"] += cash_counts[np.where(cashes == idx)][0]
+                # lineup x player incidence times the sim results, row of fpts_array corresponds
+                # to the row of field_lineups, columns are the fpts from each sim
+                fpts_array = score_lineups(
+                    sample_lineups, player_samples, self.score_precision
+                )
+                # prizes, wins, top 1% finishes and cashes for every lineup in one pass,
+                # equal scores split the prizes of the places they cover
+                prizes, wins, top1pct, cashes = tournament_results(
+                    fpts_array,
+                    field_lineups_count,
+                    self.payout_cumsum,
+                    num_top1pct,
+                    self.ranking_mode,
+                )
+                del fpts_array
+                combined_result_array += prizes - self.entry_fee * block_iterations
+                self.field_wins += wins
+                self.field_top1pct += top1pct
+                self.field_cashes += cashes
+
+        # per lineup results, same row order as field_lineups
+        self.field_roi = combined_result_array
 
         end_time = time.time()
         diff = end_time - start_time
@@ -2146,207 +1559,123 @@ class NFL_GPP_Simulator:
         )
 
     def output(self):
-        unique = {}
-        for index, x in self.field_lineups.items():
-            # if index == 0:
-            #    print(x)
-            lu_type = x["Type"]
-            salary = 0
-            fpts_p = 0
-            fieldFpts_p = 0
-            ceil_p = 0
-            own_p = []
-            lu_names = []
-            lu_teams = []
-            qb_stack = 0
-            qb_tm = ""
-            players_vs_def = 0
-            def_opps = []
-            simDupes = x['Count']
-            for id in x["Lineup"]:
-                for k, v in self.player_dict.items():
-                    if v["ID"] == id:
-                        if "DST" in v["Position"]:
-                            def_opps.append(v["Opp"])
-                        if "QB" in v["Position"]:
-                            qb_tm = v["Team"]
-            for id in x["Lineup"]:
-                for k, v in self.player_dict.items():
-                    if v["ID"] == id:
-                        salary += v["Salary"]
-                        fpts_p += v["Fpts"]
-                        fieldFpts_p += v["fieldFpts"]
-                        ceil_p += v["Ceiling"]
-                        own_p.append(v["Ownership"] / 100)
-                        lu_names.append(v["Name"])
-                        if "DST" not in v["Position"]:
-                            lu_teams.append(v["Team"])
-                            if v["Team"] in def_opps:
-                                players_vs_def += 1
-                        continue
-            counter = collections.Counter(lu_teams)
-            stacks = counter.most_common()
-
-            # Find the QB team in stacks and set it as primary stack, remove it from stacks and subtract 1 to make sure qb isn't counted
-            for s in stacks:
-                if s[0] == qb_tm:
-                    primaryStack = str(qb_tm) + " " + str((s[1]))
-                    stacks.remove(s)
-                    break
+        # every lineup statistic is a column gathered from the (lineups, slots) index
+        # matrix. slots are DST,QB,RB,RB,WR,WR,WR,TE,FLEX, the report starts at the QB
+        lineups = self.field_lineups
+        players = self.player_list
+        report_slots = list(range(1, lineups.shape[1])) + [0]
+        if self.site == "dk":
+            labels = np.array(
+                [
+                    "{} ({})".format(p["Name"].replace("#", "-"), p["ID"])
+                    for p in players
+                ]
+            )
+        else:
+            labels = np.array(
+                ["{}:{}".format(p["Name"].replace("#", "-"), p["ID"]) for p in players]
+            )
+        salary = slot_totals(lineups, [p["Salary"] for p in players])
+        fpts_p = slot_totals(lineups, [p["Fpts"] for p in players])
+        fieldFpts_p = slot_totals(lineups, [p["fieldFpts"] for p in players])
+        ceil_p = slot_totals(lineups, [p["Ceiling"] for p in players])
+        own_p = slot_totals(
+            lineups, [p["Ownership"] / 100 for p in players], np.multiply
+        )
 
-            # After removing QB team, the first team in stacks will be the team with most players not in QB stack
-            secondaryStack = str(stacks[0][0]) + " " + str(stacks[0][1])
-            own_p = np.prod(own_p)
-            win_p = round(x["Wins"] / self.num_iterations * 100, 2)
-            top10_p = round(x["Top1Percent"] / self.num_iterations * 100, 2)
-            cash_p = round(x["Cashes"] / self.num_iterations * 100, 2)
+        # stacks count the non DST players of each team, the primary stack is the QB's
+        # team and the secondary the biggest other team, first listed on ties
+        team_codes = {}
+        teams = np.array(
+            [team_codes.setdefault(p["Team"], len(team_codes)) for p in players]
+        )
+        opps = np.array(
+            [team_codes.setdefault(p["Opp"], len(team_codes)) for p in players]
+        )
+        team_names = np.array(list(team_codes), dtype=object)
+        is_dst = np.array(["DST" in p["Position"] for p in players])[lineups]
+        is_qb = np.array(["QB" in p["Position"] for p in players])[lineups]
+        lineup_teams = teams[lineups]
+        counts = (
+            (lineup_teams[:, :, None] == lineup_teams[:, None, :]) & ~is_dst[:, None, :]
+        ).sum(axis=2)
+        qb_team = np.where(is_qb, lineup_teams, -1).max(axis=1)
+        qb_count = np.where(is_qb, counts, 0).max(axis=1)
+        others = np.where(
+            ~is_dst & (lineup_teams != qb_team[:, None]), counts, -1
+        )
+        second = others.argmax(axis=1)
+        rows = np.arange(len(lineups))
+        second_team = lineup_teams[rows, second]
+        second_count = others[rows, second]
+        primaryStack = team_names[qb_team] + " " + qb_count.astype(str).astype(object)
+        secondaryStack = np.where(
+            second_count >= 0,
+            team_names[second_team] + " " + second_count.astype(str).astype(object),
+            "",
+        )
+        # players facing their lineup's defense
+        players_vs_def = (
+            ~is_dst[:, :, None]
+            & is_dst[:, None, :]
+            & (lineup_teams[:, :, None] == opps[lineups][:, None, :])
+        ).any(axis=2).sum(axis=1)
+
+        win_p = np.round(self.field_wins / self.num_iterations * 100, 2)
+        top10_p = np.round(self.field_top1pct / self.num_iterations * 100, 2)
+        columns = [
+            (title, labels[lineups[:, slot]], None)
+            for title, slot in zip(
+                ["QB", "RB", "RB", "WR", "WR", "WR", "TE", "FLEX", "DST"], report_slots
+            )
+        ]
+        columns += [
+            ("Fpts Proj", fpts_p, None),
+            ("Field Fpts Proj", fieldFpts_p, None),
+            ("Ceiling", ceil_p, None),
+        ]
+        if self.use_contest_data:
             if self.site == "dk":
-                if self.use_contest_data:
-                    roi_p = round(
-                        x["ROI"] / self.entry_fee / self.num_iterations * 100, 2
-                    )
-                    roi_round = round(x["ROI"] / x['Count'] / self.num_iterations, 2)
-                    lineup_str = "{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{},{},{},${},{}%,{}%,{}%,{},${},{},{},{},{},{}".format(
-                        lu_names[1].replace("#", "-"),
-                        x["Lineup"][1],
-                        lu_names[2].replace("#", "-"),
-                        x["Lineup"][2],
-                        lu_names[3].replace("#", "-"),
-                        x["Lineup"][3],
-                        lu_names[4].replace("#", "-"),
-                        x["Lineup"][4],
-                        lu_names[5].replace("#", "-"),
-                        x["Lineup"][5],
-                        lu_names[6].replace("#", "-"),
-                        x["Lineup"][6],
-                        lu_names[7].replace("#", "-"),
-                        x["Lineup"][7],
-                        lu_names[8].replace("#", "-"),
-                        x["Lineup"][8],
-                        lu_names[0].replace("#", "-"),
-                        x["Lineup"][0],
-                        fpts_p,
-                        fieldFpts_p,
-                        ceil_p,
-                        salary,
-                        win_p,
-                        top10_p,
-                        roi_p,
-                        own_p,
-                        roi_round,
-                        primaryStack,
-                        secondaryStack,
-                        players_vs_def,
-                        lu_type,
-                        simDupes,
-                    )
-                else:
-                    lineup_str = "{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{} ({}),{},{},{},{},{}%,{}%,{}%,{},{},{},{},{}".format(
-                        lu_names[1].replace("#", "-"),
-                        x["Lineup"][1],
-                        lu_names[2].replace("#", "-"),
-                        x["Lineup"][2],
-                        lu_names[3].replace("#", "-"),
-                        x["Lineup"][3],
-                        lu_names[4].replace("#", "-"),
-                        x["Lineup"][4],
-                        lu_names[5].replace("#", "-"),
-                        x["Lineup"][5],
-                        lu_names[6].replace("#", "-"),
-                        x["Lineup"][6],
-                        lu_names[7].replace("#", "-"),
-                        x["Lineup"][7],
-                        lu_names[8].replace("#", "-"),
-                        x["Lineup"][8],
-                        lu_names[0].replace("#", "-"),
-                        x["Lineup"][0],
-                        fpts_p,
-                        fieldFpts_p,
-                        ceil_p,
-                        salary,
-                        win_p,
-                        top10_p,
-                        own_p,
-                        primaryStack,
-                        secondaryStack,
-                        players_vs_def,
-                        lu_type,
-                        simDupes
-                    )
-            elif self.site == "fd":
-                if self.use_contest_data:
-                    roi_p = round(
-                        x["ROI"] / x['Count'] / self.entry_fee / self.num_iterations * 100, 2
-                    )
-                    roi_round = round(x["ROI"] / x['Count'] / self.num_iterations, 2)
-                    lineup_str = "{}:{},{}:{},{}:{},{}:{},{}:{},{}:{},{}:{},{}:{},{}:{},{},{},{},{},{}%,{}%,{}%,{},${},{},{},{},{},{}".format(
-                        lu_names[1].replace("#", "-"),
-                        x["Lineup"][1],
-                        lu_names[2].replace("#", "-"),
-                        x["Lineup"][2],
-                        lu_names[3].replace("#", "-"),
-                        x["Lineup"][3],
-                        lu_names[4].replace("#", "-"),
-                        x["Lineup"][4],
-                        lu_names[5].replace("#", "-"),
-                        x["Lineup"][5],
-                        lu_names[6].replace("#", "-"),
-                        x["Lineup"][6],
-                        lu_names[7].replace("#", "-"),
-                        x["Lineup"][7],
-                        lu_names[8].replace("#", "-"),
-                        x["Lineup"][8],
-                        lu_names[0].replace("#", "-"),
-                        x["Lineup"][0],
-                        fpts_p,
-                        fieldFpts_p,
-                        ceil_p,
-                        salary,
-                        win_p,
-                        top10_p,
-                        roi_p,
-                        own_p,
-                        roi_round,
-                        primaryStack,
-                        secondaryStack,
-                        players_vs_def,
-                        lu_type,
-                        simDupes
-                    )
-                else:
-                    lineup_str = "{}:{},{}:{},{}:{},{}:{},{}:{},{}:{},{}:{},{}:{},{}:{},{},{},{},{},{}%,{}%,{},{},{},{},{},{}".format(
-                        lu_names[1].replace("#", "-"),
-                        x["Lineup"][1],
-                        lu_names[2].replace("#", "-"),
-                        x["Lineup"][2],
-                        lu_names[3].replace("#", "-"),
-                        x["Lineup"][3],
-                        lu_names[4].replace("#", "-"),
-                        x["Lineup"][4],
-                        lu_names[5].replace("#", "-"),
-                        x["Lineup"][5],
-                        lu_names[6].replace("#", "-"),
-                        x["Lineup"][6],
-                        lu_names[7].replace("#", "-"),
-                        x["Lineup"][7],
-                        lu_names[8].replace("#", "-"),
-                        x["Lineup"][8],
-                        lu_names[0].replace("#", "-"),
-                        x["Lineup"][0],
-                        fpts_p,
-                        fieldFpts_p,
-                        ceil_p,
-                        salary,
-                        win_p,
-                        top10_p,
-                        own_p,
-                        primaryStack,
-                        secondaryStack,
-                        players_vs_def,
-                        lu_type,
-                        simDupes
-                    )
-            unique[index] = lineup_str
+                roi_p = self.field_roi / self.entry_fee / self.num_iterations * 100
+                columns.append(("Salary", salary, "${}"))
+            else:
+                roi_p = (
+                    self.field_roi
+                    / self.field_counts
+                    / self.entry_fee
+                    / self.num_iterations
+                    * 100
+                )
+                columns.append(("Salary", salary, None))
+            roi_round = self.field_roi / self.field_counts / self.num_iterations
+            columns += [
+                ("Win %", win_p, "{}%"),
+                ("Top 10%", top10_p, "{}%"),
+                ("ROI%", np.round(roi_p, 2), "{}%"),
+                ("Proj. Own. Product", own_p, None),
+                ("Avg. Return", np.round(roi_round, 2), "${}"),
+            ]
+        else:
+            columns += [
+                ("Salary", salary, None),
+                ("Win %", win_p, "{}%"),
+                ("Top 10%", top10_p, "{}%"),
+                # the dk header has always had a leading space here
+                (
+                    " Proj. Own. Product"
+                    if self.site == "dk"
+                    else "Proj. Own. Product",
+                    own_p,
+                    None,
+                ),
+            ]
+        columns += [
+            ("Stack1 Type", primaryStack, None),
+            ("Stack2 Type", secondaryStack, None),
+            ("Players vs DST", players_vs_def, None),
+            ("Lineup Type", self.field_types, None),
+            (" Sim Dupes", self.field_counts, None),
+        ]
 
         out_path = os.path.join(
             os.path.dirname(__file__),
@@ -2354,82 +1683,40 @@ class NFL_GPP_Simulator:
                 self.site, self.field_size, self.num_iterations
             ),
         )
-        with open(out_path, "w") as f:
-            if self.site == "dk":
-                if self.use_contest_data:
-                    f.write(
-                        "QB,RB,RB,WR,WR,WR,TE,FLEX,DST,Fpts Proj,Field Fpts Proj,Ceiling,Salary,Win %,Top 10%,ROI%,Proj. Own. Product,Avg. Return,Stack1 Type,Stack2 Type,Players vs DST,Lineup Type, Sim Dupes\n"
-                    )
-                else:
-                    f.write(
-                        "QB,RB,RB,WR,WR,WR,TE,FLEX,DST,Fpts Proj,Field Fpts Proj,Ceiling,Salary,Win %,Top 10%, Proj. Own. Product,Stack1 Type,Stack2 Type,Players vs DST,Lineup Type, Sim Dupes\n"
-                    )
-            elif self.site == "fd":
-                if self.use_contest_data:
-                    f.write(
-                        "QB,RB,RB,WR,WR,WR,TE,FLEX,DST,Fpts Proj,Field Fpts Proj,Ceiling,Salary,Win %,Top 10%,ROI%,Proj. Own. Product,Avg. Return,Stack1 Type,Stack2 Type,Players vs DST,Lineup Type, Sim Dupes\n"
-                    )
-                else:
-                    f.write(
-                        "QB,RB,RB,WR,WR,WR,TE,FLEX,DST,Fpts Proj,Field Fpts Proj,Ceiling,Salary,Win %,Top 10%,Proj. Own. Product,Stack1 Type,Stack2 Type,Players vs DST,Lineup Type, Sim Dupes\n"
-                    )
-
-            for fpts, lineup_str in unique.items():
-                f.write("%s\n" % lineup_str)
+        write_results(out_path, columns, self.output_format)
 
+        # player exposure, wins, top 1% finishes and returns over the whole field
+        order, (entries, wins, top1pct, roi) = player_totals(
+            lineups,
+            [self.field_counts, self.field_wins, self.field_top1pct, self.field_roi],
+            len(players),
+        )
+        top1PercentCount = (0.01) * self.field_size
+        entries = entries[order]
+        columns = [
+            ("Player", [players[i]["Name"].replace("#", "-") for i in order], None),
+            ("Position", ["/".join(players[i].get("Position")) for i in order], None),
+            ("Team", [players[i].get("Team") for i in order], None),
+            ("Win%", np.round(wins[order] / self.num_iterations * 100, 2), "{}%"),
+            (
+                "Top1%",
+                np.round(
+                    top1pct[order] / top1PercentCount / self.num_iterations * 100, 2
+                ),
+                "{}%",
+            ),
+            ("Sim. Own%", np.round(entries / self.field_size * 100, 2), "{}%"),
+            ("Proj. Own%", [players[i]["Ownership"] for i in order], "{}%"),
+            (
+                "Avg. Return",
+                np.round(roi[order] / entries / self.num_iterations, 2),
+                "${}",
+            ),
+        ]
         out_path = os.path.join(
             os.path.dirname(__file__),
             "../output/{}_gpp_sim_player_exposure_{}_{}.csv".format(
                 self.site, self.field_size, self.num_iterations
             ),
         )
-        with open(out_path, "w") as f:
-            f.write(
-                "Player,Position,Team,Win%,Top1%,Sim. Own%,Proj. Own%,Avg. Return\n"
-            )
-            unique_players = {}
-            for val in self.field_lineups.values():
-                for player in val["Lineup"]:
-                    if player not in unique_players:
-                        unique_players[player] = {
-                            "Wins": val["Wins"],
-                            "Top1Percent": val["Top1Percent"],
-                            "In": val['Count'],
-                            "ROI": val["ROI"],
-                        }
-                    else:
-                        unique_players[player]["Wins"] = (
-                            unique_players[player]["Wins"] + val["Wins"]
-                        )
-                        unique_players[player]["Top1Percent"] = (
-                            unique_players[player]["Top1Percent"] + val["Top1Percent"]
-                        )
-                        unique_players[player]["In"] = unique_players[player]["In"] + val['Count']
-                        unique_players[player]["ROI"] = (
-                            unique_players[player]["ROI"] + val["ROI"]
-                        )
-            top1PercentCount = (0.01) * self.field_size
-            for player, data in unique_players.items():
-                field_p = round(data["In"] / self.field_size * 100, 2)
-                win_p = round(data["Wins"] / self.num_iterations * 100, 2)
-                top10_p = round(data["Top1Percent"] / top1PercentCount / self.num_iterations  * 100, 2)
-                roi_p = round(data["ROI"] / data["In"] / self.num_iterations, 2)
-                for k, v in self.player_dict.items():
-                    if player == v["ID"]:
-                        proj_own = v["Ownership"]
-                        p_name = v["Name"]
-                        position = "/".join(v.get("Position"))
-                        team = v.get("Team")
-                        break
-                f.write(
-                    "{},{},{},{}%,{}%,{}%,{}%,${}\n".format(
-                        p_name.replace("#", "-"),
-                        position,
-                        team,
-                        win_p,
-                        top10_p,
-                        field_p,
-                        proj_own,
-                        roi_p,
-                    )
-                )
+        write_results(out_path, columns, self.output_format)
@@ -5,9 +5,15 @@ import datetime
 import pytz
 import timedelta
 import numpy as np
-import pulp as plp
 import copy
 import itertools
+from nfl_opto_utils import (
+    LineupSolver,
+    constraint_matrix,
+    correlated_projections,
+    parallel_lineups,
+    top_lineups,
+)
 from random import shuffle, choice
 from collections import Counter
 
@@ -15,7 +21,6 @@ from collections import Counter
 class NFL_Optimizer:
     site = None
     config = None
-    problem = None
     output_dir = None
     num_lineups = None
     num_uniques = None
@@ -46,8 +51,6 @@ class NFL_Optimizer:
         self.load_config()
         self.load_rules()
 
-        self.problem = plp.LpProblem("NFL", plp.LpMaximize)
-
         projection_path = os.path.join(
             os.path.dirname(__file__),
             "../{}_data/{}".format(site, self.config["projection_path"]),
@@ -134,6 +137,26 @@ class NFL_Optimizer:
         self.default_def_var = (
             self.config["default_def_var"] if "default_def_var" in self.config else 0.5
         )
+        self.solver = self.config["solver"] if "solver" in self.config else "cbc"
+        self.optimizer_processes = (
+            int(self.config["optimizer_processes"])
+            if "optimizer_processes" in self.config
+            else 1
+        )
+        self.correlated_randomness = (
+            bool(self.config["correlated_randomness"])
+            if "correlated_randomness" in self.config
+            else False
+        )
+        self.enumerate_lineups = (
+            bool(self.config["enumerate_lineups"])
+            if "enumerate_lineups" in self.config
+            else False
+        )
+        if self.enumerate_lineups and self.randomness_amount != 0:
+            print(
+                "enumerate_lineups only works without randomness, solving lineups one at a time instead."
+            )
 
     def assertPlayerDict(self):
         for p, s in list(self.player_dict.items()):
@@ -232,112 +255,59 @@ class NFL_Optimizer:
                     self.player_dict[(player_name, position, team)]
                 )
 
-    def optimize(self):
-        # Setup our linear programming equation - https://en.wikipedia.org/wiki/Linear_programming
-        # We will use PuLP as our solver - https://coin-or.github.io/pulp/
-
-        # We want to create a variable for each roster slot.
-        # There will be an index for each player and the variable will be binary (0 or 1) representing whether the player is included or excluded from the roster.
-        lp_variables = {
-            self.player_dict[(player, pos_str, team)]["ID"]: plp.LpVariable(
-                str(self.player_dict[(player, pos_str, team)]["ID"]), cat="Binary"
+    def build_model(self):
+        # the lineup model as (costs, A, lower, upper) with lower <= A @ x <= upper and
+        # one binary variable per player in player_dict order. each rule picks its
+        # players out of these attribute arrays instead of scanning player_dict
+        players = list(self.player_dict.values())
+        num_players = len(players)
+        names = np.array([p["Name"] for p in players])
+        positions = np.array([p["Position"] for p in players])
+        teams = np.array([p["Team"] for p in players])
+        opponents = np.array([p["Opponent"] for p in players])
+        matchups = np.array([p["Matchup"] for p in players])
+        salaries = np.array([p["Salary"] for p in players], dtype=np.float64)
+        opponent_of = dict(zip(teams, opponents))
+        rows = []
+
+        def add(columns, lower=-np.inf, upper=np.inf, coefs=None):
+            coefs = np.ones(len(columns)) if coefs is None else coefs
+            rows.append((columns, coefs, lower, upper))
+
+        def rule_players(team, rule_positions, rule_type):
+            # players at the rule's positions on the team's side of its game
+            if rule_type == "same-team":
+                sides = [team]
+            elif rule_type == "opp-team":
+                sides = [opponent_of[team]]
+            elif rule_type == "same-game":
+                sides = [team, opponent_of[team]]
+            else:
+                sides = []
+            return np.flatnonzero(
+                np.isin(teams, sides) & np.isin(positions, rule_positions)
             )
-            for (player, pos_str, team) in self.player_dict
-        }
 
-        # set the objective - maximize fpts & set randomness amount from config
-        if self.randomness_amount != 0:
-            self.problem += (
-                plp.lpSum(
-                    np.random.normal(
-                        self.player_dict[(player, pos_str, team)]["Fpts"],
-                        (
-                            self.player_dict[(player, pos_str, team)]["StdDev"]
-                            * self.randomness_amount
-                            / 100
-                        ),
-                    )
-                    * lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                    for (player, pos_str, team) in self.player_dict
-                ),
-                "Objective",
-            )
-        else:
-            self.problem += (
-                plp.lpSum(
-                    self.player_dict[(player, pos_str, team)]["Fpts"]
-                    * lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                    for (player, pos_str, team) in self.player_dict
-                ),
-                "Objective",
-            )
+        # set the objective - maximize fpts, optimize() swaps in randomized projections
+        costs = np.array([p["Fpts"] for p in players], dtype=np.float64)
 
         # Set the salary constraints
         max_salary = 50000 if self.site == "dk" else 60000
         min_salary = 45000 if self.site == "dk" else 55000
-        self.problem += (
-            plp.lpSum(
-                self.player_dict[(player, pos_str, team)]["Salary"]
-                * lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                for (player, pos_str, team) in self.player_dict
-            )
-            <= max_salary,
-            "Max Salary",
-        )
-        self.problem += (
-            plp.lpSum(
-                self.player_dict[(player, pos_str, team)]["Salary"]
-                * lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                for (player, pos_str, team) in self.player_dict
-            )
-            >= min_salary,
-            "Min Salary",
-        )
+        add(np.arange(num_players), min_salary, max_salary, salaries)
 
         # Address limit rules if any
         for limit, groups in self.at_least.items():
             for group in groups:
-                tuple_name_list = []
-                for key, value in self.player_dict.items():
-                    if value["Name"] in group:
-                        tuple_name_list.append(key)
-
-                self.problem += (
-                    plp.lpSum(
-                        lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                        for (player, pos_str, team) in tuple_name_list
-                    )
-                    >= int(limit),
-                    f"At least {limit} players {tuple_name_list}",
-                )
+                add(np.flatnonzero(np.isin(names, group)), lower=int(limit))
 
         for limit, groups in self.at_most.items():
             for group in groups:
-                tuple_name_list = []
-                for key, value in self.player_dict.items():
-                    if value["Name"] in group:
-                        tuple_name_list.append(key)
-
-                self.problem += (
-                    plp.lpSum(
-                        lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                        for (player, pos_str, team) in tuple_name_list
-                    )
-                    <= int(limit),
-                    f"At most {limit} players {tuple_name_list}",
-                )
+                add(np.flatnonzero(np.isin(names, group)), upper=int(limit))
 
         # Address team limits
         for teamIdent, limit in self.team_limits.items():
-            self.problem += (
-                plp.lpSum(
-                    lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                    for (player, pos_str, team) in self.player_dict
-                    if self.player_dict[(player, pos_str, team)]["Team"] == teamIdent
-                )
-                <= int(limit),
-                f"Team limit {teamIdent} {limit}",
-            )
+            add(np.flatnonzero(teams == teamIdent), upper=int(limit))
 
         if self.global_team_limit is not None:
             team_limit = int(self.global_team_limit)
@@ -345,182 +315,59 @@ class NFL_Optimizer:
             team_limit = 5 if self.site == "dk" else 4
 
         for limit_team in self.team_list:
-            self.problem += (
-                plp.lpSum(
-                    lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                    for (player, pos_str, team) in self.player_dict
-                    if self.player_dict[(player, pos_str, team)]["Team"] == limit_team
-                )
-                <= team_limit,
-                f"Global team limit {limit_team} {team_limit}",
-            )
+            add(np.flatnonzero(teams == limit_team), upper=team_limit)
 
         # Address matchup limits
         if self.matchup_limits is not None:
             for matchup, limit in self.matchup_limits.items():
-                players_in_game = []
-                for key, value in self.player_dict.items():
-                    if value["Matchup"] == matchup:
-                        players_in_game.append(key)
-                self.problem += (
-                    plp.lpSum(
-                        lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                        for (player, pos_str, team) in players_in_game
-                    )
-                    <= int(limit),
-                    f"Matchup limit {matchup} {limit}",
-                )
+                add(np.flatnonzero(matchups == matchup), upper=int(limit))
 
         if self.matchup_at_least is not None:
             for matchup, limit in self.matchup_at_least.items():
-                players_in_game = []
-                for key, value in self.player_dict.items():
-                    if value["Matchup"] == matchup:
-                        players_in_game.append(key)
-
-                self.problem += (
-                    plp.lpSum(
-                        lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                        for (player, pos_str, team) in players_in_game
-                    )
-                    >= int(limit),
-                    f"Matchup at least {matchup} {limit}",
-                )
+                add(np.flatnonzero(matchups == matchup), lower=int(limit))
 
         # Address player vs dst (only applies to QB vs DST)
         if not self.allow_qb_vs_dst:
-            for team, players in self.players_by_team.items():
-                for qb in players.get("QB", []):
-                    opponent = qb["Opponent"]
-                    opposing_dsts = self.players_by_team.get(opponent, {}).get(
-                        "DST", []
-                    )
-                    for dst in opposing_dsts:
-                        self.problem += (
-                            plp.lpSum(lp_variables[qb["ID"]] + lp_variables[dst["ID"]])
-                            <= 1,
-                            f"No QB vs DST {qb['Name']} vs {dst['Name']}",
-                        )
-
-                # self.problem += (
-                #     plp.lpSum(
-                #         lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                #         for (player, pos_str, team) in players_in_game
-                #     )
-                #     >= int(limit),
-                #     f"Matchup at least {matchup} {limit}",
-                # )
+            qb_vs_dst = (
+                (positions == "QB")[:, None]
+                & (positions == "DST")[None, :]
+                & (opponents[:, None] == teams[None, :])
+            )
+            for qb, dst in np.argwhere(qb_vs_dst):
+                add(np.array([qb, dst]), upper=1)
 
         # Address stack rules
         for rule_type in self.stack_rules:
             for rule in self.stack_rules[rule_type]:
                 if rule_type == "pair":
-                    pos_key = rule["key"]
-                    stack_positions = rule["positions"]
-                    count = rule["count"]
-                    stack_type = rule["type"]
-                    excluded_teams = rule["exclude_teams"]
+                    count = int(rule["count"])
 
                     # Iterate each team, less excluded teams, and apply the rule for each key player pos
-                    for team in self.players_by_team:
-                        if team in excluded_teams:
+                    for team in self.team_list:
+                        if team in rule["exclude_teams"]:
                             continue
 
-                        pos_key_players = self.players_by_team[team][pos_key]
+                        pos_key_players = np.flatnonzero(
+                            (teams == team) & (positions == rule["key"])
+                        )
                         if len(pos_key_players) == 0:
                             continue
 
-                        opp_team = pos_key_players[0]["Opponent"]
-
+                        stack = rule_players(team, rule["positions"], rule["type"])
                         for pos_key_player in pos_key_players:
-                            stack_players = []
-                            if stack_type == "same-team":
-                                for pos in stack_positions:
-                                    stack_players.append(
-                                        self.players_by_team[team][pos]
-                                    )
-
-                            elif stack_type == "opp-team":
-                                for pos in stack_positions:
-                                    stack_players.append(
-                                        self.players_by_team[opp_team][pos]
-                                    )
-
-                            elif stack_type == "same-game":
-                                for pos in stack_positions:
-                                    stack_players.append(
-                                        self.players_by_team[team][pos]
-                                    )
-                                    stack_players.append(
-                                        self.players_by_team[opp_team][pos]
-                                    )
-
-                            stack_players = self.flatten(stack_players)
                             # player cannot exist as both pos_key_player and be present in the stack_players
-                            stack_players = [
-                                p
-                                for p in stack_players
-                                if not (
-                                    p["Name"] == pos_key_player["Name"]
-                                    and p["Position"] == pos_key_player["Position"]
-                                    and p["Team"] == pos_key_player["Team"]
-                                )
-                            ]
-                            pos_key_player_tuple = None
-                            stack_players_tuples = []
-                            for key, value in self.player_dict.items():
-                                if (
-                                    value["Name"] == pos_key_player["Name"]
-                                    and value["Position"] == pos_key_player["Position"]
-                                    and value["Team"] == pos_key_player["Team"]
-                                ):
-                                    pos_key_player_tuple = key
-                                elif (
-                                    value["Name"],
-                                    value["Position"],
-                                    value["Team"],
-                                ) in [
-                                    (player["Name"], player["Position"], player["Team"])
-                                    for player in stack_players
-                                ]:
-                                    stack_players_tuples.append(key)
-
-                            if (
-                                pos_key_player_tuple is None
-                                or len(stack_players_tuples) == 0
-                            ):
+                            stack_players = stack[stack != pos_key_player]
+                            if len(stack_players) == 0:
                                 continue
                             # [sum of stackable players] + -n*[stack_player] >= 0
-                            self.problem += (
-                                plp.lpSum(
-                                    [
-                                        lp_variables[
-                                            self.player_dict[(player, pos_str, team)][
-                                                "ID"
-                                            ]
-                                        ]
-                                        for (
-                                            player,
-                                            pos_str,
-                                            team,
-                                        ) in stack_players_tuples
-                                    ]
-                                    + [
-                                        -count
-                                        * lp_variables[
-                                            self.player_dict[pos_key_player_tuple]["ID"]
-                                        ]
-                                    ]
-                                )
-                                >= 0,
-                                f"Stack rule {pos_key_player_tuple} {stack_players_tuples} {count}",
+                            add(
+                                np.append(stack_players, pos_key_player),
+                                lower=0,
+                                coefs=np.append(np.ones(len(stack_players)), -count),
                             )
 
                 elif rule_type == "limit":
-                    limit_positions = rule["positions"]  # ["RB"]
-                    stack_type = rule["type"]
-                    count = rule["count"]
-                    excluded_teams = rule["exclude_teams"]
+                    count = int(rule["count"])
                     if "unless_positions" in rule or "unless_type" in rule:
                         unless_positions = rule["unless_positions"]
                         unless_type = rule["unless_type"]
@@ -529,320 +376,143 @@ class NFL_Optimizer:
                         unless_type = None
 
                     # Iterate each team, less excluded teams, and apply the rule for each key player pos
-                    for team in self.players_by_team:
-                        opp_team = self.players_by_team[team]["QB"]
-
-                        if len(opp_team) == 0:
+                    for team in self.team_list:
+                        if not np.any((teams == team) & (positions == "QB")):
                             continue
-
-                        opp_team = opp_team[0]["Opponent"]
-                        if team in excluded_teams:
+                        if team in rule["exclude_teams"]:
                             continue
 
-                        limit_players = []
-                        if stack_type == "same-team":
-                            for pos in limit_positions:
-                                limit_players.append(self.players_by_team[team][pos])
-
-                        elif stack_type == "opp-team":
-                            for pos in limit_positions:
-                                limit_players.append(
-                                    self.players_by_team[opp_team][pos]
-                                )
-
-                        elif stack_type == "same-game":
-                            for pos in limit_positions:
-                                limit_players.append(self.players_by_team[team][pos])
-                                limit_players.append(
-                                    self.players_by_team[opp_team][pos]
-                                )
-
-                        limit_players = self.flatten(limit_players)
+                        limit_players = rule_players(
+                            team, rule["positions"], rule["type"]
+                        )
+                        if len(limit_players) == 0:
+                            continue
                         if unless_positions is None or unless_type is None:
                             # [sum of limit players] + <= n
-                            limit_players_tuples = []
-                            for key, value in self.player_dict.items():
-                                if (
-                                    value["Name"],
-                                    value["Position"],
-                                    value["Team"],
-                                ) in [
-                                    (player["Name"], player["Position"], player["Team"])
-                                    for player in limit_players
-                                ]:
-                                    limit_players_tuples.append(key)
-
-                            if len(limit_players_tuples) == 0:
-                                continue
-                            self.problem += (
-                                plp.lpSum(
-                                    [
-                                        lp_variables[
-                                            self.player_dict[(player, pos_str, team)][
-                                                "ID"
-                                            ]
-                                        ]
-                                        for (
-                                            player,
-                                            pos_str,
-                                            team,
-                                        ) in limit_players_tuples
-                                    ]
-                                )
-                                <= int(count),
-                                f"Limit rule {limit_players_tuples} {count}",
-                            )
-                        else:
-                            unless_players = []
-                            if unless_type == "same-team":
-                                for pos in unless_positions:
-                                    unless_players.append(
-                                        self.players_by_team[team][pos]
-                                    )
-                            elif unless_type == "opp-team":
-                                for pos in unless_positions:
-                                    if opp_team in self.players_by_team:
-                                        unless_players.append(
-                                            self.players_by_team[opp_team][pos]
-                                        )
-                            elif unless_type == "same-game":
-                                for pos in unless_positions:
-                                    unless_players.append(
-                                        self.players_by_team[team][pos]
-                                    )
-                                    if opp_team in self.players_by_team:
-                                        unless_players.append(
-                                            self.players_by_team[opp_team][pos]
-                                        )
-
-                            unless_players = self.flatten(unless_players)
-
-                            # player cannot exist as both limit_players and unless_players
-                            unless_players = [
-                                p
-                                for p in unless_players
-                                if not any(
-                                    p["Name"] == key_player["Name"]
-                                    and p["Position"] == key_player["Position"]
-                                    and p["Team"] == key_player["Team"]
-                                    for key_player in limit_players
-                                )
-                            ]
-
-                            limit_players_tuples = []
-                            unless_players_tuples = []
-                            for key, value in self.player_dict.items():
-                                if (
-                                    value["Name"],
-                                    value["Position"],
-                                    value["Team"],
-                                ) in [
-                                    (player["Name"], player["Position"], player["Team"])
-                                    for player in limit_players
-                                ]:
-                                    limit_players_tuples.append(key)
-                                elif (
-                                    value["Name"],
-                                    value["Position"],
-                                    value["Team"],
-                                ) in [
-                                    (player["Name"], player["Position"], player["Team"])
-                                    for player in unless_players
-                                ]:
-                                    unless_players_tuples.append(key)
-
-                            # [sum of limit players] + -count(unless_players)*[unless_players] <= n
-                            if len(limit_players_tuples) == 0:
-                                continue
-                            self.problem += (
-                                plp.lpSum(
-                                    [
-                                        lp_variables[
-                                            self.player_dict[(player, pos_str, team)][
-                                                "ID"
-                                            ]
-                                        ]
-                                        for (
-                                            player,
-                                            pos_str,
-                                            team,
-                                        ) in limit_players_tuples
-                                    ]
-                                    - int(count)
-                                    * plp.lpSum(
-                                        [
-                                            lp_variables[
-                                                self.player_dict[
-                                                    (player, pos_str, team)
-                                                ]["ID"]
-                                            ]
-                                            for (
-                                                player,
-                                                pos_str,
-                                                team,
-                                            ) in unless_players_tuples
-                                        ]
-                                    )
+                            add(limit_players, upper=count)
+                            continue
+
+                        # player cannot exist as both limit_players and unless_players
+                        unless_players = np.setdiff1d(
+                            rule_players(team, unless_positions, unless_type),
+                            limit_players,
+                        )
+                        # [sum of limit players] + -count(unless_players)*[unless_players] <= n
+                        add(
+                            np.concatenate((limit_players, unless_players)),
+                            upper=count,
+                            coefs=np.concatenate(
+                                (
+                                    np.ones(len(limit_players)),
+                                    np.full(len(unless_players), -count),
                                 )
-                                <= int(count),
-                                f"Limit rule {limit_players_tuples} unless {unless_players_tuples} {count}",
-                            )
+                            ),
+                        )
 
         # Need exactly 1 QB
-        self.problem += (
-            plp.lpSum(
-                lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                for (player, pos_str, team) in self.player_dict
-                if "QB" == self.player_dict[(player, pos_str, team)]["Position"]
-            )
-            == 1,
-            f"QB limit 1",
-        )
+        add(np.flatnonzero(positions == "QB"), 1, 1)
 
         # Need at least 2 RB, up to 3 if using FLEX
-        self.problem += (
-            plp.lpSum(
-                lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                for (player, pos_str, team) in self.player_dict
-                if "RB" == self.player_dict[(player, pos_str, team)]["Position"]
-            )
-            >= 2,
-            f"RB >= 2",
-        )
-        self.problem += (
-            plp.lpSum(
-                lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                for (player, pos_str, team) in self.player_dict
-                if "RB" == self.player_dict[(player, pos_str, team)]["Position"]
-            )
-            <= 3,
-            f"RB <= 3",
-        )
+        add(np.flatnonzero(positions == "RB"), 2, 3)
 
         # Need at least 3 WR, up to 4 if using FLEX
-        self.problem += (
-            plp.lpSum(
-                lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                for (player, pos_str, team) in self.player_dict
-                if "WR" == self.player_dict[(player, pos_str, team)]["Position"]
-            )
-            >= 3,
-            f"WR >= 3",
-        )
-        self.problem += (
-            plp.lpSum(
-                lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                for (player, pos_str, team) in self.player_dict
-                if "WR" == self.player_dict[(player, pos_str, team)]["Position"]
-            )
-            <= 4,
-            f"WR <= 4",
-        )
+        add(np.flatnonzero(positions == "WR"), 3, 4)
 
         # Need at least 1 TE, up to 2 if using FLEX
         if self.use_double_te:
-            self.problem += (
-                plp.lpSum(
-                    lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                    for (player, pos_str, team) in self.player_dict
-                    if "TE" == self.player_dict[(player, pos_str, team)]["Position"]
-                )
-                >= 1,
-                f"TE >= 1",
-            )
-            self.problem += (
-                plp.lpSum(
-                    lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                    for (player, pos_str, team) in self.player_dict
-                    if "TE" == self.player_dict[(player, pos_str, team)]["Position"]
-                )
-                <= 2,
-                f"TE <= 2",
-            )
+            add(np.flatnonzero(positions == "TE"), 1, 2)
         else:
-            self.problem += (
-                plp.lpSum(
-                    lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                    for (player, pos_str, team) in self.player_dict
-                    if "TE" == self.player_dict[(player, pos_str, team)]["Position"]
-                )
-                == 1,
-                f"TE == 1",
-            )
+            add(np.flatnonzero(positions == "TE"), 1, 1)
 
         # Need exactly 1 DST
-        self.problem += (
-            plp.lpSum(
-                lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                for (player, pos_str, team) in self.player_dict
-                if "DST" == self.player_dict[(player, pos_str, team)]["Position"]
-            )
-            == 1,
-            f"DST == 1",
-        )
+        add(np.flatnonzero(positions == "DST"), 1, 1)
 
         # Can only roster 9 total players
-        self.problem += (
-            plp.lpSum(
-                lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                for (player, pos_str, team) in self.player_dict
+        add(np.arange(num_players), 9, 9)
+
+        return (costs,) + constraint_matrix(rows, num_players)
+
+    def optimize(self):
+        model = self.build_model()
+
+        # Crunch! the model is handed to the solver once, each lineup only adds a cut
+        # and, with randomness, swaps the projections
+        player_keys = list(self.player_dict)
+        # with randomness every lineup gets its own row of projections, drawn up front
+        projections = None
+        if self.randomness_amount != 0:
+            projections = self.draw_projections(self.num_lineups)
+        lineups = None
+        if self.optimizer_processes != 1 and projections is not None:
+            # without randomness every worker would solve the same projections
+            lineups = parallel_lineups(
+                model,
+                self.solver,
+                projections,
+                9 - self.num_uniques,
+                self.optimizer_processes or None,
             )
-            == 9,
-            f"Total Players == 9",
-        )
+        elif self.enumerate_lineups and projections is None:
+            # the same projections for every lineup, so the best ones can be listed
+            positions = ["QB", "DST", "TE", "RB", "WR"]
+            groups = [positions.index(p["Position"]) for p in self.player_dict.values()]
+            # QB, DST, TE, RB, WR counts with the FLEX at each position it can take
+            rosters = [[1, 1, 1, 3, 3], [1, 1, 1, 2, 4]]
+            if self.use_double_te:
+                rosters.append([1, 1, 2, 2, 3])
+            lineups = top_lineups(
+                model, groups, rosters, self.num_lineups, 9 - self.num_uniques
+            )
+            if lineups is None:
+                print(
+                    "Too many lineups to list within the requested uniques, solving them one at a time instead."
+                )
+        if lineups is not None:
+            for selected, fpts_used in lineups:
+                self.lineups.append(([player_keys[j] for j in selected], fpts_used))
+            if len(self.lineups) < self.num_lineups:
+                print(
+                    "Infeasibility reached - only generated {} lineups out of {}. Continuing with export.".format(
+                        len(self.lineups), self.num_lineups
+                    )
+                )
+            return
 
-        # Crunch!
+        solver = LineupSolver(model, self.solver)
         for i in range(self.num_lineups):
-            try:
-                self.problem.solve(plp.PULP_CBC_CMD(msg=0))
-            except plp.PulpSolverError:
+            if projections is not None:
+                solver.set_objective(projections[i])
+            selected = solver.solve()
+            if selected is None:
                 print(
                     "Infeasibility reached - only generated {} lineups out of {}. Continuing with export.".format(
-                        len(self.num_lineups), self.num_lineups
+                        len(self.lineups), self.num_lineups
                     )
                 )
+                break
 
             # Get the lineup and add it to our list
-            player_ids = [
-                player for player in lp_variables if lp_variables[player].varValue != 0
-            ]
-            players = []
-            for key, value in self.player_dict.items():
-                if value["ID"] in player_ids:
-                    players.append(key)
-
-            fpts_used = self.problem.objective.value()
+            players = [player_keys[j] for j in selected]
+            fpts_used = solver.costs[selected].sum()
             self.lineups.append((players, fpts_used))
 
             if i % 100 == 0:
                 print(i)
 
             # Ensure this lineup isn't picked again
-            self.problem += (
-                plp.lpSum(
-                    lp_variables[self.player_dict[player]["ID"]] for player in players
-                )
-                <= len(players) - self.num_uniques,
-                f"Lineup {i}",
-            )
-
-            # Set a new random fpts projection within their distribution
-            if self.randomness_amount != 0:
-                self.problem += (
-                    plp.lpSum(
-                        np.random.normal(
-                            self.player_dict[(player, pos_str, team)]["Fpts"],
-                            (
-                                self.player_dict[(player, pos_str, team)]["StdDev"]
-                                * self.randomness_amount
-                                / 100
-                            ),
-                        )
-                        * lp_variables[self.player_dict[(player, pos_str, team)]["ID"]]
-                        for (player, pos_str, team) in self.player_dict
-                    ),
-                    "Objective",
-                )
+            solver.exclude(selected, len(players) - self.num_uniques)
+
+    def draw_projections(self, num_draws):
+        # one row of randomized projections per lineup. with correlated_randomness the
+        # players of each game are drawn together, so stacks rise and fall as one
+        players = list(self.player_dict.values())
+        if self.correlated_randomness:
+            return correlated_projections(players, self.randomness_amount, num_draws)
+        return np.random.normal(
+            [p["Fpts"] for p in players],
+            [p["StdDev"] * self.randomness_amount / 100 for p in players],
+            size=(num_draws, len(players)),
+        )
 
     def output(self):
         print("Lineups done generating. Outputting.")
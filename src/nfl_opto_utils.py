@@ -0,0 +1,537 @@
+import multiprocessing as mp
+import numpy as np
+import pulp as plp
+from collections import deque
+from numba import njit
+from scipy import sparse
+from nfl_sim_utils import (
+    POSITION_CORRELATIONS,
+    SAME_POSITION_CORRELATIONS,
+    build_correlation_matrix,
+    covariance_factor,
+)
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+
+# solver helpers shared by the classic and showdown optimizers
+
+
+# the most lineups top_lineups holds for one band of scores before it gives up
+MAX_ENUMERATED_LINEUPS = 1 << 20
+
+
+def correlated_projections(players, randomness, num_draws):
+    # (num_draws, players) projections drawn a game at a time from the covariance the
+    # simulators would build, with every StdDev scaled down to randomness percent.
+    # players are dicts with Fpts, StdDev, Position, Team, Name and Matchup
+    fpts = np.array([p["Fpts"] for p in players], dtype=np.float64)
+    std_devs = np.array([p["StdDev"] * randomness / 100 for p in players])
+    matchups = np.array([p["Matchup"] for p in players])
+    draws = np.empty((num_draws, len(players)))
+    for matchup in dict.fromkeys(matchups):
+        game = np.flatnonzero(matchups == matchup)
+        corr = build_correlation_matrix(
+            [
+                dict(
+                    players[j],
+                    Position=[players[j]["Position"]],
+                    Correlations=POSITION_CORRELATIONS.get(players[j]["Position"], {}),
+                )
+                for j in game
+            ],
+            SAME_POSITION_CORRELATIONS,
+        )
+        _, factor = covariance_factor(corr * np.outer(std_devs[game], std_devs[game]))
+        normals = np.random.standard_normal((num_draws, len(game)))
+        draws[:, game] = fpts[game] + normals @ factor.T
+    return draws
+
+
+def constraint_matrix(rows, num_vars):
+    # rows of (columns, coefficients, lower, upper) as lower <= A @ x <= upper, with A
+    # a sparse (constraints, variables) matrix
+    lengths = [len(columns) for columns, _, _, _ in rows]
+    matrix = sparse.csr_matrix(
+        (
+            np.concatenate([[]] + [coefs for _, coefs, _, _ in rows]),
+            np.concatenate([[]] + [columns for columns, _, _, _ in rows]).astype(int),
+            np.concatenate(([0], np.cumsum(lengths))),
+        ),
+        shape=(len(rows), num_vars),
+    )
+    lower = np.array([row[2] for row in rows], dtype=np.float64)
+    upper = np.array([row[3] for row in rows], dtype=np.float64)
+    return matrix, lower, upper
+
+
+def problem_matrix(problem, variables):
+    # a pulp problem as (costs, A, lower, upper) with lower <= A @ x <= upper, the
+    # columns follow the order of variables
+    column = {var.name: j for j, var in enumerate(variables)}
+    costs = np.array([problem.objective.get(var, 0) for var in variables])
+    rows = []
+    for constraint in problem.constraints.values():
+        columns = [column[var.name] for var in constraint]
+        coefs = np.array(list(constraint.values()), dtype=np.float64)
+        # pulp keeps every constraint as expression + constant (sense) 0
+        bound = -constraint.constant
+        rows.append(
+            (
+                np.array(columns, dtype=int),
+                coefs,
+                bound if constraint.sense != plp.LpConstraintLE else -np.inf,
+                bound if constraint.sense != plp.LpConstraintGE else np.inf,
+            )
+        )
+    return (costs.astype(np.float64),) + constraint_matrix(rows, len(variables))
+
+
+def matrix_problem(model):
+    # the other way around, a pulp problem over one binary variable per column
+    costs, matrix, lower, upper = model
+    variables = [plp.LpVariable(f"x{j}", cat="Binary") for j in range(len(costs))]
+    problem = plp.LpProblem("NFL", plp.LpMaximize)
+    problem += plp.LpAffineExpression(zip(variables, costs.tolist())), "Objective"
+    for i in range(matrix.shape[0]):
+        row = matrix.getrow(i)
+        expression = plp.LpAffineExpression(
+            zip([variables[j] for j in row.indices], row.data.tolist())
+        )
+        if lower[i] == upper[i]:
+            problem += expression == lower[i], f"Row {i}"
+            continue
+        if lower[i] > -np.inf:
+            problem += expression >= lower[i], f"Row {i} lower"
+        if upper[i] < np.inf:
+            problem += expression <= upper[i], f"Row {i} upper"
+    return problem, variables
+
+
+class LineupSolver:
+    # one lineup MILP kept alive between solves. the model is (costs, A, lower, upper)
+    # over binary variables, every solve returns the indices of the chosen variables,
+    # exclude() cuts a lineup off and set_objective() swaps the projections, so
+    # nothing is rebuilt between lineups.
+    # "highs" solves in process with highspy and warm starts each solve from the best
+    # earlier incumbent that is still allowed. "cbc" (or highspy not being installed)
+    # uses pulp's CBC, which writes the model to disk and solves it in a new process
+    # every time
+    def __init__(self, model, backend="cbc"):
+        costs, matrix, lower, upper = model
+        self.costs = np.asarray(costs, dtype=np.float64)
+        if backend == "highs" and highspy is None:
+            print("highspy is not installed, solving with CBC")
+            backend = "cbc"
+        self.backend = backend
+        self.num_cuts = 0
+        if self.backend == "cbc":
+            self.problem, self.variables = matrix_problem(model)
+            return
+
+        num_vars = len(self.costs)
+        self.highs = highspy.Highs()
+        self.highs.setOptionValue("output_flag", False)
+        # solve every lineup to optimality so they come out best first
+        self.highs.setOptionValue("mip_rel_gap", 0)
+        # keep the incumbents found on the way to each optimum for warm starts
+        self.highs.setOptionValue("mip_improving_solution_save", True)
+        self.highs.addVars(num_vars, np.zeros(num_vars), np.ones(num_vars))
+        columns = np.arange(num_vars, dtype=np.int32)
+        self.highs.changeColsIntegrality(
+            num_vars,
+            columns,
+            np.full(num_vars, highspy.HighsVarType.kInteger),
+        )
+        self.highs.changeObjectiveSense(highspy.ObjSense.kMaximize)
+        self.highs.changeColsCost(num_vars, columns, self.costs)
+        self.highs.addRows(
+            matrix.shape[0],
+            lower,
+            upper,
+            matrix.nnz,
+            matrix.indptr.astype(np.int32),
+            matrix.indices.astype(np.int32),
+            matrix.data.astype(np.float64),
+        )
+        # the chosen indices of every lineup cut off so far with the most players each
+        # may share with a new lineup, earlier incumbents to warm start from and how
+        # many of the cuts those have been checked against
+        self.cuts = []
+        self.incumbents = np.zeros((0, num_vars), dtype=np.int8)
+        self.checked = 0
+
+    @staticmethod
+    def init_worker(model, backend, taken, shape):
+        # every worker process builds its own copy of the model once and keeps it.
+        # taken is the shared (lineups, variables) matrix the accepted lineups are
+        # written to
+        LineupSolver.worker = LineupSolver(model, backend)
+        LineupSolver.taken = np.frombuffer(taken, dtype=np.int8).reshape(shape)
+
+    @staticmethod
+    def solve_worker(costs, num_accepted, max_overlap):
+        # the first num_accepted rows of taken are the lineups accepted so far, the
+        # worker only cuts off the ones it hasn't seen yet before solving with this
+        # task's projections
+        solver = LineupSolver.worker
+        for row in LineupSolver.taken[solver.num_cuts : num_accepted]:
+            solver.exclude(np.flatnonzero(row), max_overlap)
+        solver.set_objective(costs)
+        return solver.solve()
+
+    def set_objective(self, costs):
+        self.costs = np.asarray(costs, dtype=np.float64)
+        if self.backend == "cbc":
+            self.problem.setObjective(
+                plp.LpAffineExpression(zip(self.variables, self.costs))
+            )
+        else:
+            self.highs.changeColsCost(
+                len(self.costs), np.arange(len(self.costs), dtype=np.int32), self.costs
+            )
+
+    def exclude(self, selected, max_overlap):
+        # at most max_overlap of the selected variables may be chosen together again
+        if self.backend == "cbc":
+            self.problem += (
+                plp.lpSum(self.variables[j] for j in selected) <= max_overlap,
+                f"Lineup {self.num_cuts}",
+            )
+        else:
+            selected = np.asarray(selected, dtype=np.int32)
+            self.highs.addRow(
+                -np.inf, max_overlap, len(selected), selected, np.ones(len(selected))
+            )
+            self.cuts.append((selected, max_overlap))
+        self.num_cuts += 1
+
+    def solve(self):
+        # indices of the chosen variables, None when no lineup is feasible anymore
+        if self.backend == "cbc":
+            try:
+                self.problem.solve(plp.PULP_CBC_CMD(msg=0))
+            except plp.PulpSolverError:
+                return None
+            if self.problem.status != plp.LpStatusOptimal:
+                return None
+            return np.array(
+                [j for j, var in enumerate(self.variables) if var.varValue > 0.5]
+            )
+
+        self.warm_start()
+        self.highs.run()
+        if self.highs.getModelStatus() != highspy.HighsModelStatus.kOptimal:
+            return None
+        values = np.array(self.highs.getSolution().col_value)
+        saved = np.array(
+            [s.col_value for s in self.highs.getSavedMipSolutions()]
+        ).reshape(-1, len(self.costs))
+        # every incumbent is feasible with all the cuts made so far
+        self.incumbents = np.vstack((self.incumbents, saved > 0.5))[-64:]
+        return np.flatnonzero(values > 0.5)
+
+    def warm_start(self):
+        # the best earlier incumbent under the current projections that none of the
+        # cuts has ruled out since. the other constraints haven't changed, so it is a
+        # feasible lineup for highs to start from. cuts only pile up, so an incumbent
+        # only has to be checked against the ones added since the last solve
+        for selected, max_overlap in self.cuts[self.checked :]:
+            allowed = self.incumbents[:, selected].sum(axis=1) <= max_overlap
+            self.incumbents = self.incumbents[allowed]
+        self.checked = len(self.cuts)
+        if len(self.incumbents) == 0:
+            return
+        best = np.argmax(self.incumbents @ self.costs)
+        start = highspy.HighsSolution()
+        start.col_value = self.incumbents[best].astype(np.float64).tolist()
+        start.value_valid = True
+        self.highs.setSolution(start)
+
+
+def parallel_lineups(model, backend, projections, max_overlap, processes=None):
+    # solves a lineup for every row of projections in worker processes, each with
+    # its own copy of the model. the results are checked here in the order the tasks
+    # were sent: a lineup that shares more than max_overlap variables with one that
+    # was accepted while it was being solved goes back to the workers with the same
+    # projections and the newer cuts. accepted lineups are written to a matrix the
+    # workers share, so a task only says how many of its rows to cut off. returns
+    # (selected indices, projected points)
+    num_lineups, num_vars = projections.shape
+    shared = mp.RawArray("b", num_lineups * num_vars)
+    taken = np.frombuffer(shared, dtype=np.int8).reshape(num_lineups, num_vars)
+    lineups = []
+    with mp.Pool(
+        processes,
+        initializer=LineupSolver.init_worker,
+        initargs=(model, backend, shared, (num_lineups, num_vars)),
+    ) as pool:
+        pending = deque()
+
+        def submit(costs):
+            task = (costs, len(lineups), max_overlap)
+            pending.append((costs, pool.apply_async(LineupSolver.solve_worker, task)))
+
+        draws = iter(projections)
+        for _ in range(min(processes or mp.cpu_count(), num_lineups)):
+            submit(next(draws))
+        while pending and len(lineups) < num_lineups:
+            costs, result = pending.popleft()
+            selected = result.get()
+            if selected is None:
+                # the worker already had every cut sent with the task, more cuts
+                # can't make the model feasible again
+                break
+            overlap = taken[: len(lineups), selected].sum(axis=1)
+            if overlap.max(initial=0) > max_overlap:
+                submit(costs)
+                continue
+            taken[len(lineups), selected] = 1
+            lineups.append((selected, costs[selected].sum()))
+            if len(lineups) + len(pending) < num_lineups:
+                submit(next(draws))
+    return lineups
+
+
+@njit(cache=True)
+def suffix_sums(values, roster_size):
+    # values is (rows, players). best[p, k, r] is the largest sum of k values of row r
+    # among players p and later, worst[p, k, r] the smallest, -inf and inf when fewer
+    # than k players are left
+    num_rows, num_players = values.shape
+    best = np.full((num_players + 1, roster_size + 1, num_rows), -np.inf)
+    worst = np.full((num_players + 1, roster_size + 1, num_rows), np.inf)
+    best[:, 0, :] = 0
+    worst[:, 0, :] = 0
+    for p in range(num_players - 1, -1, -1):
+        for k in range(1, roster_size + 1):
+            for r in range(num_rows):
+                value = values[r, p]
+                best[p, k, r] = max(best[p + 1, k, r], best[p + 1, k - 1, r] + value)
+                worst[p, k, r] = min(worst[p + 1, k, r], worst[p + 1, k - 1, r] + value)
+    return best, worst
+
+
+@njit(cache=True)
+def enumerate_lineups(
+    costs,
+    columns,
+    lower,
+    upper,
+    best,
+    worst,
+    slot_groups,
+    group_start,
+    group_end,
+    threshold,
+    above,
+    lineups,
+    scores,
+    count,
+    cut_short,
+):
+    # depth first search over every lineup scoring at least threshold and less than
+    # above that fills the slots with players of slot_groups. players are sorted by
+    # group and cost within it, a slot takes players of its group after the one in
+    # the slot before it. the bound adds the next best players of the group for its
+    # remaining slots and the best players of every later group, so once a player
+    # falls short no later player of the group does better. a player is only added
+    # when every row can still end up within its bounds with the spots that are
+    # left. lineups are written from
+    # count on, returns the new count. the search stops once count passes
+    # len(scores), so a count past it only says the lineups didn't fit. cut_short[0]
+    # is set when the threshold left any lineups out
+    num_players, num_rows = columns.shape
+    roster_size = len(slot_groups)
+    cumulative = np.zeros(num_players + 1)
+    cumulative[1:] = np.cumsum(costs)
+    # slots of the same group still to fill after each slot, and the best score the
+    # groups after it could add
+    same_after = np.zeros(roster_size, dtype=np.int64)
+    later_groups = np.zeros(roster_size + 1)
+    for d in range(roster_size - 2, -1, -1):
+        if slot_groups[d + 1] == slot_groups[d]:
+            same_after[d] = same_after[d + 1] + 1
+            later_groups[d] = later_groups[d + 1]
+        else:
+            g = slot_groups[d + 1]
+            first = group_start[g]
+            last = first + same_after[d + 1] + 1
+            if last > group_end[g]:
+                return count
+            later_groups[d] = (
+                later_groups[d + 1] + cumulative[last] - cumulative[first]
+            )
+
+    activity = np.zeros(num_rows)
+    chosen = np.zeros(roster_size, dtype=np.int64)
+    start = np.zeros(roster_size + 1, dtype=np.int64)
+    start[0] = group_start[slot_groups[0]]
+    depth = 0
+    score = 0.0
+    g = 0
+    rest = 0
+    while depth >= 0:
+        j = start[depth]
+        below = False
+        if depth < roster_size:
+            g = slot_groups[depth]
+            rest = j + 1 + same_after[depth]
+            below = (
+                rest <= group_end[g]
+                and score + cumulative[rest] - cumulative[j] + later_groups[depth]
+                < threshold - 1e-9
+            )
+            # the search only covers every lineup if the threshold never cut it short
+            cut_short[0] |= below
+        if depth == roster_size or rest > group_end[g] or below:
+            # nothing else fits in this slot, take the last player back out
+            depth -= 1
+            if depth >= 0:
+                k = chosen[depth]
+                score -= costs[k]
+                for r in range(num_rows):
+                    activity[r] -= columns[k, r]
+            continue
+        start[depth] = j + 1
+        left = roster_size - depth - 1
+        feasible = True
+        for r in range(num_rows):
+            value = activity[r] + columns[j, r]
+            if (
+                value + best[j + 1, left, r] < lower[r] - 1e-9
+                or value + worst[j + 1, left, r] > upper[r] + 1e-9
+            ):
+                feasible = False
+                break
+        if not feasible:
+            continue
+        chosen[depth] = j
+        score += costs[j]
+        for r in range(num_rows):
+            activity[r] += columns[j, r]
+        depth += 1
+        if depth == roster_size:
+            # summed again so the score doesn't depend on the path the search took
+            # and every lineup falls in exactly one [threshold, above) band
+            total = 0.0
+            for k in chosen:
+                total += costs[k]
+            if total < threshold or total >= above:
+                continue
+            if count >= len(scores):
+                return count + 1
+            lineups[count] = chosen
+            scores[count] = total
+            count += 1
+        elif slot_groups[depth] == g:
+            start[depth] = j + 1
+        else:
+            start[depth] = group_start[slot_groups[depth]]
+    return count
+
+
+@njit(cache=True)
+def unique_lineups(lineups, max_overlap, kept, taken, num_kept):
+    # a greedy pass that adds lineups in order to the num_kept already in kept while
+    # each shares at most max_overlap players with every one kept before it. taken
+    # marks the players of each kept lineup. returns the new number kept
+    for i in range(len(lineups)):
+        if num_kept == len(kept):
+            break
+        allowed = True
+        for a in range(num_kept):
+            overlap = 0
+            for j in lineups[i]:
+                overlap += taken[a, j]
+            if overlap > max_overlap:
+                allowed = False
+                break
+        if allowed:
+            for j in lineups[i]:
+                taken[num_kept, j] = 1
+            kept[num_kept] = lineups[i]
+            num_kept += 1
+    return num_kept
+
+
+def top_lineups(model, groups, rosters, num_lineups, max_overlap):
+    # the num_lineups best lineups, best first, each sharing at most max_overlap
+    # players with every lineup before it. those are the lineups that solving and
+    # cutting off one at a time finds, here they come out of a search for every
+    # lineup in a band of scores. groups gives each player's position group and
+    # rosters every allowed count of players per group. the first band starts at the
+    # best conceivable score, every next one reaches twice as far below it and only
+    # covers the scores the bands before it didn't, until enough lineups pass the
+    # uniques check or the search found every lineup there is. returns (selected
+    # indices, projected points) pairs, or None when a band holds more than
+    # MAX_ENUMERATED_LINEUPS lineups
+    costs, matrix, lower, upper = model
+    groups = np.asarray(groups)
+    order = np.lexsort((-costs, groups))
+    sorted_costs = np.ascontiguousarray(costs[order], dtype=np.float64)
+    columns = np.ascontiguousarray(matrix[:, order].toarray().T)
+    sorted_groups = groups[order]
+    num_groups = len(rosters[0])
+    group_start = np.searchsorted(sorted_groups, np.arange(num_groups))
+    group_end = np.searchsorted(sorted_groups, np.arange(num_groups), side="right")
+    slots = [np.repeat(np.arange(num_groups), roster) for roster in rosters]
+    roster_size = len(slots[0])
+    best, worst = suffix_sums(np.ascontiguousarray(columns.T), roster_size)
+    ceiling = 0.0
+    for slot_groups in slots:
+        # every roster's top players, the best any lineup could score
+        top = [
+            sorted_costs[group_start[g] : group_start[g] + np.sum(slot_groups == g)]
+            for g in range(num_groups)
+        ]
+        ceiling = max(ceiling, sum(t.sum() for t in top))
+    # the lineups kept so far and their players, every band scores below the ones
+    # before it so the uniques check carries on where the last band left off
+    kept = np.zeros((num_lineups, roster_size), dtype=np.int64)
+    taken = np.zeros((num_lineups, len(costs)), dtype=np.int8)
+    num_kept = 0
+    above = np.inf
+    gap = 1.0
+    capacity = min(4096, MAX_ENUMERATED_LINEUPS)
+    while True:
+        threshold = ceiling - gap
+        lineups = np.zeros((capacity, roster_size), dtype=np.int64)
+        scores = np.zeros(capacity)
+        count = 0
+        cut_short = np.zeros(1, dtype=np.bool_)
+        for slot_groups in slots:
+            count = enumerate_lineups(
+                sorted_costs,
+                columns,
+                lower,
+                upper,
+                best,
+                worst,
+                slot_groups,
+                group_start,
+                group_end,
+                threshold,
+                above,
+                lineups,
+                scores,
+                count,
+                cut_short,
+            )
+        if count > capacity:
+            # search the same band again with room for more lineups
+            if capacity == MAX_ENUMERATED_LINEUPS:
+                return None
+            capacity = min(2 * capacity, MAX_ENUMERATED_LINEUPS)
+            continue
+        ranked = np.argsort(-scores[:count], kind="stable")
+        num_kept = unique_lineups(lineups[ranked], max_overlap, kept, taken, num_kept)
+        if num_kept == num_lineups or not cut_short[0]:
+            break
+        above = threshold
+        gap *= 2
+    selected = [np.sort(order[lineup]) for lineup in kept[:num_kept]]
+    return [(players, costs[players].sum()) for players in selected]
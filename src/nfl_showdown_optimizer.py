@@ -5,6 +5,12 @@ import datetime
 import numpy as np
 import pulp as plp
 import itertools
+from nfl_opto_utils import (
+    LineupSolver,
+    correlated_projections,
+    parallel_lineups,
+    problem_matrix,
+)
 
 
 class NFL_Showdown_Optimizer:
@@ -165,6 +171,17 @@ class NFL_Showdown_Optimizer:
         self.default_def_var = (
             self.config["default_def_var"] if "default_def_var" in self.config else 0.5
         )
+        self.solver = self.config["solver"] if "solver" in self.config else "cbc"
+        self.optimizer_processes = (
+            int(self.config["optimizer_processes"])
+            if "optimizer_processes" in self.config
+            else 1
+        )
+        self.correlated_randomness = (
+            bool(self.config["correlated_randomness"])
+            if "correlated_randomness" in self.config
+            else False
+        )
 
     # Load projections from file
     def load_projections(self, path):
@@ -298,32 +315,15 @@ class NFL_Showdown_Optimizer:
             for player in self.player_dict
         }
 
-        # set the objective - maximize fpts & set randomness amount from config
-        if self.randomness_amount != 0:
-            self.problem += (
-                plp.lpSum(
-                    np.random.normal(
-                        self.player_dict[player]["Fpts"],
-                        (
-                            self.player_dict[player]["StdDev"]
-                            * self.randomness_amount
-                            / 100
-                        ),
-                    )
-                    * lp_variables[self.player_dict[player]["UniqueKey"]]
-                    for player in self.player_dict
-                ),
-                "Objective",
-            )
-        else:
-            self.problem += (
-                plp.lpSum(
-                    self.player_dict[player]["Fpts"]
-                    * lp_variables[self.player_dict[player]["UniqueKey"]]
-                    for player in self.player_dict
-                ),
-                "Objective",
-            )
+        # set the objective - maximize fpts, optimize() swaps in randomized projections
+        self.problem += (
+            plp.lpSum(
+                self.player_dict[player]["Fpts"]
+                * lp_variables[self.player_dict[player]["UniqueKey"]]
+                for player in self.player_dict
+            ),
+            "Objective",
+        )
 
         # Set the salary constraints
         max_salary = 50000 if self.site == "dk" else 60000
@@ -719,63 +719,93 @@ class NFL_Showdown_Optimizer:
                 f"No player in both CPT and FLEX {tuple_list}",
             )
 
-        # Crunch!
+        # Crunch! the model is handed to the solver once, each lineup only adds a cut
+        # and, with randomness, swaps the projections
+        model = problem_matrix(self.problem, list(lp_variables.values()))
+        player_keys = list(self.player_dict)
+        # with randomness every lineup gets its own row of projections, drawn up front
+        projections = None
+        if self.randomness_amount != 0:
+            projections = self.draw_projections(self.num_lineups)
+        if self.optimizer_processes != 1 and projections is not None:
+            # without randomness every worker would solve the same projections
+            lineups = parallel_lineups(
+                model,
+                self.solver,
+                projections,
+                number_needed + 1 - self.num_uniques,
+                self.optimizer_processes or None,
+            )
+            for selected, fpts_used in lineups:
+                self.lineups.append(([player_keys[j] for j in selected], fpts_used))
+            if len(self.lineups) < self.num_lineups:
+                print(
+                    "Infeasibility reached - only generated {} lineups out of {}. Continuing with export.".format(
+                        len(self.lineups), self.num_lineups
+                    )
+                )
+            return
+
+        solver = LineupSolver(model, self.solver)
         for i in range(self.num_lineups):
-            try:
-                self.problem.solve(plp.PULP_CBC_CMD(msg=0))
-            except plp.PulpSolverError:
+            if projections is not None:
+                solver.set_objective(projections[i])
+            selected = solver.solve()
+            if selected is None:
                 print(
                     "Infeasibility reached - only generated {} lineups out of {}. Continuing with export.".format(
-                        len(self.num_lineups), self.num_lineups
+                        len(self.lineups), self.num_lineups
                     )
                 )
+                break
 
             # self.problem.writeLP("file.lp")
 
             # Get the lineup and add it to our list
-            player_unqiue_keys = [
-                player for player in lp_variables if lp_variables[player].varValue != 0
-            ]
-            players = []
-            for key, value in self.player_dict.items():
-                if value["UniqueKey"] in player_unqiue_keys:
-                    players.append(key)
-
-            fpts_used = self.problem.objective.value()
+            players = [player_keys[j] for j in selected]
+            fpts_used = solver.costs[selected].sum()
             self.lineups.append((players, fpts_used))
 
             if i % 100 == 0:
                 print(i)
 
             # Ensure this lineup isn't picked again
-            self.problem += (
-                plp.lpSum(
-                    lp_variables[self.player_dict[player]["UniqueKey"]]
-                    for player in players
-                )
-                <= len(players) - self.num_uniques,
-                f"Lineup {i}",
-            )
-
-            # Set a new random fpts projection within their distribution
-            if self.randomness_amount != 0:
-                self.problem += (
-                    plp.lpSum(
-                        np.random.normal(
-                            self.player_dict[(player, pos_str, team)]["Fpts"],
-                            (
-                                self.player_dict[(player, pos_str, team)]["StdDev"]
-                                * self.randomness_amount
-                                / 100
-                            ),
-                        )
-                        * lp_variables[
-                            self.player_dict[(player, pos_str, team)]["UniqueKey"]
-                        ]
-                        for (player, pos_str, team) in self.player_dict
+            solver.exclude(selected, len(players) - self.num_uniques)
+
+    def draw_projections(self, num_draws):
+        # one row of randomized projections per lineup. with correlated_randomness the
+        # players of the game are drawn together, a captain's draw is 1.5 times the
+        # same player's flex draw
+        if self.correlated_randomness:
+            players = {}
+            for (player, pos_str, team), value in self.player_dict.items():
+                scale = 1.5 if pos_str == "CPT" else 1
+                players.setdefault(
+                    (player, team),
+                    dict(
+                        value,
+                        Fpts=value["Fpts"] / scale,
+                        StdDev=value["StdDev"] / scale,
+                        Position=value["NormalPosition"],
                     ),
-                    "Objective",
                 )
+            columns = {key: j for j, key in enumerate(players)}
+            draws = correlated_projections(
+                list(players.values()), self.randomness_amount, num_draws
+            )
+            return np.stack(
+                [
+                    draws[:, columns[(player, team)]] * (1.5 if pos_str == "CPT" else 1)
+                    for (player, pos_str, team) in self.player_dict
+                ],
+                axis=1,
+            )
+        players = list(self.player_dict.values())
+        return np.random.normal(
+            [p["Fpts"] for p in players],
+            [p["StdDev"] * self.randomness_amount / 100 for p in players],
+            size=(num_draws, len(players)),
+        )
 
     def output(self):
         print("Lineups done generating. Outputting.")
@@ -19,11 +19,100 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from numba import njit, jit
 import sys
+from nfl_sim_utils import (
+    score_lineups,
+    tournament_results,
+    load_payout_table,
+    iteration_block_size,
+    build_correlation_matrix,
+    covariance_cache_key,
+    covariance_factor,
+    load_covariance_factor,
+    prune_covariance_cache,
+    sample_from_factor,
+    player_totals,
+    slot_totals,
+    write_results,
+)
 
 @jit(nopython=True)  
 def salary_boost(salary, max_salary):
     return (salary / max_salary) ** 2
 
+
+@njit
+def seed_sampler(seed):
+    # numba keeps its own random state, separate from numpy's
+    np.random.seed(seed)
+
+
+@njit
+def sample_showdown_lineup(
+    pos_matrix,
+    ownership,
+    salaries,
+    projections,
+    teams,
+    partners,
+    salary_floor,
+    salary_ceiling,
+    reasonable_projection,
+    max_attempts,
+):
+    # draws lineups until one passes salary, projection and multi-team checks, or
+    # returns all -1 when none did in max_attempts draws.
+    # partners[i] is the index of the other roster position (CPT/FLEX) of player i
+    num_players, num_slots = pos_matrix.shape
+    lineup = np.empty(num_slots, dtype=np.int64)
+    in_lineup = np.zeros(num_players, dtype=np.bool_)
+    cumulative = np.empty(num_players)
+    for _ in range(max_attempts):
+        in_lineup[:] = False
+        salary = 0.0
+        proj = 0.0
+        filled = True
+        for k in range(num_slots):
+            last = k == num_slots - 1
+            total = 0.0
+            for i in range(num_players):
+                if (
+                    pos_matrix[i, k] > 0
+                    and not in_lineup[i]
+                    and salary + salaries[i] <= salary_ceiling
+                ):
+                    if not last:
+                        total += ownership[i]
+                    elif salary + salaries[i] >= salary_floor:
+                        total += ownership[i] * salary_boost(salaries[i], salary_ceiling)
+                cumulative[i] = total
+            if total <= 0:
+                filled = False
+                break
+            # inverse cdf on the cumulative ownership
+            draw = np.random.random() * total
+            choice = 0
+            while cumulative[choice] <= draw:
+                choice += 1
+            lineup[k] = choice
+            in_lineup[choice] = True
+            if partners[choice] >= 0:
+                in_lineup[partners[choice]] = True
+            salary += salaries[choice]
+            proj += projections[choice]
+        if (
+            not filled
+            or salary < salary_floor
+            or salary > salary_ceiling
+            or proj < reasonable_projection
+        ):
+            continue
+        for k in range(1, num_slots):
+            if teams[lineup[k]] != teams[lineup[0]]:
+                return lineup
+    lineup[:] = -1
+    return lineup
+
+
 class NFL_Showdown_Simulator:
     config = None
     player_dict = {}
@@ -38,7 +127,7 @@ class NFL_Showdown_Simulator:
     team_list = []
     num_iterations = None
     site = None
-    payout_structure = {}
+    payout_cumsum = None
     use_contest_data = False
     entry_fee = None
     use_lineup_input = None
@@ -49,6 +138,7 @@ class NFL_Showdown_Simulator:
     max_pct_off_optimal = 0.4
     teams_dict = collections.defaultdict(list)  # Initialize teams_dict
     correlation_rules = {}
+    field_data = None
 
     def __init__(
         self,
@@ -57,11 +147,17 @@ class NFL_Showdown_Simulator:
         num_iterations,
         use_contest_data,
         use_lineup_input,
+        seed=None,
     ):
         self.site = site
         self.use_lineup_input = use_lineup_input
         self.load_config()
         self.load_rules()
+        # field generation and game sampling draw from their own children of one seed
+        # sequence, so a run replays with the same seed however the work is split up
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.field_seed, self.sim_seed = self.seed_sequence.spawn(2)
+        print("Random seed: " + str(self.seed_sequence.entropy))
 
         projection_path = os.path.join(
             os.path.dirname(__file__),
@@ -104,6 +200,11 @@ class NFL_Showdown_Simulator:
             self.salary = 60000
             self.roster_construction = ["CPT", "FLEX", "FLEX", "FLEX", "FLEX"]
 
+        # cleaned covariance matrices and their factors, one file per game
+        self.covariance_cache_dir = os.path.join(
+            os.path.dirname(__file__), "../{}_data/covariance_cache".format(site)
+        )
+
         self.use_contest_data = use_contest_data
         if use_contest_data:
             contest_path = os.path.join(
@@ -114,11 +215,18 @@ class NFL_Showdown_Simulator:
             print("Contest payout structure loaded.")
         else:
             self.field_size = int(field_size)
-            self.payout_structure = {0: 0.0}
+            # first place is the only place and pays nothing
+            self.payout_cumsum = np.zeros(2)
             self.entry_fee = 0
 
         # self.adjust_default_stdev()
         self.assertPlayerDict()
+        # lineups refer to players by UniqueKey, lineup files by site ID, which fanduel
+        # shares between a player's CPT and FLEX entries
+        self.player_by_key = {p["UniqueKey"]: p for p in self.player_dict.values()}
+        self.players_by_id = {}
+        for player in self.player_dict.values():
+            self.players_by_id.setdefault(player["ID"], []).append(player)
         self.num_iterations = int(num_iterations)
         self.get_optimal()
         if self.use_lineup_input:
@@ -143,7 +251,32 @@ class NFL_Showdown_Simulator:
         self.overlap_limit = float(self.config["num_players_vs_def"])
         self.pct_field_double_stacks = float(self.config["pct_field_double_stacks"])
         self.correlation_rules = self.config["custom_correlations"]
+        self.ranking_mode = (
+            self.config["ranking_mode"] if "ranking_mode" in self.config else "partial"
+        )
         self.allow_def_vs_qb_cpt = self.config["allow_def_vs_qb_cpt"]
+        self.field_chunk_size = (
+            int(self.config["field_chunk_size"])
+            if "field_chunk_size" in self.config
+            else 0
+        )
+        self.sim_memory_budget_mb = (
+            int(self.config["sim_memory_budget_mb"])
+            if "sim_memory_budget_mb" in self.config
+            else 0
+        )
+        self.output_format = (
+            self.config["sim_output_format"]
+            if "sim_output_format" in self.config
+            else "csv"
+        )
+        # float16 halves the memory of the score arrays but above 128 points it can only
+        # tell scores 0.125 apart, so near ties at the top of the field become exact ties
+        self.score_precision = np.dtype(
+            self.config["score_precision"]
+            if "score_precision" in self.config
+            else "float32"
+        )
 
     def assertPlayerDict(self):
         for p, s in list(self.player_dict.items()):
@@ -413,34 +546,15 @@ class NFL_Showdown_Simulator:
                                 ] = correlation_value
 
     def load_contest_data(self, path):
-        with open(path, encoding="utf-8-sig") as file:
-            reader = csv.DictReader(self.lower_first(file))
-            for row in reader:
-                if self.field_size is None:
-                    self.field_size = int(row["field size"])
-                if self.entry_fee is None:
-                    self.entry_fee = float(row["entry fee"])
-                # multi-position payouts
-                if "-" in row["place"]:
-                    indices = row["place"].split("-")
-                    # print(indices)
-                    # have to add 1 to range to get it to generate value for everything
-                    for i in range(int(indices[0]), int(indices[1]) + 1):
-                        # print(i)
-                        # Where I'm from, we 0 index things. Thus, -1 since Payout starts at 1st place
-                        if i >= self.field_size:
-                            break
-                        self.payout_structure[i - 1] = float(
-                            row["payout"].split(".")[0].replace(",", "")
-                        )
-                # single-position payouts
-                else:
-                    if int(row["place"]) >= self.field_size:
-                        break
-                    self.payout_structure[int(row["place"]) - 1] = float(
-                        row["payout"].split(".")[0].replace(",", "")
-                    )
-        # print(self.payout_structure)
+        # compiled to a cumulative payout table once per contest file, later runs read
+        # the cached table from the payout_cache folder next to it
+        self.payout_cumsum, self.payout_brackets, contest = load_payout_table(
+            path, os.path.join(os.path.dirname(path), "payout_cache")
+        )
+        if self.field_size is None:
+            self.field_size = contest["field_size"]
+        if self.entry_fee is None:
+            self.entry_fee = contest["entry_fee"]
 
     def load_correlation_rules(self):
         if len(self.correlation_rules.keys()) > 0:
@@ -745,8 +859,7 @@ class NFL_Showdown_Simulator:
                 # storing if this lineup was made by an optimizer or with the generation process in this script
                 error = False
                 for l in lineup:
-                    ids = [self.player_dict[k]["ID"] for k in self.player_dict]
-                    if l not in ids:
+                    if l not in self.players_by_id:
                         print("lineup {} is missing players {}".format(i, l))
                         if l in self.id_name_dict:
                             print(self.id_name_dict[l])
@@ -760,35 +873,19 @@ class NFL_Showdown_Simulator:
                     un_key_lu = []
                     i = 0
                     for l in lineup:
-                        ids = [self.player_dict[k]["ID"] for k in self.player_dict]
-                        if l not in ids:
+                        if l not in self.players_by_id:
                             print("lineup {} is missing players {}".format(i, l))
                             if l in self.id_name_dict:
                                 print(self.id_name_dict[l])
                             error = True
                         else:
-                            for k in self.player_dict:
-                                if self.player_dict[k]["ID"] == l:
-                                    if i == 0:
-                                        if (
-                                            self.player_dict[k]["rosterPosition"]
-                                            == "CPT"
-                                        ):
-                                            un_key_lu.append(
-                                                self.player_dict[k]["UniqueKey"]
-                                            )
-                                        else:
-                                            pass
-                                    else:
-                                        if (
-                                            self.player_dict[k]["rosterPosition"]
-                                            == "FLEX"
-                                        ):
-                                            un_key_lu.append(
-                                                self.player_dict[k]["UniqueKey"]
-                                            )
-                                        else:
-                                            pass
+                            for player in self.players_by_id[l]:
+                                if i == 0:
+                                    if player["rosterPosition"] == "CPT":
+                                        un_key_lu.append(player["UniqueKey"])
+                                else:
+                                    if player["rosterPosition"] == "FLEX":
+                                        un_key_lu.append(player["UniqueKey"])
                         i += 1
                 if len(lineup) < len(self.roster_construction):
                     print("lineup {} is missing players".format(i))
@@ -798,10 +895,6 @@ class NFL_Showdown_Simulator:
                     self.field_lineups[j] = {
                         "Lineup": {
                             "Lineup": lu,
-                            "Wins": 0,
-                            "Top10": 0,
-                            "ROI": 0,
-                            "Cashes": 0,
                             "Type": "input",
                         },
                         "count": 1,
@@ -811,197 +904,54 @@ class NFL_Showdown_Simulator:
         # print(self.field_lineups)
 
     @staticmethod
-    def select_player(
-        pos,
-        in_lineup,
-        ownership,
-        ids,
-        salaries,
-        current_salary,
-        remaining_salary,
-        k,
-        rng,
-        salary_ceiling=None,
-        salary_floor=None,
-        def_opp=None,
-        teams=None,
-    ):
-        valid_players = np.nonzero(
-            (pos > 0)
-            & (in_lineup == 0)
-            & (salaries <= remaining_salary)
-            & (
-                (current_salary + salaries >= salary_floor)
-                if salary_floor is not None
-                else True
-            )
-            # & ((teams != def_opp) if def_opp is not None else True)
-        )[0]
-        if len(valid_players) == 0:
-            # common_indices = set(np.where(pos > 0)[0]) & \
-            #     set(np.where(in_lineup == 0)[0]) & \
-            #     set(np.where(salaries <= remaining_salary)[0]) & \
-            #     set(np.where((current_salary + salaries >= salary_floor) if salary_floor is not None else True)[0]) & \
-            #     set(np.where((teams != def_opp) if def_opp is not None else True)[0])
-            # print(common_indices)
-            # print(current_salary, salary_floor, remaining_salary, k, np.where((current_salary + salaries >= salary_floor)), np.where(pos>0), np.where(salaries <= remaining_salary), np.where(in_lineup == 0), np.where(teams != def_opp) if def_opp is not None else True)
-            return None, None
-        plyr_list = ids[valid_players]
-        prob_list = ownership[valid_players] / ownership[valid_players].sum()
-        if salary_ceiling:
-            boosted_salaries = np.array([salary_boost(s, salary_ceiling) for s in salaries[valid_players]])
-            boosted_probabilities = prob_list * boosted_salaries
-            boosted_probabilities /= boosted_probabilities.sum()  # normalize to ensure it sums to 1
-            choice = rng.choice(plyr_list, p=boosted_probabilities)
-        else:
-            choice = rng.choice(plyr_list,p=prob_list)
-        return np.where(ids == choice)[0], choice
+    def init_field_worker(field_data):
+        # player arrays are sent to each worker once instead of with every task
+        NFL_Showdown_Simulator.field_data = field_data
 
     @staticmethod
-    def validate_lineup(
-        salary,
-        salary_floor,
-        salary_ceiling,
-        proj,
-        optimal_score,
-        max_pct_off_optimal,
-        player_teams,
-    ):
+    def generate_lineups(num_lineups, seed, max_attempts=100000):
+        pos_matrix = NFL_Showdown_Simulator.field_data["pos_matrix"]
+        ownership = NFL_Showdown_Simulator.field_data["ownership"]
+        salary_floor = NFL_Showdown_Simulator.field_data["salary_floor"]
+        salary_ceiling = NFL_Showdown_Simulator.field_data["salary_ceiling"]
+        optimal_score = NFL_Showdown_Simulator.field_data["optimal_score"]
+        salaries = NFL_Showdown_Simulator.field_data["salaries"]
+        projections = NFL_Showdown_Simulator.field_data["projections"]
+        max_pct_off_optimal = NFL_Showdown_Simulator.field_data["max_pct_off_optimal"]
+        teams = NFL_Showdown_Simulator.field_data["teams"]
+        partners = NFL_Showdown_Simulator.field_data["partners"]
+        seed_sampler(seed.generate_state(1)[0])
         reasonable_projection = optimal_score - (max_pct_off_optimal * optimal_score)
-
-        if (
-            salary_floor <= salary <= salary_ceiling
-            and proj >= reasonable_projection
-            and len(set(player_teams)) > 1
-        ):
-            return True
-        return False
-
-    @staticmethod
-    def generate_lineups(
-        lu_num,
-        ids,
-        in_lineup,
-        pos_matrix,
-        ownership,
-        salary_floor,
-        salary_ceiling,
-        optimal_score,
-        salaries,
-        projections,
-        max_pct_off_optimal,
-        teams,
-        opponents,
-        overlap_limit,
-        matchups,
-        new_player_dict,
-        num_players_in_roster,
-    ):
-        rng = np.random.Generator(np.random.PCG64())
-        lus = {}
-        in_lineup.fill(0)
-        iteration_count = 0
-        while True:
-            iteration_count += 1
-            salary, proj = 0, 0
-            lineup, player_teams, lineup_matchups = [], [], []
-            def_opp, players_opposing_def, cpt_selected = None, 0, False
-            in_lineup.fill(0)
-            cpt_name = None
-            remaining_salary = salary_ceiling
-
-            for k, pos in enumerate(pos_matrix.T):
-                position_constraint = k >= 1 and players_opposing_def < overlap_limit
-                choice_idx, choice = NFL_Showdown_Simulator.select_player(
-                    pos,
-                    in_lineup,
-                    ownership,
-                    ids,
-                    salaries,
-                    salary,
-                    remaining_salary,
-                    k,
-                    rng,
-                    salary_ceiling if k == num_players_in_roster - 1 else None,
-                    salary_floor if k == num_players_in_roster - 1 else None,
-                    def_opp if position_constraint else None,
-                    teams if position_constraint else None,
-                )
-                if choice is None:
-                    iteration_count += 1
-                    salary, proj = 0, 0
-                    lineup, player_teams, lineup_matchups = [], [], []
-                    def_opp, players_opposing_def, cpt_selected = None, 0, False
-                    in_lineup.fill(0)
-                    cpt_name = None
-                    remaining_salary = salary_ceiling
-                    continue
-                if k == 0:
-                    cpt_player_info = new_player_dict[choice]
-                    flex_choice_idx = next(
-                        (
-                            i
-                            for i, v in enumerate(new_player_dict.values())
-                            if v["Name"] == cpt_player_info["Name"]
-                            and v["Team"] == cpt_player_info["Team"]
-                            and v["Position"] == cpt_player_info["Position"]
-                            and v["rosterPosition"] == "FLEX"
-                        ),
-                        None,
-                    )
-                    if flex_choice_idx is not None:
-                        in_lineup[flex_choice_idx] = 1
-                    def_opp = opponents[choice_idx][0]
-                    cpt_selected = True
-
-                if (
-                    cpt_selected
-                    and "QB" in new_player_dict[choice]["Position"]
-                    and "DEF" in [new_player_dict[x]["Position"] for x in lineup]
-                ):
-                    continue
-
-                lineup.append(str(choice))
-                in_lineup[choice_idx] = 1
-                salary += salaries[choice_idx]
-                proj += projections[choice_idx]
-                remaining_salary = salary_ceiling - salary
-
-                # lineup_matchups.append(matchups[choice_idx[0]])
-                player_teams.append(teams[choice_idx][0])
-
-                if teams[choice_idx][0] == def_opp:
-                    players_opposing_def += 1
-
-            if NFL_Showdown_Simulator.validate_lineup(
-                salary,
+        # player indices in slot order, one row per lineup
+        lineups = np.empty((num_lineups, pos_matrix.shape[1]), dtype=np.int32)
+        for i in range(num_lineups):
+            lineups[i] = sample_showdown_lineup(
+                pos_matrix,
+                ownership,
+                salaries,
+                projections,
+                teams,
+                partners,
                 salary_floor,
                 salary_ceiling,
-                proj,
-                optimal_score,
-                max_pct_off_optimal,
-                player_teams,
-            ):
-                lus[lu_num] = {
-                    "Lineup": lineup,
-                    "Wins": 0,
-                    "Top10": 0,
-                    "ROI": 0,
-                    "Cashes": 0,
-                    "Type": "generated",
-                }
-                break
-        return lus
-
-    def remap_player_dict(self, player_dict):
-        remapped_dict = {}
-        for key, value in player_dict.items():
-            if "UniqueKey" in value:
-                player_id = value["UniqueKey"]
-                remapped_dict[player_id] = value
-            else:
-                raise KeyError(f"Player details for {key} does not contain an 'ID' key")
-        return remapped_dict
+                reasonable_projection,
+                max_attempts,
+            )
+            if lineups[i, 0] < 0:
+                raise RuntimeError(
+                    "unable to generate {} field lineups in {} attempts each, "
+                    "check min_lineup_salary and max_pct_off_optimal".format(
+                        num_lineups - i, max_attempts
+                    )
+                )
+        return lineups
+
+    def get_field_chunk_size(self, num_lineups):
+        if self.field_chunk_size > 0:
+            return self.field_chunk_size
+        # enough chunks to keep the workers busy without many round trips. the count
+        # doesn't depend on the machine so seeded runs split the field the same way
+        return max(1, math.ceil(num_lineups / 64))
 
     def generate_field_lineups(self):
         diff = self.field_size - len(self.field_lineups)
@@ -1015,7 +965,8 @@ class NFL_Showdown_Simulator:
         player_data = self.extract_player_data()
 
         # Initialize problem list
-        problems = self.initialize_problems_list(diff, player_data)
+        field_data = self.build_field_data(player_data)
+        problems = self.initialize_problems_list(diff)
 
         # print(problems[0])
 
@@ -1027,7 +978,9 @@ class NFL_Showdown_Simulator:
         start_time = time.time()
 
         # Parallel processing for generating lineups
-        with mp.Pool() as pool:
+        with mp.Pool(
+            initializer=self.init_field_worker, initargs=(field_data,)
+        ) as pool:
             output = pool.starmap(self.generate_lineups, problems)
             pool.close()
             pool.join()
@@ -1035,7 +988,7 @@ class NFL_Showdown_Simulator:
         print("pool closed")
 
         # Update field lineups
-        self.update_field_lineups(output, diff)
+        self.update_field_lineups(np.concatenate(output), diff, field_data["ids"])
 
         end_time = time.time()
         print(f"lineups took {end_time - start_time} seconds")
@@ -1080,7 +1033,7 @@ class NFL_Showdown_Simulator:
             positions,
         )
 
-    def initialize_problems_list(self, diff, player_data):
+    def build_field_data(self, player_data):
         (
             ids,
             ownership,
@@ -1091,35 +1044,53 @@ class NFL_Showdown_Simulator:
             matchups,
             positions,
         ) = player_data
-        in_lineup = np.zeros(shape=len(ids))
         ownership, salaries, projections, pos_matrix = map(
             np.array, [ownership, salaries, projections, positions]
         )
-        teams, opponents, ids = map(np.array, [teams, opponents, ids])
-        new_player_dict = self.remap_player_dict(self.player_dict)
-        num_players_in_roster = len(self.roster_construction)
-        problems = []
-        for i in range(diff):
-            lu_tuple = (
-                i,
-                ids,
-                in_lineup,
-                pos_matrix,
-                ownership,
-                self.min_lineup_salary,
-                self.salary,
-                self.optimal_score,
-                salaries,
-                projections,
-                self.max_pct_off_optimal,
-                teams,
-                opponents,
-                self.overlap_limit,
-                matchups,
-                new_player_dict,
-                num_players_in_roster,
+        ownership, salaries, projections = (
+            ownership.astype(np.float64),
+            salaries.astype(np.float64),
+            projections.astype(np.float64),
+        )
+        ids = np.array(ids)
+        # CPT and FLEX entries of the same player point at each other
+        partners = np.full(len(ids), -1)
+        entries = {}
+        for i, player_info in enumerate(self.player_dict.values()):
+            key = (
+                player_info["Name"],
+                player_info["Team"],
+                str(player_info["Position"]),
             )
-            problems.append(lu_tuple)
+            if key in entries:
+                partners[i] = entries[key]
+                partners[entries[key]] = i
+            else:
+                entries[key] = i
+        team_codes = {t: i for i, t in enumerate(sorted(set(teams)))}
+        teams = np.array([team_codes[t] for t in teams])
+        return {
+            "ids": ids,
+            "pos_matrix": pos_matrix,
+            "ownership": ownership,
+            "salary_floor": self.min_lineup_salary,
+            "salary_ceiling": self.salary,
+            "optimal_score": self.optimal_score,
+            "salaries": salaries,
+            "projections": projections,
+            "max_pct_off_optimal": self.max_pct_off_optimal,
+            "teams": teams,
+            "partners": partners,
+        }
+
+    def initialize_problems_list(self, diff):
+        # workers only get the size of their chunk and a child seed
+        chunk_size = self.get_field_chunk_size(diff)
+        chunk_starts = range(0, diff, chunk_size)
+        seeds = self.field_seed.spawn(len(chunk_starts))
+        problems = []
+        for start, seed in zip(chunk_starts, seeds):
+            problems.append((min(chunk_size, diff - start), seed))
         # print(self.player_dict.keys())
         return problems
 
@@ -1143,7 +1114,7 @@ class NFL_Showdown_Simulator:
                 stacks[i] = ""
         return stacks
 
-    def update_field_lineups(self, output, diff):
+    def update_field_lineups(self, output, diff, ids):
         if len(self.field_lineups) == 0:
             new_keys = list(range(0, self.field_size))
         else:
@@ -1155,9 +1126,9 @@ class NFL_Showdown_Simulator:
             )
 
         nk = new_keys[0]
-        for i, o in enumerate(output):
-            lineup_list = sorted(next(iter(o.values()))["Lineup"])
-            lineup_set = frozenset(lineup_list)  # Convert the list to a frozenset
+        for row in output:
+            lineup = ids[row].tolist()
+            lineup_set = frozenset(lineup)
 
             # Keeping track of lineup duplication counts
             if lineup_set in self.seen_lineups:
@@ -1173,7 +1144,10 @@ class NFL_Showdown_Simulator:
                     print("bad lineups dict, please check dk_data files")
                 else:
                     self.field_lineups[nk] = {
-                        "Lineup": next(iter(o.values())),
+                        "Lineup": {
+                            "Lineup": lineup,
+                            "Type": "generated",
+                        },
                         "count": self.seen_lineups[lineup_set],
                     }
 
@@ -1186,79 +1160,31 @@ class NFL_Showdown_Simulator:
         beta = sd**2 / mean
         return alpha, beta
 
-    def run_simulation_for_game(self, team1_id, team1, team2_id, team2, num_iterations):
-        def get_corr_value(player1, player2):
-            # First, check for specific player-to-player correlations
-            if player2["Name"] in player1.get("Player Correlations", {}):
-                return player1["Player Correlations"][player2["Name"]]
-
-            # If no specific correlation is found, proceed with the general logic
-            position_correlations = {
-                "QB": -0.5,
-                "RB": -0.2,
-                "WR": -0.1,
-                "TE": -0.2,
-                "K": -0.5,
-                "DST": -0.5,
-            }
-
-            if player1["Team"] == player2["Team"] and player1["Position"][0] in [
-                "QB",
-                "RB",
-                "WR",
-                "TE",
-                "K",
-                "DST",
-            ]:
-                primary_position = player1["Position"][0]
-                return position_correlations[primary_position]
-
-            if player1["Team"] != player2["Team"]:
-                player_2_pos = "Opp " + str(player2["Position"][0])
-            else:
-                player_2_pos = player2["Position"][0]
-
-            return player1["Correlations"].get(
-                player_2_pos, 0
-            )  # Default to 0 if no correlation is found
+    def run_simulation_for_game(
+        self, team1_id, team1, team2_id, team2, num_iterations, rng
+    ):
+        # every teammate gets the value of the first player's position, opponents use
+        # the first player's "Correlations". "Player Correlations" override both
+        position_correlations = {
+            "QB": -0.5,
+            "RB": -0.2,
+            "WR": -0.1,
+            "TE": -0.2,
+            "K": -0.5,
+            "DST": -0.5,
+        }
 
         def build_covariance_matrix(players):
-            N = len(players)
-            matrix = [[0 for _ in range(N)] for _ in range(N)]
-            corr_matrix = [[0 for _ in range(N)] for _ in range(N)]
-
-            for i in range(N):
-                for j in range(N):
-                    if i == j:
-                        matrix[i][j] = (
-                            players[i]["StdDev"] ** 2
-                        )  # Variance on the diagonal
-                        corr_matrix[i][j] = 1
-                    else:
-                        matrix[i][j] = (
-                            get_corr_value(players[i], players[j])
-                            * players[i]["StdDev"]
-                            * players[j]["StdDev"]
-                        )
-                        corr_matrix[i][j] = get_corr_value(players[i], players[j])
-            return matrix, corr_matrix
-
-
-        def ensure_positive_semidefinite(matrix):
-            eigs = np.linalg.eigvals(matrix)
-            if np.any(eigs < 0):
-                jitter = abs(min(eigs)) + 1e-6  # a small value
-                matrix += np.eye(len(matrix)) * jitter
-
-            # Given eigenvalues and eigenvectors from previous code
-            eigenvalues, eigenvectors = np.linalg.eigh(matrix)
-
-            # Set negative eigenvalues to zero
-            eigenvalues[eigenvalues < 0] = 0
+            corr_matrix = build_correlation_matrix(
+                players, position_correlations, same_team_by_position=False
+            )
+            std_devs = np.array([player["StdDev"] for player in players])
+            # Variance on the diagonal
+            return corr_matrix * np.outer(std_devs, std_devs)
 
-            # Reconstruct the matrix
-            matrix = eigenvectors.dot(np.diag(eigenvalues)).dot(eigenvectors.T)
-            return matrix
+        def build_factor():
+            # cholesky, or set negative eigenvalues to zero when it isn't positive definite
+            return covariance_factor(build_covariance_matrix(game))
 
         # Filter out players with projections less than or equal to 0
         team1 = [
@@ -1273,20 +1199,21 @@ class NFL_Showdown_Simulator:
         ]
 
         game = team1 + team2
-        covariance_matrix, corr_matrix = build_covariance_matrix(game)
-        covariance_matrix = ensure_positive_semidefinite(covariance_matrix)
-
         try:
-            samples = multivariate_normal.rvs(
-                mean=[player["Fpts"] for player in game],
-                cov=covariance_matrix,
-                size=num_iterations,
+            # the matrix is only rebuilt when the projections or correlations changed
+            covariance_matrix, factor = load_covariance_factor(
+                self.covariance_cache_dir,
+                covariance_cache_key("showdown", game, position_correlations),
+                build_factor,
+            )
+            samples = sample_from_factor(
+                rng, [player["Fpts"] for player in game], factor, num_iterations
             )
         except Exception as e:
             print(f"{team1_id}, {team2_id}, bad matrix: {str(e)}")
             return {}
 
-        player_samples = [samples[:, i] for i in range(len(game))]
+        player_samples = [samples[i] for i in range(len(game))]
 
         temp_fpts_dict = {}
         for i, player in enumerate(game):
@@ -1294,58 +1221,18 @@ class NFL_Showdown_Simulator:
 
         return temp_fpts_dict
 
-    @staticmethod
-    @jit(nopython=True)
-    def calculate_payouts(args):
-        (
-            ranks,
-            payout_array,
-            entry_fee,
-            field_lineup_keys,
-            use_contest_data,
-            field_lineups_count,
-        ) = args
-        num_lineups = len(field_lineup_keys)
-        combined_result_array = np.zeros(num_lineups)
-
-        payout_cumsum = np.cumsum(payout_array)
-
-        for r in range(ranks.shape[1]):
-            ranks_in_sim = ranks[:, r]
-            payout_index = 0
-            for lineup_index in ranks_in_sim:
-                lineup_count = field_lineups_count[lineup_index]
-                prize_for_lineup = (
-                    (
-                        payout_cumsum[payout_index + lineup_count - 1]
-                        - payout_cumsum[payout_index - 1]
-                    )
-                    / lineup_count
-                    if payout_index != 0
-                    else payout_cumsum[payout_index + lineup_count - 1] / lineup_count
-                )
-                combined_result_array[lineup_index] += prize_for_lineup
-                payout_index += lineup_count
-        return combined_result_array
-
     def run_tournament_simulation(self):
         print(f"Running {self.num_iterations} simulations")
         print(f"Number of unique field lineups: {len(self.field_lineups.keys())}")
+        prune_covariance_cache(self.covariance_cache_dir)
 
         def generate_cpt_outcomes(flex_dict):
             cpt_dict = {}
             for player_id, flex_outcomes in flex_dict.items():
                 # Fetch team information using the player_id
                 # Assuming self.player_dict uses a structure like {(player_name, position, team): player_data}
-                player_data_flex = [
-                    data
-                    for (name, pos, team), data in self.player_dict.items()
-                    if data["UniqueKey"] == player_id and pos == "FLEX"
-                ]
-                if player_data_flex:
-                    player_data_flex = player_data_flex[
-                        0
-                    ]  # Get the first match (there should only be one)
+                player_data_flex = self.player_by_key.get(player_id)
+                if player_data_flex and player_data_flex["rosterPosition"] == "FLEX":
                     team = player_data_flex["Team"]
 
                     # Fetch the CPT data using the player_name and team fetched from the above step
@@ -1365,110 +1252,72 @@ class NFL_Showdown_Simulator:
                 print("bad lineup", f, self.field_lineups[f])
 
         start_time = time.time()
-        temp_fpts_dict = {}
 
         # Get the only matchup since it's a showdown
         matchup = list(self.matchups)[0]
-
-        # Prepare the arguments for the simulation function
-        game_simulation_params = (
-            matchup[0],
-            self.teams_dict[matchup[0]],
-            matchup[1],
-            self.teams_dict[matchup[1]],
-            self.num_iterations,
-        )
-
-        # Run the simulation for the single game
-        temp_fpts_dict.update(self.run_simulation_for_game(*game_simulation_params))
-        cpt_outcomes_dict = generate_cpt_outcomes(temp_fpts_dict)
-        temp_fpts_dict.update(cpt_outcomes_dict)
-        # generate arrays for every sim result for each player in the lineup and sum
-        fpts_array = np.zeros(shape=(len(self.field_lineups), self.num_iterations))
-        # converting payout structure into an np friendly format, could probably just do this in the load contest function
-        # print(self.field_lineups)
-        # print(temp_fpts_dict)
-        # print(payout_array)
-        # print(self.player_dict[('patrick mahomes', 'FLEX', 'KC')])
         field_lineups_count = np.array(
             [self.field_lineups[idx]["count"] for idx in self.field_lineups.keys()]
         )
-
-        for index, values in self.field_lineups.items():
-            try:
-                fpts_sim = sum(
-                    [temp_fpts_dict[player] for player in values["Lineup"]["Lineup"]]
-                )
-            except KeyError:
-                for player in values["Lineup"]["Lineup"]:
-                    if player not in temp_fpts_dict.keys():
-                        print(player)
-                        # for k,v in self.player_dict.items():
-                        # if v['ID'] == player:
-                        #        print(k,v)
-                # print('cant find player in sim dict', values["Lineup"], temp_fpts_dict.keys())
-            # store lineup fpts sum in 2d np array where index (row) corresponds to index of field_lineups and columns are the fpts from each sim
-            fpts_array[index] = fpts_sim
-
-        fpts_array = fpts_array.astype(np.float16)
-        # ranks = np.argsort(fpts_array, axis=0)[::-1].astype(np.uint16)
-        ranks = np.argsort(-fpts_array, axis=0).astype(np.uint32)
-
-        # count wins, top 10s vectorized
-        wins, win_counts = np.unique(ranks[0, :], return_counts=True)
-        t10, t10_counts = np.unique(ranks[0:9], return_counts=True)
-        payout_array = np.array(list(self.payout_structure.values()))
-        # subtract entry fee
-        payout_array = payout_array - self.entry_fee
-        l_array = np.full(
-            shape=self.field_size - len(payout_array), fill_value=-self.entry_fee
+        num_lineups = len(self.field_lineups)
+
+        # iterations are simulated, scored, ranked and paid out a block at a time so the
+        # (lineups, iterations) arrays never exceed the memory budget. the game keeps one
+        # generator across blocks, so the results don't depend on the block size
+        block_size = iteration_block_size(
+            num_lineups,
+            len(self.player_dict),
+            self.num_iterations,
+            self.sim_memory_budget_mb,
+            self.score_precision,
         )
-        payout_array = np.concatenate((payout_array, l_array))
-        field_lineups_keys_array = np.array(list(self.field_lineups.keys()))
-
-        # Adjusted ROI calculation
-        # print(field_lineups_count.shape, payout_array.shape, ranks.shape, fpts_array.shape)
-
-        # Split the simulation indices into chunks
-        field_lineups_keys_array = np.array(list(self.field_lineups.keys()))
-
-        chunk_size = self.num_iterations // 16  # Adjust chunk size as needed
-        simulation_chunks = [
-            (
-                ranks[:, i : min(i + chunk_size, self.num_iterations)].copy(),
-                payout_array,
-                self.entry_fee,
-                field_lineups_keys_array,
-                self.use_contest_data,
-                field_lineups_count,
-            )  # Adding field_lineups_count here
-            for i in range(0, self.num_iterations, chunk_size)
-        ]
+        rng = np.random.default_rng(self.sim_seed.spawn(1)[0])
+        combined_result_array = np.zeros(num_lineups)
+        self.field_wins = np.zeros(num_lineups, dtype=np.int64)
+        self.field_top10 = np.zeros(num_lineups, dtype=np.int64)
+        self.field_cashes = np.zeros(num_lineups, dtype=np.int64)
+        field_matrix = None
+        for block_start in range(0, self.num_iterations, block_size):
+            block_iterations = min(block_size, self.num_iterations - block_start)
+
+            # Run the simulation for the single game
+            temp_fpts_dict = self.run_simulation_for_game(
+                matchup[0],
+                self.teams_dict[matchup[0]],
+                matchup[1],
+                self.teams_dict[matchup[1]],
+                block_iterations,
+                rng,
+            )
+            cpt_outcomes_dict = generate_cpt_outcomes(temp_fpts_dict)
+            temp_fpts_dict.update(cpt_outcomes_dict)
+
+            # sim results as a (players, iterations) matrix and the field as player indices
+            if field_matrix is None:
+                player_keys = list(temp_fpts_dict.keys())
+                player_index = {k: i for i, k in enumerate(player_keys)}
+                field_matrix = np.array(
+                    [
+                        [player_index[player] for player in values["Lineup"]["Lineup"]]
+                        for values in self.field_lineups.values()
+                    ]
+                )
+            player_samples = np.array([temp_fpts_dict[k] for k in player_keys])
+            # lineup x player incidence times the sim results, row of fpts_array corresponds
+            # to the row of field_lineups, columns are the fpts from each sim
+            fpts_array = score_lineups(field_matrix, player_samples, self.score_precision)
+            # prizes, wins, top 10 finishes and cashes for every lineup in one pass,
+            # equal scores split the prizes of the places they cover
+            prizes, wins, t10, cashes = tournament_results(
+                fpts_array, field_lineups_count, self.payout_cumsum, 10, self.ranking_mode
+            )
+            del fpts_array
+            combined_result_array += prizes - self.entry_fee * block_iterations
+            self.field_wins += wins
+            self.field_top10 += t10
+            self.field_cashes += cashes
 
-        # Use the pool to process the chunks in parallel
-        with mp.Pool() as pool:
-            results = pool.map(self.calculate_payouts, simulation_chunks)
-
-        combined_result_array = np.sum(results, axis=0)
-        total_sum = 0
-        index_to_key = list(self.field_lineups.keys())
-        for idx, roi in enumerate(combined_result_array):
-            lineup_key = index_to_key[idx]
-            lineup_count = self.field_lineups[lineup_key][
-                "count"
-            ]  # Assuming "Count" holds the count of the lineups
-            total_sum += roi * lineup_count
-            self.field_lineups[lineup_key]["Lineup"]["ROI"] += roi
-
-        for idx in self.field_lineups.keys():
-            if idx in wins:
-                self.field_lineups[idx]["Lineup"]["Wins"] += win_counts[
-                    np.where(wins == idx)
-                ][0]
-            if idx in t10:
-                self.field_lineups[idx]["Lineup"]["Top10"] += t10_counts[
-                    np.where(t10 == idx)
-                ][0]
+        # per lineup results, same order as field_lineups
+        self.field_roi = combined_result_array
 
         end_time = time.time()
         diff = end_time - start_time
@@ -1479,147 +1328,184 @@ class NFL_Showdown_Simulator:
             + " seconds. Outputting."
         )
 
-    def output(self):
-        unique = {}
-        for index, data in self.field_lineups.items():
-            # if index == 0:
-            #    print(data)
-            lineup = data["Lineup"]["Lineup"]
-            lineup_data = data["Lineup"]
-            lu_type = lineup_data["Type"]
-
-            salary = 0
-            fpts_p = 0
-            fieldFpts_p = 0
-            ceil_p = 0
-            own_p = []
-            own_s = []
-            lu_names = []
-            lu_teams = []
-            cpt_tm = ""
-            def_opps = []
-            players_vs_def = 0
-
-            player_dict_values = {
-                v["UniqueKey"]: v for k, v in self.player_dict.items()
-            }
-
-            for player_id in lineup:
-                player_data = player_dict_values.get(player_id, {})
-                if player_data:
-                    if "DST" in player_data["Position"]:
-                        def_opps.append(player_data["Opp"])
-                    if "CPT" in player_data["rosterPosition"]:
-                        cpt_tm = player_data["Team"]
-
-                    salary += player_data.get("Salary", 0)
-                    fpts_p += player_data.get("Fpts", 0)
-                    fieldFpts_p += player_data.get("fieldFpts", 0)
-                    ceil_p += player_data.get("Ceiling", 0)
-                    own_p.append(player_data.get("Ownership", 0) / 100)
-                    own_s.append(player_data.get("Ownership", 0))
-                    if self.site == "fd" and "CPT" in player_data["rosterPosition"]:
-                        player_id = player_data.get("ID", "")
-                        if player_id.endswith("69696969"):
-                            player_id = player_id.replace("69696969", "")
-                        lu_names.append(f"{player_data.get('Name', '')} ({player_id})")
-                    else:
-                        lu_names.append(
-                            f"{player_data.get('Name', '').replace('#','-')} ({player_data.get('ID', '')})"
-                        )
-                    lu_teams.append(player_data["Team"])
-                    if "DST" not in player_data["Position"]:
-                        if player_data["Team"] in def_opps:
-                            players_vs_def += 1
-
-            counter = collections.Counter(lu_teams)
-            stacks = counter.most_common()
-
-            primary_stack = secondary_stack = ""
-            for s in stacks:
-                if s[0] == cpt_tm:
-                    primary_stack = f"{cpt_tm} {s[1]}"
-                    stacks.remove(s)
-                    break
-
-            if stacks:
-                secondary_stack = f"{stacks[0][0]} {stacks[0][1]}"
-
-            own_p = np.prod(own_p)
-            own_s = np.sum(own_s)
-            win_p = round(lineup_data["Wins"] / self.num_iterations * 100, 2)
-            top10_p = round(lineup_data["Top10"] / self.num_iterations * 100, 2)
-            cash_p = round(lineup_data["Cashes"] / self.num_iterations * 100, 2)
-            num_dupes = data["count"]
-            if self.use_contest_data:
-                roi_p = round(
-                    lineup_data["ROI"] / self.entry_fee / self.num_iterations * 100, 2
-                )
-                roi_round = round(lineup_data["ROI"] / self.num_iterations, 2)
+    def field_matrix(self):
+        # the field as a (lineups, slots) matrix of positions in player_by_key
+        key_index = {key: i for i, key in enumerate(self.player_by_key)}
+        return np.array(
+            [
+                [key_index[key] for key in data["Lineup"]["Lineup"]]
+                for data in self.field_lineups.values()
+            ]
+        )
 
-            if self.use_contest_data:
-                lineup_str = f"{lu_type},{','.join(lu_names)},{salary},{fpts_p},{fieldFpts_p},{ceil_p},{primary_stack},{secondary_stack},{players_vs_def},{win_p}%,{top10_p}%,{cash_p}%,{own_p},{own_s},{roi_p}%,${roi_round},{num_dupes}"
+    def output(self):
+        # every lineup statistic is a column gathered from the field matrix, returned as
+        # (title, values, csv format) for write_results
+        players = list(self.player_by_key.values())
+        lineups = self.field_matrix()
+        types = np.array(
+            [data["Lineup"]["Type"] for data in self.field_lineups.values()]
+        )
+        counts = np.array([data["count"] for data in self.field_lineups.values()])
+
+        labels = []
+        for player in players:
+            player_id = player.get("ID", "")
+            if self.site == "fd" and "CPT" in player["rosterPosition"]:
+                if player_id.endswith("69696969"):
+                    player_id = player_id.replace("69696969", "")
+                labels.append(f"{player.get('Name', '')} ({player_id})")
             else:
-                lineup_str = f"{lu_type},{','.join(lu_names)},{salary},{fpts_p},{fieldFpts_p},{ceil_p},{primary_stack},{secondary_stack},{players_vs_def},{win_p}%,{top10_p}%,{cash_p}%,{own_p},{own_s},{num_dupes}"
-            unique[
-                lineup_str
-            ] = fpts_p  # Changed data["Fpts"] to fpts_p, which contains the accumulated Fpts
+                name = player.get("Name", "").replace("#", "-")
+                labels.append(f"{name} ({player_id})")
+        labels = np.array(labels)
+        salary = slot_totals(lineups, [p.get("Salary", 0) for p in players])
+        fpts_p = slot_totals(lineups, [p.get("Fpts", 0) for p in players])
+        fieldFpts_p = slot_totals(lineups, [p.get("fieldFpts", 0) for p in players])
+        ceil_p = slot_totals(lineups, [p.get("Ceiling", 0) for p in players])
+        own_p = slot_totals(
+            lineups, [p.get("Ownership", 0) / 100 for p in players], np.multiply
+        )
+        own_s = slot_totals(lineups, [p.get("Ownership", 0) for p in players])
 
-        return unique
+        # the primary stack is the captain's team, the secondary the biggest other team,
+        # first listed on ties
+        team_codes = {}
+        teams = np.array(
+            [team_codes.setdefault(p["Team"], len(team_codes)) for p in players]
+        )
+        opps = np.array(
+            [team_codes.setdefault(p["Opp"], len(team_codes)) for p in players]
+        )
+        team_names = np.array(list(team_codes), dtype=object)
+        is_dst = np.array(["DST" in p["Position"] for p in players])[lineups]
+        is_cpt = np.array(["CPT" in p["rosterPosition"] for p in players])[lineups]
+        lineup_teams = teams[lineups]
+        team_counts = (lineup_teams[:, :, None] == lineup_teams[:, None, :]).sum(axis=2)
+        cpt_team = np.where(is_cpt, lineup_teams, -1).max(axis=1)
+        cpt_count = np.where(is_cpt, team_counts, 0).max(axis=1)
+        others = np.where(lineup_teams != cpt_team[:, None], team_counts, -1)
+        second = others.argmax(axis=1)
+        rows = np.arange(len(lineups))
+        second_team = lineup_teams[rows, second]
+        second_count = others[rows, second]
+        primary_stack = (
+            team_names[cpt_team] + " " + cpt_count.astype(str).astype(object)
+        )
+        secondary_stack = np.where(
+            second_count >= 0,
+            team_names[second_team] + " " + second_count.astype(str).astype(object),
+            "",
+        )
+        # players facing a defense listed before them in the lineup
+        earlier = np.tri(lineups.shape[1], k=-1, dtype=bool)
+        players_vs_def = (
+            ~is_dst[:, :, None]
+            & is_dst[:, None, :]
+            & earlier[None, :, :]
+            & (lineup_teams[:, :, None] == opps[lineups][:, None, :])
+        ).any(axis=2).sum(axis=1)
+
+        iterations = self.num_iterations
+        columns = [("Type", types, None)]
+        columns += [
+            (position, labels[lineups[:, slot]], None)
+            for slot, position in enumerate(self.roster_construction)
+        ]
+        columns += [
+            ("Salary", salary, None),
+            ("Fpts Proj", fpts_p, None),
+            ("Field Fpts Proj", fieldFpts_p, None),
+            ("Ceiling", ceil_p, None),
+            ("Primary Stack", primary_stack, None),
+            ("Secondary Stack", secondary_stack, None),
+            ("Players vs DST", players_vs_def, None),
+            ("Win %", np.round(self.field_wins / iterations * 100, 2), "{}%"),
+            ("Top 10%", np.round(self.field_top10 / iterations * 100, 2), "{}%"),
+            ("Cash %", np.round(self.field_cashes / iterations * 100, 2), "{}%"),
+            ("Proj. Own. Product", own_p, None),
+            ("Proj. Own. Sum", own_s, None),
+        ]
+        if self.use_contest_data:
+            roi_p = np.round(self.field_roi / self.entry_fee / iterations * 100, 2)
+            roi_round = np.round(self.field_roi / iterations, 2)
+            columns += [
+                ("ROI%" if self.site == "dk" else "ROI", roi_p, "{}%"),
+                ("ROI$" if self.site == "dk" else "ROI/Entry Fee", roi_round, "${}"),
+            ]
+        columns.append(("Num Dupes", counts, None))
+
+        # lineups uploaded twice are only reported once
+        keep = ~pd.DataFrame(lineups).assign(Type=types).duplicated().to_numpy()
+        return [
+            (title, np.asarray(values)[keep], fmt) for title, values, fmt in columns
+        ]
 
     def player_output(self):
-        # out_path = os.path.join(self.output_dir, f"{self.slate_id}_{self.sport}_{self.site}_player_output.csv")
-        # First output file
+        # exposure, wins, top 10 finishes and returns per player and roster position
+        players = list(self.player_by_key.values())
+        counts = np.array([data["count"] for data in self.field_lineups.values()])
+        order, (entries, wins, top10, roi) = player_totals(
+            self.field_matrix(),
+            [counts, self.field_wins, self.field_top10, self.field_roi],
+            len(players),
+        )
+        # every row also gets how often its player is in the field as CPT and as FLEX
+        player_codes = {}
+        same_player = np.array(
+            [
+                player_codes.setdefault((p["Name"], p["Team"]), len(player_codes))
+                for p in players
+            ]
+        )
+        is_cpt = np.array([p["rosterPosition"] == "CPT" for p in players])
+        cpt_entries = np.bincount(
+            same_player,
+            weights=np.where(is_cpt, entries, 0),
+            minlength=len(player_codes),
+        )
+        flex_entries = np.bincount(
+            same_player,
+            weights=np.where(is_cpt, 0, entries),
+            minlength=len(player_codes),
+        )
+
+        iterations = self.num_iterations
+        columns = [
+            ("Player", [players[i]["Name"].replace("#", "-") for i in order], None),
+            ("Roster Position", [players[i]["rosterPosition"] for i in order], None),
+            ("Position", [players[i]["Position"][0] for i in order], None),
+            ("Team", [players[i]["Team"] for i in order], None),
+            ("Win%", np.round(wins[order] / iterations * 100, 2), "{}%"),
+            ("Top10%", np.round(top10[order] / iterations / 10 * 100, 2), "{}%"),
+            ("Sim. Own%", np.round(entries[order] / self.field_size * 100, 2), "{}%"),
+            ("Proj. Own%", [players[i]["Ownership"] for i in order], "{}%"),
+            (
+                "Avg. Return",
+                np.round(roi[order] / entries[order] / iterations, 2),
+                "${}",
+            ),
+            (
+                "Sim. CPT Own%",
+                np.round(cpt_entries[same_player[order]] / self.field_size * 100, 2),
+                "{}%",
+            ),
+            (
+                "Sim. FLEX Own%",
+                np.round(flex_entries[same_player[order]] / self.field_size * 100, 2),
+                "{}%",
+            ),
+        ]
         out_path = os.path.join(
             os.path.dirname(__file__),
             "../output/{}_sd_sim_player_exposure_{}_{}.csv".format(
                 self.site, self.field_size, self.num_iterations
             ),
         )
-        with open(out_path, "w") as f:
-            f.write(
-                "Player,Roster Position,Position,Team,Win%,Top10%,Sim. Own%,Proj. Own%,Avg. Return\n"
-            )
-            unique_players = {}
-
-            for val in self.field_lineups.values():
-                lineup_data = val["Lineup"]
-                counts = val["count"]
-                for player_id in lineup_data["Lineup"]:
-                    if player_id not in unique_players:
-                        unique_players[player_id] = {
-                            "Wins": lineup_data["Wins"],
-                            "Top10": lineup_data["Top10"],
-                            "In": val["count"],
-                            "ROI": lineup_data["ROI"],
-                        }
-                    else:
-                        unique_players[player_id]["Wins"] += lineup_data["Wins"]
-                        unique_players[player_id]["Top10"] += lineup_data["Top10"]
-                        unique_players[player_id]["In"] += val["count"]
-                        unique_players[player_id]["ROI"] += lineup_data["ROI"]
-
-            for player_id, data in unique_players.items():
-                field_p = round(data["In"] / self.field_size * 100, 2)
-                win_p = round(data["Wins"] / self.num_iterations * 100, 2)
-                top10_p = round(data["Top10"] / self.num_iterations / 10 * 100, 2)
-                roi_p = round(data["ROI"] / data["In"] / self.num_iterations, 2)
-                for k, v in self.player_dict.items():
-                    if v["UniqueKey"] == player_id:
-                        player_info = v
-                        break
-                proj_own = player_info.get("Ownership", "N/A")
-                p_name = player_info.get("Name", "N/A").replace("#", "-")
-                sd_position = player_info.get("rosterPosition", ["N/A"])
-                position = player_info.get("Position", ["N/A"])[0]
-                team = player_info.get("Team", "N/A")
-
-                f.write(
-                    f"{p_name},{sd_position},{position},{team},{win_p}%,{top10_p}%,{field_p}%,{proj_own}%,${roi_p}\n"
-                )
+        write_results(out_path, columns, self.output_format)
 
     def save_results(self):
-        unique = self.output()
+        columns = self.output()
 
         # First output file
         # include timetsamp in filename, formatted as readable
@@ -1630,30 +1516,5 @@ class NFL_Showdown_Simulator:
                 self.site, self.field_size, self.num_iterations, now
             ),
         )
-        if self.site == "dk":
-            if self.use_contest_data:
-                with open(out_path, "w") as f:
-                    header = "Type,CPT,FLEX,FLEX,FLEX,FLEX,FLEX,Salary,Fpts Proj,Field Fpts Proj,Ceiling,Primary Stack,Secondary Stack,Players vs DST,Win %,Top 10%,Cash %,Proj. Own. Product,Proj. Own. Sum,ROI%,ROI$,Num Dupes\n"
-                    f.write(header)
-                    for lineup_str, fpts in unique.items():
-                        f.write(f"{lineup_str}\n")
-            else:
-                with open(out_path, "w") as f:
-                    header = "Type,CPT,FLEX,FLEX,FLEX,FLEX,FLEX,Salary,Fpts Proj,Field Fpts Proj,Ceiling,Primary Stack,Secondary Stack,Players vs DST,Win %,Top 10%,Cash %,Proj. Own. Product,Proj. Own. Sum,Num Dupes\n"
-                    f.write(header)
-                    for lineup_str, fpts in unique.items():
-                        f.write(f"{lineup_str}\n")
-        else:
-            if self.use_contest_data:
-                with open(out_path, "w") as f:
-                    header = "Type,CPT,FLEX,FLEX,FLEX,FLEX,Salary,Fpts Proj,Field Fpts Proj,Ceiling,Primary Stack,Secondary Stack,Players vs DST,Win %,Top 10%,Cash %,Proj. Own. Product,Proj. Own. Sum,ROI,ROI/Entry Fee,Num Dupes\n"
-                    f.write(header)
-                    for lineup_str, fpts in unique.items():
-                        f.write(f"{lineup_str}\n")
-            else:
-                with open(out_path, "w") as f:
-                    header = "Type,CPT,FLEX,FLEX,FLEX,FLEX,Salary,Fpts Proj,Field Fpts Proj,Ceiling,Primary Stack,Secondary Stack,Players vs DST,Win %,Top 10%,Cash %,Proj. Own. Product,Proj. Own. Sum,Num Dupes\n"
-                    f.write(header)
-                    for lineup_str, fpts in unique.items():
-                        f.write(f"{lineup_str}\n")
+        write_results(out_path, columns, self.output_format)
         self.player_output()
@@ -0,0 +1,446 @@
+import csv
+import hashlib
+import itertools
+import json
+import os
+import numpy as np
+import pandas as pd
+from numba import njit, prange, get_num_threads
+from scipy import sparse
+
+
+# numeric helpers shared by the classic and showdown tournament simulators
+
+# the most recently used covariance factors kept in a site's covariance_cache
+COVARIANCE_CACHE_FILES = 256
+
+# the classic simulator's player "Correlations" by position, "Opp " keys are for the
+# other team. the optimizers' correlated randomness draws from the same tables
+POSITION_CORRELATIONS = {
+    "QB": {
+        "QB": 1,
+        "RB": 0.08,
+        "WR": 0.62,
+        "TE": 0.32,
+        "DST": -0.09,
+        "Opp QB": 0.24,
+        "Opp RB": 0.04,
+        "Opp WR": 0.19,
+        "Opp TE": 0.1,
+        "Opp DST": -0.41,
+    },
+    "RB": {
+        "QB": 0.08,
+        "RB": 1,
+        "WR": -0.09,
+        "TE": -0.02,
+        "DST": 0.07,
+        "Opp QB": 0.04,
+        "Opp RB": -0.08,
+        "Opp WR": 0.01,
+        "Opp TE": 0.03,
+        "Opp DST": -0.33,
+    },
+    "WR": {
+        "QB": 0.62,
+        "RB": -0.09,
+        "WR": 1,
+        "TE": -0.07,
+        "DST": -0.08,
+        "Opp QB": 0.19,
+        "Opp RB": 0.01,
+        "Opp WR": 0.16,
+        "Opp TE": 0.08,
+        "Opp DST": -0.22,
+    },
+    "TE": {
+        "QB": 0.32,
+        "RB": -0.02,
+        "WR": -0.07,
+        "TE": 1,
+        "DST": -0.08,
+        "Opp QB": 0.1,
+        "Opp RB": 0.03,
+        "Opp WR": 0.08,
+        "Opp TE": 0,
+        "Opp DST": -0.14,
+    },
+    "DST": {
+        "QB": -0.09,
+        "RB": 0.07,
+        "WR": -0.08,
+        "TE": -0.08,
+        "DST": 1,
+        "Opp QB": -0.41,
+        "Opp RB": -0.33,
+        "Opp WR": -0.22,
+        "Opp TE": -0.14,
+        "Opp DST": -0.27,
+    },
+}
+# what the classic simulator gives teammates at the same position
+SAME_POSITION_CORRELATIONS = {
+    "QB": -0.5,
+    "RB": -0.2,
+    "WR": 0.1,
+    "TE": -0.2,
+    "K": -0.5,
+    "DST": -0.5,
+}
+
+
+def compile_payout_table(path):
+    # contest_structure.csv as a cumulative payout array, cumsum[p] is the total paid
+    # to places 1..p, the (first place, last place, payout) brackets it was built from
+    # and the contest's field size and entry fee
+    field_size = None
+    entry_fee = None
+    brackets = []
+    with open(path, encoding="utf-8-sig") as file:
+        # make column lookups case insensitive
+        reader = csv.DictReader(itertools.chain([next(file).lower()], file))
+        for row in reader:
+            if field_size is None:
+                field_size = int(row["field size"])
+            if entry_fee is None:
+                entry_fee = float(row["entry fee"])
+            # "1" or "5-10", places are 1 indexed and capped at the field size
+            places = row["place"].split("-")
+            first, last = int(places[0]), min(int(places[-1]), field_size)
+            if first <= last:
+                payout = float(row["payout"].split(".")[0].replace(",", ""))
+                brackets.append((first, last, payout))
+    brackets = np.array(brackets, dtype=np.float64).reshape(-1, 3)
+    payouts = np.zeros(int(brackets[:, 1].max()) if len(brackets) else 0)
+    for first, last, payout in brackets:
+        payouts[int(first) - 1 : int(last)] = payout
+    payout_cumsum = np.concatenate(([0.0], np.cumsum(payouts)))
+    contest = {"field_size": field_size, "entry_fee": entry_fee}
+    return payout_cumsum, brackets, contest
+
+
+def load_payout_table(path, cache_dir):
+    # the compiled table is cached under the hash of the contest file and memory mapped,
+    # so large contests are only parsed once and sims of the same contest share it.
+    # returns the payout cumsum, the brackets and the contest's field size and entry fee
+    with open(path, "rb") as file:
+        key = hashlib.sha1(file.read()).hexdigest()
+    table_path = os.path.join(cache_dir, key + ".npy")
+    brackets_path = os.path.join(cache_dir, key + ".brackets.npy")
+    contest_path = os.path.join(cache_dir, key + ".json")
+    if not os.path.exists(contest_path):
+        payout_cumsum, brackets, contest = compile_payout_table(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        # the arrays go first, a contest file means the arrays next to it are complete
+        for final_path, array in [(table_path, payout_cumsum), (brackets_path, brackets)]:
+            temp_path = "{}.{}.tmp".format(final_path, os.getpid())
+            with open(temp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(temp_path, final_path)
+        temp_path = "{}.{}.tmp".format(contest_path, os.getpid())
+        with open(temp_path, "w") as f:
+            json.dump(contest, f)
+        os.replace(temp_path, contest_path)
+    with open(contest_path) as f:
+        contest = json.load(f)
+    return (
+        np.load(table_path, mmap_mode="r"),
+        np.load(brackets_path, mmap_mode="r"),
+        contest,
+    )
+
+
+def covariance_cache_key(tag, players, position_correlations):
+    # hash of everything a game's covariance matrix is built from, so ownership or
+    # salary changes reuse the cached matrix but projection or correlation edits don't.
+    # position_correlations is the teammate table passed to build_correlation_matrix
+    payload = [tag, position_correlations] + [
+        [
+            player["Name"],
+            player["Team"],
+            player["Position"],
+            player["Fpts"],
+            player["StdDev"],
+            player.get("Correlations", {}),
+            player.get("Player Correlations", {}),
+        ]
+        for player in players
+    ]
+    return hashlib.sha1(
+        json.dumps(payload, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def build_correlation_matrix(players, position_correlations, same_team_by_position=True):
+    # players are encoded as (team, position) codes. each player's "Correlations" become a
+    # (players, positions, same/opp team) table that is indexed for every pair at once
+    num_players = len(players)
+    primary_positions = [str(player["Position"][0]) for player in players]
+    positions = sorted(set(primary_positions))
+    position_codes = {pos: k for k, pos in enumerate(positions)}
+    team_codes = {}
+    teams = np.array([team_codes.setdefault(p["Team"], len(team_codes)) for p in players])
+    pos = np.array([position_codes[p] for p in primary_positions])
+
+    table = np.zeros((num_players, len(positions), 2))
+    for i, player in enumerate(players):
+        for key, value in player.get("Correlations", {}).items():
+            opp = key.startswith("Opp ")
+            key = key[4:] if opp else key
+            if key in position_codes:
+                table[i, position_codes[key], int(opp)] = value
+    same_team = teams[:, None] == teams[None, :]
+    corr = table[np.arange(num_players)[:, None], pos[None, :], (~same_team).astype(int)]
+
+    # teammates get a fixed value for the first player's position, only when both play
+    # the same position unless same_team_by_position is False
+    fixed = np.array([position_correlations.get(p, np.nan) for p in positions])[pos]
+    override = same_team & ~np.isnan(fixed)[:, None]
+    if same_team_by_position:
+        override &= pos[:, None] == pos[None, :]
+    corr = np.where(override, fixed[:, None], corr)
+
+    # player to player correlations are sparse edits on top
+    name_index = {}
+    for j, player in enumerate(players):
+        name_index.setdefault(player["Name"], []).append(j)
+    for i, player in enumerate(players):
+        for name, value in player.get("Player Correlations", {}).items():
+            corr[i, name_index.get(name, [])] = value
+    np.fill_diagonal(corr, 1)
+    return corr
+
+
+def eigen_factor(covariance_matrix):
+    # negative eigenvalues set to zero, returns the cleaned matrix and a factor with
+    # factor @ factor.T == cleaned matrix
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance_matrix)
+    eigenvalues[eigenvalues < 0] = 0
+    factor = eigenvectors * np.sqrt(eigenvalues)
+    return factor @ factor.T, factor
+
+
+def covariance_factor(covariance_matrix):
+    # cholesky when the matrix is positive definite, the clipped eigen factor otherwise
+    try:
+        return covariance_matrix, np.linalg.cholesky(covariance_matrix)
+    except np.linalg.LinAlgError:
+        return eigen_factor(covariance_matrix)
+
+
+def load_covariance_factor(cache_dir, key, build):
+    # build() returns (covariance, factor), it only runs when the key isn't on disk yet
+    path = os.path.join(cache_dir, key + ".npz")
+    if os.path.exists(path):
+        try:
+            with np.load(path) as cached:
+                covariance, factor = cached["covariance"], cached["factor"]
+            # the modification time marks when a factor was last used for pruning
+            os.utime(path)
+            return covariance, factor
+        except (OSError, ValueError, KeyError):
+            print("rebuilding unreadable covariance cache file", path)
+    covariance, factor = build()
+    os.makedirs(cache_dir, exist_ok=True)
+    # written under a temporary name first, worker processes may share the cache
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_path, "wb") as f:
+        np.savez(f, covariance=covariance, factor=factor)
+    os.replace(temp_path, path)
+    return covariance, factor
+
+
+def prune_covariance_cache(cache_dir, max_files=COVARIANCE_CACHE_FILES):
+    # every projection edit adds a file for each game it touches, only the max_files
+    # most recently used ones are kept
+    try:
+        entries = [e for e in os.scandir(cache_dir) if e.name.endswith(".npz")]
+    except FileNotFoundError:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    for entry in entries[max_files:]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def sample_from_factor(rng, mean, factor, num_iterations, out=None):
+    # multivariate normal draws as a float32 (players, iterations) matrix, written into
+    # out when given. the normals are drawn one iteration at a time in generator order,
+    # so drawing in blocks continues the same stream
+    if out is None:
+        out = np.empty((len(mean), num_iterations), dtype=np.float32)
+    standard_normals = rng.standard_normal((num_iterations, len(mean)), dtype=np.float32)
+    np.matmul(factor.astype(np.float32), standard_normals.T, out=out)
+    out += np.asarray(mean, dtype=np.float32)[:, None]
+    return out
+
+
+def lineup_incidence_matrix(lineups, num_players):
+    # (lineups, players) sparse matrix with a 1 for every rostered player
+    num_lineups, num_slots = lineups.shape
+    return sparse.csr_matrix(
+        (
+            np.ones(num_lineups * num_slots),
+            (np.repeat(np.arange(num_lineups), num_slots), lineups.ravel()),
+        ),
+        shape=(num_lineups, num_players),
+    )
+
+
+def iteration_block_size(
+    num_lineups, num_players, num_iterations, memory_budget_mb, score_dtype=np.float32
+):
+    # iterations per block so one block of scores, rankings and player samples stays
+    # inside the budget, a budget of 0 runs every iteration in a single block
+    if memory_budget_mb <= 0:
+        return max(1, num_iterations)
+    # the scores plus a float32 ranking copy and a full sort index per lineup
+    bytes_per_iteration = (np.dtype(score_dtype).itemsize + 12) * num_lineups
+    bytes_per_iteration += 8 * num_players
+    block_size = memory_budget_mb * 2**20 // bytes_per_iteration
+    return int(max(1, min(num_iterations, block_size)))
+
+
+def score_lineups(lineups, player_samples, dtype=np.float64, block_bytes=2**28):
+    # lineups are rows of player indices, player_samples is (players, iterations)
+    # scores are built a block of iterations at a time in float64 to bound the
+    # temporaries, then stored in dtype
+    num_players, num_iterations = player_samples.shape
+    incidence = lineup_incidence_matrix(lineups, num_players)
+    block_size = max(1, min(num_iterations, block_bytes // (8 * max(1, len(lineups)))))
+    scores = np.empty((len(lineups), num_iterations), dtype=dtype)
+    for start in range(0, num_iterations, block_size):
+        stop = min(start + block_size, num_iterations)
+        scores[:, start:stop] = incidence @ player_samples[:, start:stop]
+    return scores
+
+
+@njit(parallel=True, cache=True)
+def accumulate_results(scores, num_ranks, counts, payout_cumsum, num_top, num_chunks):
+    # iterations are split into num_chunks runs that each add up their own row of
+    # results, the rows are summed at the end so prange needs no atomics
+    num_lineups, num_iterations = scores.shape
+    num_paid = len(payout_cumsum) - 1
+    max_place = max(num_paid, num_top)
+    k = max(1, min(num_ranks, num_lineups))
+    prizes = np.zeros((num_chunks, num_lineups))
+    wins = np.zeros((num_chunks, num_lineups), dtype=np.int64)
+    tops = np.zeros((num_chunks, num_lineups), dtype=np.int64)
+    cashes = np.zeros((num_chunks, num_lineups), dtype=np.int64)
+    chunk_size = (num_iterations + num_chunks - 1) // num_chunks
+    for c in prange(num_chunks):
+        for j in range(c * chunk_size, min((c + 1) * chunk_size, num_iterations)):
+            # the k best lineups plus anything tied with the k-th, best first
+            column = scores[:, j].copy()
+            threshold = np.partition(column, num_lineups - k)[num_lineups - k]
+            selected = np.nonzero(column >= threshold)[0]
+            order = selected[np.argsort(-column[selected], kind="mergesort")]
+            # walk the groups of equal scores, every entry of a group (duplicates included)
+            # gets an equal share of the prizes for the places the group covers
+            place = 0
+            g = 0
+            while g < len(order) and place < max_place:
+                h = g
+                entries = 0
+                while h < len(order) and column[order[h]] == column[order[g]]:
+                    entries += counts[order[h]]
+                    h += 1
+                first = min(place, num_paid)
+                last = min(place + entries, num_paid)
+                prize = (payout_cumsum[last] - payout_cumsum[first]) / entries
+                for t in range(g, h):
+                    lineup = order[t]
+                    prizes[c, lineup] += prize
+                    if place == 0:
+                        wins[c, lineup] += 1
+                    if place < num_top:
+                        tops[c, lineup] += 1
+                    if place < num_paid:
+                        cashes[c, lineup] += 1
+                place += entries
+                g = h
+    return prizes.sum(axis=0), wins.sum(axis=0), tops.sum(axis=0), cashes.sum(axis=0)
+
+
+def tournament_results(scores, counts, payout_cumsum, num_top, mode="partial"):
+    # scores is a (lineups, iterations) block, counts the entries of each lineup and
+    # payout_cumsum the table from load_payout_table. returns the prize per entry summed
+    # over the iterations, and how often each lineup won, finished in the top num_top
+    # places and cashed. a lineup's place is the first place of its group of equal scores.
+    # "partial" only orders enough lineups to fill the paying and top places, "full"
+    # orders the whole field, both give the same results
+    num_ranks = len(scores) if mode == "full" else max(len(payout_cumsum) - 1, num_top)
+    if scores.dtype == np.float16:
+        # numba has no float16, float32 holds every float16 value exactly
+        scores = scores.astype(np.float32)
+    num_chunks = max(1, min(scores.shape[1], get_num_threads()))
+    return accumulate_results(
+        scores,
+        num_ranks,
+        np.asarray(counts, dtype=np.int64),
+        np.asarray(payout_cumsum, dtype=np.float64),
+        num_top,
+        num_chunks,
+    )
+
+
+def slot_totals(lineups, values, ufunc=np.add):
+    # a per player value combined over the slots of every lineup with ufunc, one slot at
+    # a time in lineup order, so totals match adding up a lineup's players in a loop
+    gathered = np.asarray(values)[np.asarray(lineups)]
+    total = gathered[:, 0].copy()
+    for slot in range(1, gathered.shape[1]):
+        ufunc(total, gathered[:, slot], out=total)
+    return total
+
+
+def player_totals(lineups, lineup_values, num_players):
+    # per player sums of per lineup values, a lineup adds its value once for every slot
+    # a player fills. bincount adds them in lineup order like a loop over the lineups
+    # would. also returns the players in the field ordered by first appearance
+    flat = np.asarray(lineups).ravel()
+    num_slots = np.asarray(lineups).shape[1]
+    players, first = np.unique(flat, return_index=True)
+    totals = [
+        np.bincount(
+            flat, weights=np.repeat(values, num_slots), minlength=num_players
+        )
+        for values in lineup_values
+    ]
+    return players[np.argsort(first)], totals
+
+
+def write_results(path, columns, output_format="csv"):
+    # columns is a list of (title, values, csv format) with one value per lineup. the
+    # csv is written in one pass, titles may repeat and a format like "${}" or "{}%"
+    # decorates the values. "parquet" and "feather" also write the raw values next to
+    # the csv under unique titles, for tools that want typed columns (needs pyarrow)
+    table = {}
+    for k, (title, values, fmt) in enumerate(columns):
+        column = pd.Series(values)
+        if fmt is not None:
+            prefix, suffix = fmt.split("{}")
+            column = prefix + column.astype(str) + suffix
+        table[k] = column
+    frame = pd.DataFrame(table)
+    frame.columns = [title for title, _, _ in columns]
+    frame.to_csv(path, index=False, lineterminator="\n")
+    if output_format in ("parquet", "feather"):
+        titles = {}
+        typed = {}
+        for title, values, _ in columns:
+            title = title.strip()
+            seen = titles.get(title, 0)
+            titles[title] = seen + 1
+            typed[title if seen == 0 else "{}.{}".format(title, seen)] = values
+        typed_path = os.path.splitext(path)[0] + "." + output_format
+        try:
+            getattr(pd.DataFrame(typed), "to_" + output_format)(typed_path)
+        except ImportError:
+            print(
+                "writing {} output needs pyarrow, only the csv was written".format(
+                    output_format
+                )
+            )